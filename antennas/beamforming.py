@@ -1,8 +1,14 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+# precomputed (beam, phi, theta) gain tables, shared by all the antennas with the same element and beam configuration
+# the key is (id(ant_element), n_rows, n_columns, dh, dv, w_vec bytes) and the value is (ant_element, table) - the
+# element is kept in the value so its id can not be reused by another object while the table is cached
+_gain_table_cache = {}
+
 class Beamforming_Antenna():
-    def __init__(self, ant_element, frequency, n_rows, n_columns, horizontal_spacing, vertical_spacing, point_theta=None, point_phi=None):
+    def __init__(self, ant_element, frequency, n_rows, n_columns, horizontal_spacing, vertical_spacing, point_theta=None,
+                 point_phi=None, gain_table=False):
         self.ant_element = ant_element
         self.frequency = frequency  # not used
         self.n_rows = n_rows
@@ -21,6 +27,9 @@ class Beamforming_Antenna():
         self.v_vec = None
         self.w_vec = None
 
+        self.use_gain_table = gain_table  # if True, the beam gains are precomputed in a (beam, phi, theta) table
+        self.gain_table = None
+
         if point_theta is not None and point_phi is not None:
             self.beams = len(point_theta)
             self.w_vec = np.ndarray(shape=(np.array(point_theta).shape[0], self.n_rows, self.n_columns), dtype=complex)
@@ -38,6 +47,58 @@ class Beamforming_Antenna():
         for beam, [phi_tilt, theta_tilt] in enumerate(zip(point_phi, point_theta)):  # precalculating the weight vector
             self.w_vec[beam] = self._weight_vector(phi_tilt, theta_tilt)
 
+        self.gain_table = None  # the old table does not correspond to the new beams
+        if self.use_gain_table:
+            self.generate_gain_table()
+
+    def generate_gain_table(self):
+        # this function calculates the gain of all beams for the 1 degree phi x theta grid of the antenna element
+        # it gives the same values of calculate_gain, but all the superposition vectors are calculated at once
+        key = (id(self.ant_element), self.n_rows, self.n_columns, self.dh, self.dv, self.w_vec.tobytes())
+        if key in _gain_table_cache:
+            self.gain_table = _gain_table_cache[key][1]
+            return self.gain_table
+
+        rows = np.arange(self.n_rows)
+        columns = np.arange(self.n_columns)
+        theta = np.deg2rad(self.theta + 90)
+        phi = np.deg2rad(self.phi)
+
+        # the superposition vector is separable in a row (theta) and a column (phi, theta) term
+        v_rows = np.exp(1j * 2 * np.pi * rows * self.dv * np.cos(theta)[:, np.newaxis])  # theta x rows
+        v_columns = np.exp(1j * 2 * np.pi * columns * self.dh *
+                           (np.sin(phi)[:, np.newaxis, np.newaxis] * np.sin(theta)[:, np.newaxis]))  # phi x theta x columns
+
+        w_rows = np.einsum('brc,tr->btc', self.w_vec, v_rows)  # summing the rows first - beam x theta x columns
+        array_factor = np.einsum('btc,ptc->bpt', w_rows, v_columns)  # beam x phi x theta
+
+        with np.errstate(divide='ignore'):  # the exact nulls of the array factor go to -inf
+            self.gain_table = self.ant_element.gain_pattern[np.newaxis, :, :] + 10*np.log10(np.abs(array_factor)**2)
+        _gain_table_cache[key] = (self.ant_element, self.gain_table)
+
+        return self.gain_table
+
+    def table_gain(self, phi, theta, beams=None):
+        # vectorized version of calculate_gain using the precomputed table (phi and theta are integer arrays)
+        # returns a beams x samples matrix - the modulo is the same wrap-around of the negative indexes
+        if self.gain_table is None:
+            self.generate_gain_table()
+        if beams is None:
+            return self.gain_table[:, np.mod(phi, self.phi.shape[0]), np.mod(theta, self.theta.shape[0])]
+        return self.gain_table[beams, np.mod(phi, self.phi.shape[0]), np.mod(theta, self.theta.shape[0])]
+
+    def __deepcopy__(self, memo):
+        # the antenna element and the gain table are read only and can be huge, so the copies of the antenna share
+        # them by reference (only the beam configuration is copied)
+        import copy
+        memo[id(self.ant_element)] = self.ant_element
+        if self.gain_table is not None:
+            memo[id(self.gain_table)] = self.gain_table
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        for key, value in self.__dict__.items():
+            setattr(new, key, copy.deepcopy(value, memo))
+        return new
 
     def _superposition_vector(self, phi, theta):
         rows = np.arange(self.n_rows) + 1
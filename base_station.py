@@ -10,6 +10,11 @@ from numba import jit  # some functions uses numba to improve performance (some
 # and the space and users around it
 
 class BaseStation:
+    # antenna and sector pattern attributes that are not changed after the beam configuration, so all the copies of a
+    # base station share them by reference (only the scheduler and active beam state are unique for each copy)
+    shared_attributes = ('antenna', 'beam_sector_pattern', 'beams_pointing', 'sectors_phi_range', 'sectors_pointing',
+                         'sectors_hor_pattern', 'sectors_ver_pattern', 'downtilts')
+
     def __init__(self, frequency, tx_power, tx_height, bw, n_sectors, antenna, gain, downtilts, plot=False):  # simple function, but will include sectors and MIMO in the future
         self.frequency = frequency
         self.tx_power = tx_power  # tx power in dBW
@@ -47,6 +52,16 @@ class BaseStation:
             else:
                 self.beams = None
 
+    def __deepcopy__(self, memo):
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        for key, value in self.__dict__.items():
+            if key in self.shared_attributes:
+                setattr(new, key, value)
+            else:
+                setattr(new, key, copy.deepcopy(value, memo))
+        return new
+
     def initialize_mux(self, simulation_time=None, up_tdd_time=None):
         self.tdd_mux.create_tdd_scheduler(simulation_time=simulation_time, up_tdd_time=up_tdd_time)
 
@@ -62,7 +77,9 @@ class BaseStation:
                                                  simulation_time=downlink_specs['simulation_time'],
                                                  t_min=downlink_specs['t_min'],
                                                  bw_slot=downlink_specs['bw_slot'],c_target=downlink_specs['criteria'],
-                                                 tx_power=downlink_specs['tx_power'])
+                                                 tx_power=downlink_specs['tx_power'],
+                                                 pf_time_constant=downlink_specs['pf_time_constant'],
+                                                 rng=downlink_specs['rng'])
             if self.tdd_mux.up_tdd_time != 0:
                 if uplink_specs is not None:
                     self.tdd_mux.create_uplink(scheduler_typ=uplink_specs['scheduler_typ'],
@@ -71,7 +88,9 @@ class BaseStation:
                                                simulation_time=uplink_specs['simulation_time'],
                                                t_min=uplink_specs['t_min'],
                                                bw_slot=uplink_specs['bw_slot'], c_target=uplink_specs['criteria'],
-                                               tx_power=uplink_specs['tx_power'])
+                                               tx_power=uplink_specs['tx_power'],
+                                               pf_time_constant=uplink_specs['pf_time_constant'],
+                                               rng=uplink_specs['rng'])
         else:
             raise ValueError('downlink or uplink configurations are not found, please verify the parameter file')
 
@@ -84,6 +103,7 @@ class BaseStation:
         self.sectors_pointing = np.arange(360 / (2*self.n_sectors), 360, 360 / self.n_sectors)
         lower_bound = 0
 
+        self.beam_sector_pattern = []  # a new list, the copies of this base station keep the previous configuration
         for sector, higher_bound in enumerate(self.sectors_phi_range):
             range_sector = np.where((az_map > lower_bound) & (az_map <= higher_bound))
             self.antenna.change_beam_configuration(point_phi=np.rint(az_map[range_sector]-self.sectors_pointing[sector])
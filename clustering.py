@@ -40,11 +40,12 @@ class Cluster:
         self.scaler = StandardScaler()
         self.scaled_features = self.scaler.fit_transform(self.features)
 
-    def k_means(self, grid, n_clusters, plot=False):
+    def k_means(self, grid, n_clusters, plot=False, rng=None):
         self.centroids, self.labels = None, None
         if self.scaled_features is None:
             self.scaling(grid)
-        kmeans = KMeans(init="random", n_clusters=n_clusters, n_init=10, max_iter=300)
+        random_state = None if rng is None else int(rng.integers(2**31 - 1))  # rng: numpy Generator (see util.seeds)
+        kmeans = KMeans(init="random", n_clusters=n_clusters, n_init=10, max_iter=300, random_state=random_state)
         kmeans.fit(self.scaled_features)
         self.cluster_method = 'k_means'
         self.centroids = self.scaler.inverse_transform(kmeans.cluster_centers_)
@@ -87,7 +88,7 @@ class Cluster:
         if plot:
             self.plot()
 
-    def random(self, grid, n_clusters, plot=False):  # not clustering!!! - todo make this piece of shit runs with a rectangular shape
+    def random(self, grid, n_clusters, plot=False, rng=None):  # not clustering!!! - todo make this piece of shit runs with a rectangular shape
         # self.features = np.where(grid != 0)
         self.scaling(grid=grid)
         x_size = grid.shape[0]
@@ -95,7 +96,9 @@ class Cluster:
         self.centroids = np.ndarray(shape=(n_clusters, 2))
         xy_min=[0,0]
         xy_max = [x_size, y_size]
-        self.centroids = np.random.default_rng().integers(low=xy_min, high=xy_max, size=(n_clusters, 2))
+        if rng is None:  # numpy Generator of the draws (see util.seeds)
+            rng = np.random.default_rng()
+        self.centroids = rng.integers(low=xy_min, high=xy_max, size=(n_clusters, 2))
         # for i in range(n_clusters):
             # self.centroids[i] = [np.random.randint(0, x_size), np.random.randint(0, y_size)]
             # self.centroids[i] = np.random.uniform(0, x_size-1, 2)
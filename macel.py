@@ -2,7 +2,8 @@ import numpy as np
 import pandas as pd
 import copy
 from models.propagation.prop_models import generate_path_loss_map, generate_elevation_map, generate_azimuth_map, generate_gain_map, \
-    generate_rx_power_map, generate_snr_map, generate_capcity_map, generate_euclidian_distance, generate_bf_gain
+    generate_rx_power_map, generate_snr_map, generate_capcity_map, generate_euclidian_distance, generate_bf_gain, \
+    generate_bf_gain_tensor
 from models.scheduler.master_scheduler import Master_scheduler
 from user_eq import User_eq
 from random import gauss
@@ -10,12 +11,17 @@ from clustering import Cluster
 from util.metrics import Metrics
 import matplotlib.pyplot as plt
 from demos_and_examples.kmeans_from_scratch import K_Means_XP
+from util.seeds import subsystem_rng
 
 
 class Macel:
+    # channel tensors of a BS layout and UE drop, they are only read after generate_channel (or set_channel)
+    channel_attributes = ('ch_gain_map', 'sector_map', 'dwn_ch_gain_lin', 'up_ch_gain_lin', 'dist_map')
+
     def __init__(self, grid, prop_model, cell_size, base_station, simulation_time, time_slot, bs_allocation_typ,
                  t_min=None, bw_slot=None, criteria=None, scheduler_typ=None, log=False, downlink_specs=None,
-                 uplink_specs=None, output_type="complete", tdd_up_time=0):
+                 uplink_specs=None, output_type="complete", tdd_up_time=0, event_driven=False, block_slots=1,
+                 interferer_margin=None):
 
         self.grid = grid  # grid object - size, points, etc
         self.n_centers = None
@@ -34,11 +40,15 @@ class Macel:
         self.uplink_specs = uplink_specs
         self.tdd_up_time = tdd_up_time
         self.bs_allocation_typ = bs_allocation_typ
+        self.event_driven = event_driven  # if True, the SNIR/capacity of a time slot is reused while the scheduling state is the same
+        self.block_slots = block_slots  # downlink time slots with their SNIR/capacity calculated at once (without criteria)
+        self.interferer_margin = interferer_margin  # dB - margin of the downlink interferer lists (None: all BSs interfere)
 
         self.t_min = t_min  # minimum per beam allocated time if schdl opt is used (prop smp or prop cmp)
         self.bw_slot = bw_slot # slot fixed bandwidth for scheduller with a queue (RR)
 
         self.ue = None  # the user equipment object - position and technical characteristics
+        self.seed_seq = None  # SeedSequence of the simulation iteration (random streams of util.seeds)
 
         self.base_station_list = []
 
@@ -49,6 +59,11 @@ class Macel:
         self.gain_map = None
         self.dist_map =  None
         self.ch_gain_map = None
+        self.dwn_ch_gain_lin = None  # float32 linear copy of ch_gain_map scaled by the BSs tx power (watt)
+        self.up_ch_gain_lin = None  # float32 linear copy of ch_gain_map scaled by the UE tx power (watt)
+        self.dwn_interferer_offsets = None  # CSR lists of the BSs that interfere in each UE (downlink)
+        self.dwn_interferer_bs = None
+        self.dwn_interferer_ue = None
         self.sector_map = None
         self.path_loss_map = None
         self.rx_pw_map = None
@@ -59,12 +74,17 @@ class Macel:
         # self.dwn_rel_t_index = None # todo VER SE VAI USAR ISSO AQUI !!!!
         self.dwn_elapsed_time = None
         self.up_elapsed_time = None
+        self.dwn_slot_state = None  # scheduling state and SNIR/capacity of the last evaluated time slot (event-driven)
+        self.up_slot_state = None
     def set_map(self, map):
         self.map = map
 
     def del_map(self):
         del self.map
 
+    def set_seed(self, seed_seq):
+        self.seed_seq = seed_seq
+
     def set_base_station(self, base_station):  # simple function, but will include sectors and MIMO in the future
         self.default_base_station = base_station
 
@@ -87,16 +107,20 @@ class Macel:
             bs.initialize_dwn_up_scheduler(downlink_specs={**self.downlink_specs, **{'bs_index': bs_index,
                                                            'simulation_time': self.simulation_time,
                                                            'tx_power': bs.tx_power, 'bw': bs.bw,
-                                                           'time_slot': self.time_slot}},
+                                                           'time_slot': self.time_slot,
+                                                           'rng': subsystem_rng(self.seed_seq, 'scheduler',
+                                                                                bs_index, 0)}},
                                            uplink_specs={**self.uplink_specs, **{'bs_index': bs_index,
                                                          'simulation_time': self.simulation_time,
                                                          'tx_power': self.ue.tx_power, 'bw': bs.bw,
-                                                         'time_slot': self.time_slot}})
+                                                         'time_slot': self.time_slot,
+                                                         'rng': subsystem_rng(self.seed_seq, 'scheduler',
+                                                                              bs_index, 1)}})
             # bs.initialize_scheduler(scheduler_typ=scheduler_typ, time_slot=self.time_slot, t_min=self.t_min,
             #                         simulation_time=self.simulation_time, bs_index=bs_index, c_target=self.criteria,
             #                         bw_slot=self.bw_slot)
 
-    def set_ue(self, hrx=None, tx_power=None):
+    def set_ue(self, hrx=None, tx_power=None, n_candidates=None):
         # if self.ue is not None:
         #     self.ue.positions = self.grid.grid
         # else:
@@ -109,42 +133,75 @@ class Macel:
             self.ue.height = hrx
         if tx_power is not None:
             self.ue.tx_power = tx_power
+        if n_candidates is not None:
+            self.ue.n_candidates = n_candidates
 
 
     def generate_bf_gain_maps(self, az_map, elev_map, dist_map):
-        # ue = np.empty(shape=(self.n_centers, elev_map.shape[1], 100))  # ARRUMAR DEPOIS ESSA GAMBIARRA
-        # ue[:] = np.nan
-        ue = np.empty(shape=(self.n_centers, elev_map.shape[1], self.base_station_list[0].antenna.beams))
-        self.ch_gain_map = np.zeros(shape=(self.n_centers, elev_map.shape[1], self.base_station_list[0].antenna.beams + 1)) - 10000
-        self.sector_map = np.ndarray(shape=(self.n_centers, elev_map.shape[1]))
+        # the channel gain map is a bs x ue x beams+1 tensor (the last beam is a dummy one with -10000 dB)
+        n_beams = self.base_station_list[0].antenna.beams
+        self.ch_gain_map = np.zeros(shape=(self.n_centers, elev_map.shape[1], n_beams + 1)) - 10000
 
         # path loss attenuation to sum with the beam gain
         att_map = generate_path_loss_map(eucli_dist_map=dist_map, cell_size=self.cell_size, prop_model=self.prop_model,
                                          frequency=self.base_station_list[0].frequency,  # todo
-                                         htx=self.default_base_station.tx_height, hrx=1.5)  # LEMBRAR DE TORNAR O HRX EDITÁVEL AQUI!!!
+                                         htx=self.default_base_station.tx_height, hrx=1.5,  # LEMBRAR DE TORNAR O HRX EDITÁVEL AQUI!!!
+                                         rng=subsystem_rng(self.seed_seq, 'shadowing'))
 
-        for bs_index, base_station in enumerate(self.base_station_list):
-            lower_bound = 0
-            for sector_index, higher_bound in enumerate(base_station.sectors_phi_range):
-                ue_in_range = np.where((az_map[bs_index] > lower_bound) & (az_map[bs_index] <= higher_bound))
-                sector_gain_map = generate_bf_gain(elevation_map=np.expand_dims(elev_map[bs_index][ue_in_range], axis=0),
-                                                   azimuth_map=np.expand_dims(az_map[bs_index][ue_in_range], axis=0),
-                                                   base_station_list=[base_station],
-                                                   sector_index=sector_index)[0][0]
-                ue[bs_index][ue_in_range, 0:sector_gain_map.shape[0]] = sector_gain_map.T
-                self.sector_map[bs_index][ue_in_range] = sector_index
-                self.ch_gain_map[bs_index][ue_in_range, 0:sector_gain_map.shape[0]] = (sector_gain_map - att_map[bs_index][ue_in_range]).T
-                lower_bound = higher_bound
+        # beam gains for all BSs, sectors and beams at once
+        bf_gain, self.sector_map = generate_bf_gain_tensor(elevation_map=elev_map, azimuth_map=az_map,
+                                                           base_station_list=self.base_station_list)
+        self.ch_gain_map[:, :, 0:n_beams] = bf_gain - att_map[:, :, np.newaxis]
 
         return self.ch_gain_map, self.sector_map
 
+    def generate_linear_gain_maps(self):
+        # linear (watt) copies of the channel gain map, calculated only once per simulation to avoid the dB -> watt
+        # conversions in every time index - the downlink one is scaled by the BSs tx power and the uplink one by the
+        # UE tx power (the uplink power density for a rbw is just a linear factor of rbw/bw)
+        tx_power = np.array([base_station.tx_power for base_station in self.base_station_list])
+        self.dwn_ch_gain_lin = (10 ** ((tx_power[:, np.newaxis, np.newaxis] + self.ch_gain_map) / 10)).astype(np.float32)
+        if self.ue.tx_power is not None:
+            self.up_ch_gain_lin = (10 ** ((self.ue.tx_power + self.ch_gain_map) / 10)).astype(np.float32)
+
+        return self.dwn_ch_gain_lin, self.up_ch_gain_lin
+
+    def generate_interferer_lists(self, margin):
+        # CSR lists of the BSs that interfere in each UE in the downlink: a BS is kept if its best beam received power is
+        # within margin (dB) of the thermal noise (whole BS bw) plus the serving signal - the serving BS is always kept,
+        # so the interference is the sum over the list minus the serving term (like the sum over all BSs)
+        k = 1.380649E-23  # Boltzmann's constant (J/K)
+        t = 290  # absolute temperature
+        ue_bs = self.ue.dw_ue_bs
+        ue_range = np.arange(ue_bs.n_ues)
+        serving_bs = np.where(ue_bs.bs >= 0, ue_bs.bs, 0)
+
+        best_pw = np.max(self.dwn_ch_gain_lin[:, :, :-1], axis=2).astype(float)  # bs x ue (without the dummy beam)
+        noise_power = k * t * self.default_base_station.bw * 10E6
+        relevant = best_pw >= 10 ** (margin / 10) * (noise_power + best_pw[serving_bs, ue_range])
+        relevant[serving_bs, ue_range] = True
+
+        self.dwn_interferer_ue, self.dwn_interferer_bs = np.nonzero(relevant.T)  # UE-major order (CSR)
+        self.dwn_interferer_offsets = np.concatenate(([0], np.cumsum(np.count_nonzero(relevant, axis=0))))
+
+    def reassociate_ue(self, ue_index, candidate, downlink=False, uplink=False):
+        # soft handover of UEs to one of their candidates (User_eq.reassociate) - the interferer lists depend on the
+        # serving BS, so they are rebuilt, and the slot states are cleared because the UE/BS association has changed
+        self.ue.reassociate(ue_index=ue_index, candidate=candidate, downlink=downlink, uplink=uplink)
+        if downlink:
+            if self.interferer_margin is not None:
+                self.generate_interferer_lists(margin=self.interferer_margin)
+            self.dwn_slot_state = None
+        if uplink:
+            self.up_slot_state = None
+
     def send_ue_to_bs(self, t_index=0, cap_defict=None, t_min=None, bs_2b_updt=None, updated_beams=None,
                       downlink=False, uplink=False):
         if cap_defict is None:
             if self.downlink_specs['criteria'] is not None and downlink:
-                cap_defict = self.downlink_specs['criteria'] + np.zeros(shape=self.ue.dw_ue_bs.shape[0])
+                cap_defict = self.downlink_specs['criteria'] + np.zeros(shape=self.ue.dw_ue_bs.n_ues)
             if self.uplink_specs['criteria'] is not None and uplink:
-                cap_defict = self.uplink_specs['criteria'] + np.zeros(shape=self.ue.dw_ue_bs.shape[0])
+                cap_defict = self.uplink_specs['criteria'] + np.zeros(shape=self.ue.dw_ue_bs.n_ues)
 
         if bs_2b_updt is None:
             bs_2b_updt = range(len(self.base_station_list))
@@ -153,17 +210,13 @@ class Macel:
         for bs_index, bs in enumerate(self.base_station_list):
             if bs_index in bs_2b_updt:
                 bs.clear_active_beams(downlink=downlink, uplink=uplink)
+                if downlink:
+                    users_per_beams = self.ue.dw_index.group_sizes(bs_index=bs_index)  # sector x beam
+                elif uplink:
+                    users_per_beams = self.ue.up_index.group_sizes(bs_index=bs_index)  # sector x beam
                 for sector_index in range(bs.n_sectors):
-                    if downlink:
-                        ue_in_bs_sector_and_beam = self.ue.dw_ue_bs[np.where((self.ue.dw_ue_bs[:, 0] == bs_index)
-                                                                             & (self.ue.dw_ue_bs[:, 2] == sector_index)), 1]
-                        [beams, users_per_beams] = np.unique(ue_in_bs_sector_and_beam, return_counts=True)
-                    elif uplink:
-                        ue_in_bs_sector_and_beam = self.ue.up_ue_bs[np.where((self.ue.up_ue_bs[:, 0] == bs_index)
-                                                                             & (self.ue.up_ue_bs[:, 2] == sector_index)), 1]
-                        [beams, users_per_beams] = np.unique(ue_in_bs_sector_and_beam, return_counts=True)
-
-                    bs.add_active_beam(beams=beams.astype(int), sector=sector_index, n_users=users_per_beams,
+                    beams = np.nonzero(users_per_beams[sector_index])[0]
+                    bs.add_active_beam(beams=beams, sector=sector_index, n_users=users_per_beams[sector_index, beams],
                                        uplink=uplink, downlink=downlink)
 
         # SCHEDULING
@@ -171,10 +224,12 @@ class Macel:
             if bs_index in bs_2b_updt:  # todo - separar uplink e downlink e também refaser o bs_2b_updt
                 if downlink:
                     bs.tdd_mux.dwn_scheduler.update_scheduler(active_beams=bs.dwn_active_beams, ue_bs=self.ue.dw_ue_bs,
-                                                              t_index=t_index, c_target=cap_defict, ue_updt=True)
+                                                              t_index=t_index, c_target=cap_defict, ue_updt=True,
+                                                              ue_index=self.ue.dw_index)
                 elif uplink:
                     bs.tdd_mux.up_scheduler.update_scheduler(active_beams=bs.up_active_beams, ue_bs=self.ue.up_ue_bs,
-                                                             t_index=t_index, c_target=cap_defict, ue_updt=True)
+                                                             t_index=t_index, c_target=cap_defict, ue_updt=True,
+                                                             ue_index=self.ue.up_index)
 
                 # bs.tdd_mux.up_scheduler(active_beams=bs.active_beams, ue_bs=self.ue.ue_bs,
                 #                                t_index=t_index, c_target=cap_defict, ue_updt=True)
@@ -182,13 +237,18 @@ class Macel:
                 if downlink:
                     bs.tdd_mux.dwn_scheduler.update_scheduler(active_beams=bs.dwn_active_beams, ue_bs=self.ue.dw_ue_bs,
                                                               t_index=t_index, c_target=cap_defict, ue_updt=False,
-                                                              updated_beams=updated_beams[bs_index])
+                                                              updated_beams=updated_beams[bs_index], ue_index=self.ue.dw_index)
                 if uplink:
                     bs.tdd_mux.up_scheduler.update_scheduler(active_beams=bs.up_active_beams, ue_bs=self.ue.up_ue_bs,
                                                              t_index=t_index, c_target=cap_defict, ue_updt=False,
-                                                             updated_beams=updated_beams[bs_index])
+                                                             updated_beams=updated_beams[bs_index], ue_index=self.ue.up_index)
 
     def place_and_configure_bs(self, n_centers, predetermined_centroids=None):
+        self.generate_channel(n_centers=n_centers, predetermined_centroids=predetermined_centroids)
+        return self.simulate_channel()
+
+    def generate_channel(self, n_centers, predetermined_centroids=None):
+        # BS placement and channel tensors (channel_attributes) for the current UE drop
         # 'random', 'cluster' or 'file'
         if self.bs_allocation_typ == 'cluster':
         # if clustering:
@@ -197,7 +257,8 @@ class Macel:
                 self.cluster.fit(data=self.grid.grid, predetermined_centroids=predetermined_centroids)
             else:
                 # self.cluster = Cluster()
-                self.cluster.k_means(grid=self.grid.grid, n_clusters=n_centers)
+                self.cluster.k_means(grid=self.grid.grid, n_clusters=n_centers,
+                                     rng=subsystem_rng(self.seed_seq, 'bs_placement'))
         elif self.bs_allocation_typ == 'random':
             if predetermined_centroids is not None:
                 # self.cluster = Cluster()
@@ -206,7 +267,8 @@ class Macel:
                 self.cluster.centroids = np.array(predetermined_centroids)
             else:
                 # self.cluster = Cluster()
-                self.cluster.random(grid=self.grid.grid, n_clusters=n_centers)
+                self.cluster.random(grid=self.grid.grid, n_clusters=n_centers,
+                                    rng=subsystem_rng(self.seed_seq, 'bs_placement'))
         elif self.bs_allocation_typ == 'file':
             # remembering that, in this case, the centroids are from the bs_coord file and does not change
             self.cluster.scaling(self.grid.grid)  # to create the cluster.features data
@@ -232,19 +294,33 @@ class Macel:
         # self.tdd_mux.create_tdd_scheduler(simulation_time=self.simulation_time, up_tdd_time=self.tdd_up_time)
         self.generate_base_station_list(n_centers=n_centers, up_tdd_time=self.tdd_up_time)
         self.generate_bf_gain_maps(az_map=az_map, elev_map=elev_map, dist_map=self.dist_map)
+        self.generate_linear_gain_maps()
+
+    def set_channel(self, n_centers, channel):
+        # uses channel tensors calculated elsewhere (channel_attributes dictionary, e.g. read-only shared memory views)
+        # instead of generate_channel - the cluster centroids and features of the drop must be already set
+        self.default_base_station.beam_configuration(az_map=self.default_base_station.beams_pointing)
+        self.generate_base_station_list(n_centers=n_centers, up_tdd_time=self.tdd_up_time)
+        for attribute in self.channel_attributes:
+            setattr(self, attribute, channel.get(attribute))
 
+    def simulate_channel(self):
+        # UE association and the uplink/downlink simulation over the channel tensors
         self.ue.acquire_bs_and_beam(ch_gain_map=self.ch_gain_map,
                                      sector_map=self.sector_map,
-                                    pw_5mhz=self.default_base_station.tx_power + 10*np.log10(5/self.default_base_station.bw))  # calculating the best ch gain for each UE
+                                    pw_5mhz=self.default_base_station.tx_power + 10*np.log10(5/self.default_base_station.bw),
+                                    n_sectors=self.default_base_station.n_sectors)  # calculating the best ch gain for each UE
+        if self.interferer_margin is not None:
+            self.generate_interferer_lists(margin=self.interferer_margin)
 
         self.metrics = Metrics()  # instantiating the Metrics object
         if self.downlink_specs is not None and self.tdd_up_time != 1:
-            self.metrics.store_downlink_metrics(n_ues=self.ue.dw_ue_bs.shape[0], n_bs=self.base_station_list.__len__(),
+            self.metrics.store_downlink_metrics(n_ues=self.ue.dw_ue_bs.n_ues, n_bs=self.base_station_list.__len__(),
                                                 simulation_time=self.simulation_time, time_slot=self.time_slot,
                                                 criteria=self.downlink_specs['criteria'])  # initializing the downlink variables
             self.send_ue_to_bs(downlink=True)
         if self.uplink_specs is not None and self.tdd_up_time != 0:
-            self.metrics.store_uplink_metrics(n_ues=self.ue.up_ue_bs.shape[0], n_bs=self.base_station_list.__len__(),
+            self.metrics.store_uplink_metrics(n_ues=self.ue.up_ue_bs.n_ues, n_bs=self.base_station_list.__len__(),
                                               simulation_time=self.simulation_time, time_slot=self.time_slot,
                                               criteria=self.uplink_specs['criteria'])  # initializing the uplink variables
             self.send_ue_to_bs(uplink=True)
@@ -297,6 +373,146 @@ class Macel:
         # if the tdd not has downlink or uplink, it will return a correspondent empty dictionary
         return {'downlink_results': downlink_results, 'uplink_results': uplink_results}
 
+    def uplink_sinr(self, v_time_index, rbw, spectrum_model='spectrum'):
+        # matrix form of the uplink spectrum for one time index: each active UE occupies a contiguous block of rbw bins
+        # in the spectrum of its BS sector, placed after the cumulative bandwidth of the previous UEs of that sector
+        # the interference spectra of all BS pairs are built in one scatter: an interfering UE adds its power density
+        # at the first bin of its block and removes it after the last one, then a cumsum over the bins spreads it
+        k = 1.380649E-23  # Boltzmann's constant (J/K)
+        t = 290  # absolute temperature
+        noise_power = k * t * rbw * 10E6  # Nyqist noise power equation
+        n_bs = len(self.base_station_list)
+        n_sectors = self.base_station_list[0].n_sectors
+        # the bin counts are rounded before the floor to avoid float division errors (100 // 0.1 = 999)
+        n_bins = int(np.floor(np.round(self.base_station_list[0].bw / rbw, 6)))
+        ue_bs = self.ue.up_ue_bs
+        n_ues = ue_bs.n_ues
+
+        # active beams in this time index for all BSs (bs x sectors) - also used to inform the scheduler controller
+        updated_beams = [base_station.tdd_mux.up_scheduler.time_scheduler.active_beams_at(t_index=v_time_index)
+                         for base_station in self.base_station_list]
+        active_beams = np.array(updated_beams, dtype=int)
+        user_bw = np.array([base_station.tdd_mux.up_scheduler.freq_scheduler.user_bw
+                            for base_station in self.base_station_list], dtype=float)  # bs x ue
+
+        # ue_tx_pw is the ratio of the ue transmited power density (for the rbw) to the ue transmited power
+        ue_tx_pw = rbw / np.array([base_station.tdd_mux.up_scheduler.bw for base_station in self.base_station_list])
+
+        # mapping the active UEs with bandwidth in the active beams of the serving BSs
+        serving_bs = ue_bs.bs
+        active_ue = np.where(ue_bs.active)[0]
+        active_ue = active_ue[ue_bs.beam[active_ue] == active_beams[serving_bs[active_ue], ue_bs.sector[active_ue]]]
+        active_ue = active_ue[user_bw[serving_bs[active_ue], active_ue] != 0]
+
+        # ordering the UEs by bs/sector (keeping the UE order inside a sector) to place their bandwidth blocks
+        sector_id = serving_bs[active_ue].astype(int) * n_sectors + ue_bs.sector[active_ue]
+        order = np.argsort(sector_id, kind='stable')
+        active_ue = active_ue[order]
+        sector_id = sector_id[order]
+        serving_bs = serving_bs[active_ue]
+        n_sub_channels = np.floor(np.round(user_bw[serving_bs, active_ue] / rbw, 6)).astype(int)  # occupied spectrum bins
+        bw_index = np.cumsum(n_sub_channels) - n_sub_channels
+        bw_index -= bw_index[np.searchsorted(sector_id, sector_id)]  # the offsets restart in each BS sector
+        start = np.minimum(bw_index, n_bins)
+        end = np.minimum(bw_index + n_sub_channels, n_bins)
+
+        # pw_of_active_ue = UE power density (W) * CSI (linear channel gain map scaled by the UE power)
+        pw_of_active_ue = ue_tx_pw[serving_bs] * \
+                          self.up_ch_gain_lin[serving_bs, active_ue, ue_bs.beam[active_ue]].astype(float)
+
+        # interference power density of each active UE on every BS (bs x ue), seen by the active beam of the BS sector
+        # where the UE is - a UE does not interfere on its serving BS
+        interf_sector = self.sector_map[:, active_ue]
+        interf_beam = active_beams[np.arange(n_bs)[:, np.newaxis], interf_sector]
+        interf = ue_tx_pw[serving_bs] * \
+                 self.up_ch_gain_lin[np.arange(n_bs)[:, np.newaxis], active_ue, interf_beam].astype(float)
+        interf[serving_bs[np.newaxis, :] == np.arange(n_bs)[:, np.newaxis]] = 0
+
+        # the row of the interfered BS sector of each (bs x ue) interference term
+        interf_row = np.arange(n_bs)[:, np.newaxis] * n_sectors + interf_sector
+
+        # summed SNIR and capacity of the occupied bins of each active UE
+        if spectrum_model == 'spectrum':
+            snr_sum, cap_sum = self.spectrum_uplink_snr(sector_id=sector_id, start=start, end=end,
+                                                        pw_of_active_ue=pw_of_active_ue, interf=interf,
+                                                        interf_row=interf_row, n_rows=n_bs * n_sectors, n_bins=n_bins,
+                                                        noise_power=noise_power, rbw=rbw)
+        elif spectrum_model == 'interval':
+            snr_sum, cap_sum = self.interval_uplink_snr(sector_id=sector_id, start=start, end=end,
+                                                        pw_of_active_ue=pw_of_active_ue, interf=interf,
+                                                        interf_row=interf_row, n_bins=n_bins,
+                                                        noise_power=noise_power, rbw=rbw)
+        else:
+            raise ValueError('Invalid uplink spectrum model! Please check the param.yml file.')
+
+        # snr and cap are one-liners that will store the capacity and the SNIR for one time index
+        snr = np.zeros(shape=n_ues)
+        snr.fill(np.nan)  # filling with NaN to avoid miscalculation
+        cap = copy.copy(snr)
+        n_sub_channels = end - start
+        occupied = n_sub_channels != 0
+        snr[active_ue[occupied]] = snr_sum[occupied] / n_sub_channels[occupied]  # mean SNR for the mapped frequency
+        cap[active_ue[occupied]] = cap_sum[occupied]
+
+        return snr, cap, updated_beams
+
+    def spectrum_uplink_snr(self, sector_id, start, end, pw_of_active_ue, interf, interf_row, n_rows, n_bins,
+                            noise_power, rbw):
+        # dense spectrum model: every BS sector has an array of n_bins rbw bins
+        # the interference of all BS pairs is scattered as spectrum steps, then accumulated over the bins
+        interf_row = interf_row * (n_bins + 1)
+        interf_steps = np.zeros(shape=n_rows * (n_bins + 1))
+        np.add.at(interf_steps, (interf_row + start).ravel(), interf.ravel())
+        np.add.at(interf_steps, (interf_row + end).ravel(), -interf.ravel())
+        interf_spectrum = np.cumsum(interf_steps.reshape(n_rows, n_bins + 1), axis=1)[:, :n_bins]
+        interf_spectrum += noise_power  # adding the noise power
+
+        # SNIR/capacity of every occupied bin, then summed per UE
+        n_sub_channels = end - start
+        ue_bins = np.repeat(np.arange(start.size), n_sub_channels)
+        bins = np.arange(ue_bins.size) - np.repeat(np.cumsum(n_sub_channels) - n_sub_channels - start, n_sub_channels)
+        snr_bins = pw_of_active_ue[ue_bins] / interf_spectrum[sector_id[ue_bins], bins]  # SNR = RX_pw/interf
+        cap_bins = rbw * np.log2(1 + snr_bins)  # the capacity of each bin
+
+        snr_sum = np.bincount(ue_bins, weights=snr_bins, minlength=start.size)
+        cap_sum = np.bincount(ue_bins, weights=cap_bins, minlength=start.size)
+        return snr_sum, cap_sum
+
+    def interval_uplink_snr(self, sector_id, start, end, pw_of_active_ue, interf, interf_row, n_bins, noise_power,
+                            rbw):
+        # interval model: the UE allocations are (start, end, power) intervals and the interference is a piecewise
+        # constant function obtained by a sweep over the sorted interval boundaries of each BS sector
+        # the cost grows with the number of UEs (not with bw/rbw), so a fine rbw does not slow down the simulation
+        interferer = interf != 0  # the serving BS terms are not interference
+        boundary_row = np.concatenate((interf_row[interferer], interf_row[interferer], sector_id, sector_id))
+        boundary = np.concatenate((np.broadcast_to(start, interf.shape)[interferer],
+                                   np.broadcast_to(end, interf.shape)[interferer], start, end))
+        step = np.concatenate((interf[interferer], -interf[interferer], np.zeros(shape=2 * start.size)))
+
+        # sweeping the boundaries: each one opens a segment up to the next boundary of the same BS sector
+        boundary_key = boundary_row * (n_bins + 1) + boundary
+        sweep = np.argsort(boundary_key, kind='stable')
+        boundary_key = boundary_key[sweep]
+        boundary_row = boundary_row[sweep]
+        interf_level = np.cumsum(step[sweep]) + noise_power
+        seg_lngt = np.zeros(shape=boundary_key.size, dtype=int)
+        seg_lngt[:-1] = np.diff(boundary_key)
+        seg_lngt[:-1][boundary_row[1:] != boundary_row[:-1]] = 0  # the last segment of a sector ends in its last boundary
+
+        # mapping each segment to the UE block that contains it (the UE blocks of a sector do not overlap)
+        ue_key = sector_id * (n_bins + 1) + start
+        seg_ue = np.searchsorted(ue_key, boundary_key, side='right') - 1
+        in_block = (seg_lngt != 0) & (seg_ue >= 0)
+        in_block[in_block] = boundary_key[in_block] < sector_id[seg_ue[in_block]] * (n_bins + 1) + end[seg_ue[in_block]]
+        seg_ue = seg_ue[in_block]
+        seg_lngt = seg_lngt[in_block]
+
+        # SNIR/capacity of every segment weighted by its number of bins, then summed per UE
+        seg_snr = pw_of_active_ue[seg_ue] / interf_level[in_block]  # SNR = RX_pw/interf
+        snr_sum = np.bincount(seg_ue, weights=seg_lngt * seg_snr, minlength=start.size)
+        cap_sum = np.bincount(seg_ue, weights=seg_lngt * rbw * np.log2(1 + seg_snr), minlength=start.size)
+        return snr_sum, cap_sum
+
     def uplink_interference(self, ch_gain_map, tdd_scheduler_range, rel_schdl_range, output_typ='complete'):
         # For the time, the uplink interference is fundamentally different of the downlink because every active UE
         # transmits in a different frequency with a different bandwidth
@@ -306,17 +522,11 @@ class Macel:
         # if self.dwn_rel_t_index is None:
         #     self.dwn_rel_t_index = 0
         if self.ue_bs_table is None:  # this is a backup table that stores the initial UE/BS association
-            self.ue_bs_table = pd.DataFrame(copy.copy(self.ue.dw_ue_bs), columns=['bs_index', 'beam_index', 'sector_index', 'csi'])
+            self.ue_bs_table = self.ue.dw_ue_bs.table()
 
-        rbw = 0.1  # the bandwidth resolution  - todo check how to make this more flexible
-        n_ues = self.ue.up_ue_bs.shape[0]
+        rbw = self.uplink_specs['rbw']  # the bandwidth resolution (MHz)
         t_slot_ratio = self.simulation_time/self.time_slot  # this ratio is used in some calculations
 
-        # calculating the noise power for the selected rbw
-        k = 1.380649E-23  # Boltzmann's constant (J/K)
-        t = 290  # absolute temperature
-        noise_power = k * t * rbw * 10E6  # Nyqist noise power equation
-
         if self.up_elapsed_time is None:
             self.up_elapsed_time = 0  # the elapsed time variable is to track the real time outside of
             # the function and use it on the metrics allocation
@@ -326,138 +536,8 @@ class Macel:
             # this function
             v_time_index = time_index - self.up_elapsed_time
 
-            # firstly, store all uplink Tx channels
-            bs_rx_spectrum = []  # this list stores the received spectrum power per bs
-            bs_occupied_spectrum = []  # this list stores ue index that uses the frequency per bs
-            updated_beams = []  # this vector stores the schedulled beams in the time scheduler to inform the scheduller controler
-            for bs_index, base_station in enumerate(self.base_station_list):
-                # filtrating the active UEs in a active beam of a BS sector
-                ue_in_active_beam = (self.ue.up_ue_bs[:, 0] == bs_index) & \
-                                    (self.ue.up_ue_bs[:, 1] ==
-                                     base_station.tdd_mux.up_scheduler.time_scheduler.beam_timing_sequence[
-                                         self.ue.up_ue_bs[:, 2], v_time_index])
-                active_ue_in_active_beam = np.where((base_station.tdd_mux.up_scheduler.freq_scheduler.user_bw !=0) &
-                                                    ue_in_active_beam)
-
-                updated_beams.append(base_station.tdd_mux.up_scheduler.time_scheduler.beam_timing_sequence[:,
-                                     v_time_index])  # this stores the active beams in a time index to inform the scheduler
-
-                # ue_tx_pw is the power density of the ue transmited power (for the rbw)
-                ue_tx_pw = self.ue.tx_power + 10 * np.log10(rbw/base_station.tdd_mux.up_scheduler.bw)
-
-                # pw_of_active_ue = UE power density (dBW) + CSI (channel gain map - dB)
-                pw_of_active_ue = ue_tx_pw + ch_gain_map[bs_index][active_ue_in_active_beam, self.ue.up_ue_bs[active_ue_in_active_beam, 1]][0]
-                pw_of_active_ue = 10 ** (pw_of_active_ue/10)  # converting from dBW to watt
-                # here, we need to set the base frequency response for all UEs
-                _bs_channels = np.zeros(shape=[base_station.n_sectors, int(base_station.bw // rbw)])
-                _bs_occupied_spectrum = copy.copy(_bs_channels) - 1  # the -1 is to initialize the matrix with a unindexed value
-
-                # here, we need to allocate virtual bandwidths for each of the UEs of the BS, for a BSs
-                for sector_index in range(base_station.n_sectors):
-                    ue_in_sector = active_ue_in_active_beam[0][self.ue.up_ue_bs[active_ue_in_active_beam[0], 2] == sector_index].astype(int)
-                    bw_index = 0
-                    bw = base_station.tdd_mux.up_scheduler.freq_scheduler.user_bw[ue_in_sector]
-                    for ue_index, ue in enumerate(ue_in_sector):
-                        _ue_bw = bw[ue_index]  # the bandwidth for a specified UE
-                        n_sub_channes = (_ue_bw//rbw).astype(int)  # the number of spectrum matrix indices that will be occupied
-                        _bs_channels[sector_index, range(bw_index, bw_index + n_sub_channes)] = pw_of_active_ue[ue_index]  # storing the power in the pw. spectrum
-                        _bs_occupied_spectrum[sector_index, range(bw_index, bw_index + n_sub_channes)] = ue  # mapping where is needed to make interf. pw. sum (ue bandwidth)
-                        bw_index += n_sub_channes
-
-                bs_rx_spectrum.append(_bs_channels)  # it is appended for the case that different BSs have different BWs
-                bs_occupied_spectrum.append(_bs_occupied_spectrum.astype(int))
-
-                # ========= PLOTTER !!!!!!! (TO TEST!!! DO NOT ERASE!!!) =========
-                # import matplotlib.pyplot as plt
-                # for sector_index in range(base_station.n_sectors):
-                #     ue_in_sector = active_ue_in_active_beam[0][self.ue.ue_bs[active_ue_in_active_beam[0], 2] == sector_index]
-                #     # for ue_index, ue in enumerate(ue_in_sector):
-                #     x = np.log10(bs_rx_spectrum[0][sector_index])
-                #     x[np.isnan(x)] = -160
-                #     plt.plot(x, label = 'ue ' + str(ue))
-                #     plt.title('Sector ' + str(sector_index) + ' - ' + 'received power in dBW')
-                #     plt.legend()
-                #     plt.show()
-                # =============================================
-
-            # second, calculate the accumulated interference channels from the bs1 perspective
-            interf_ue_channels = []
-            for bs_index, base_station in enumerate(self.base_station_list):
-                interf_ch_pbs = None
-                for bs_index2, base_station2 in enumerate(self.base_station_list):
-                    if bs_index2 != bs_index:
-                        # UEs in beam 2 is considered that they are interfering in beam1
-                        active_ue_in_active_beam2 = (self.ue.up_ue_bs[:, 0] == bs_index2) & \
-                                                    (self.ue.up_ue_bs[:, 1] ==
-                                                     base_station2.tdd_mux.up_scheduler.time_scheduler.beam_timing_sequence[
-                                                         self.ue.up_ue_bs[:, 2], v_time_index])
-                        active_ue_in_active_beam2 = np.where((base_station2.tdd_mux.up_scheduler.freq_scheduler.user_bw != 0) &
-                                                             active_ue_in_active_beam2)
-
-                        # bw_pw is the power density of the ue transmited power (for the rbw). Here, this density is
-                        # to be allocated in all bandwidth slots of a UE
-                        # for now, it is admitted that all UES uses the same power
-                        bw_pw = self.ue.tx_power + 10 * np.log10(rbw/base_station.tdd_mux.up_scheduler.bw)
-
-                        # interference channels calculated from the perspective of the active beams of the bs1
-                        # the interference is also calculted as a power spectral density
-                        # interference = bw_pw (dBW) + channel gain from interference UE to the interfered BS (dB)
-                        interf = bw_pw + ch_gain_map[bs_index][active_ue_in_active_beam2[0],
-                                                               base_station.tdd_mux.up_scheduler.time_scheduler.beam_timing_sequence[
-                                                            self.sector_map[bs_index2, active_ue_in_active_beam2[0]].astype(int), v_time_index]]  # channels from bs2 UEs to bs1
-                        interf = 10**(interf/10)
-                        # allocating the ues in bandwidth for each BS sector/antenna
-                        interf_ch_pbs = np.zeros(shape=[base_station2.n_sectors, int(base_station.bw // rbw)])  # empty channel for all UEs from bs1 perspective
-                        for sector_index in range(base_station.n_sectors):
-                            ue_in_sector = np.array(np.where((self.sector_map[bs_index] == sector_index) &
-                                                             (self.ue.up_ue_bs[:, 0] == bs_index2)))
-                            ue_in_sector = ue_in_sector[np.isin(ue_in_sector, active_ue_in_active_beam2)]
-
-                            for ue_index in ue_in_sector:
-                                ue_sector = self.ue.up_ue_bs[ue_index, 2]
-                                _interf_channel = bs_occupied_spectrum[bs_index2][ue_sector] == ue_index  # mapping the occupied frequency for a UE in bs2
-                                interf_ch_pbs[sector_index, _interf_channel] += interf[ue_index == active_ue_in_active_beam2[0]]  # storing the interference power in the mapped frequency
-
-                if interf_ch_pbs is None:  # special case when theres is no one interfering in the Tx channel
-                    interf_ch_pbs = np.zeros(shape=[base_station.n_sectors, int(base_station.bw // rbw)])
-                interf_ch_pbs += noise_power  # adding the noise power
-                interf_ue_channels.append(interf_ch_pbs)  # it is appended for the case that different BSs have different BWs
-
-            # ========= PLOTTER 2  !!!!!!! (TO TEST!!! DO NOT ERASE!!!) =========
-            # import matplotlib.pyplot as plt
-            # for sector_index in range(base_station.n_sectors):
-            #     x = 10 * np.log10(interf_ue_channels[0][sector_index])
-            #     x[np.isnan(x)] = -160
-            #     plt.plot(x)
-            #     plt.title('Sector ' + str(sector_index) + ' - ' + 'received power in dBW')
-            #     plt.legend()
-            #     plt.show()
-            # =============================================
-
-
-            # finally, the SNIR/capacity calculation for in each BS sector, then separtes the parameters per UE
-            bs_snr_spectrum = np.zeros(shape=[len(self.base_station_list), self.base_station_list[0].n_sectors, int(self.base_station_list[0].bw // rbw)])
-            bs_cap_spectrum = copy.copy(bs_snr_spectrum)
-            # snr and cap are one-liners that will store the capacity and the SNIR for one time index
-            snr = np.zeros(shape=n_ues)
-            snr.fill(np.nan)  # filling with NaN to avoid miscalculation
-            cap = np.zeros(shape=n_ues)
-            cap.fill(np.nan)
-            for bs_index, base_station in enumerate(self.base_station_list):
-                for sector_index in range(base_station.n_sectors):
-                    # calculating the SNIR for each BS's antenna/sector
-                    rx_spectrum = bs_rx_spectrum[bs_index][sector_index]
-                    interf_spectrum = interf_ue_channels[bs_index][sector_index]
-                    bs_snr_spectrum[bs_index, sector_index] = rx_spectrum / interf_spectrum  # SNR = RX_pw/interf
-                    bs_cap_spectrum[bs_index, sector_index] = rbw * np.log2(1 + bs_snr_spectrum[bs_index, sector_index])  # the summed capacity for a UEs bw
-
-
-                active_ue = np.unique(bs_occupied_spectrum[bs_index])
-                active_ue = np.delete(active_ue, active_ue == -1)  # removing unnindexed bandwidth
-                for ue_index, ue in enumerate(active_ue):
-                    active_beam_spectrum = bs_occupied_spectrum[self.ue.up_ue_bs[ue, 0]][self.ue.up_ue_bs[ue, 2]] == ue  # mapping the occupied frequency for a UE
-                    snr[ue] = np.mean(bs_snr_spectrum[self.ue.up_ue_bs[ue, 0]][self.ue.up_ue_bs[ue, 2]][active_beam_spectrum])  # mean SNR for the mapped frequnecy
-                    cap[ue] = np.sum(bs_cap_spectrum[self.ue.up_ue_bs[ue, 0]][self.ue.up_ue_bs[ue, 2]][active_beam_spectrum])  # summed capacity for all mapped frequencies
+            snr, cap, updated_beams = self.slot_sinr(v_time_index=v_time_index, uplink=True, rbw=rbw,
+                                                     spectrum_model=self.uplink_specs['spectrum_model'])
 
             # storing metrics
             self.metrics.store_uplink_metrics(cap=cap/t_slot_ratio, snr=snr/t_slot_ratio,
@@ -472,16 +552,17 @@ class Macel:
             else:
                 count_satisfied_ue_old = self.metrics.up_cnt_satisfied_ue[time_index - 1]
             if self.metrics.up_cnt_satisfied_ue[time_index] != count_satisfied_ue_old:  # if more UEs has been satisfied
-                bs_2b_updt = np.unique(self.ue.up_ue_bs[self.metrics.up_satisfied_ue, 0])  # is the BSs of the UEs that meet c_target
+                bs_2b_updt = np.unique(self.ue.up_ue_bs.bs[self.metrics.up_satisfied_ue])  # is the BSs of the UEs that meet c_target
                 bs_2b_updt = bs_2b_updt[bs_2b_updt >= 0]  # removing the all the UEs that already have been removed before
                 self.ue.remove_ue(ue_index=self.metrics.up_satisfied_ue, uplink=True)  # removing selected UEs from the rest of simulation time
+                self.up_slot_state = None  # the UE/BS association has changed
                 self.up_elapsed_time = time_index + 1
             # this command will redo the beam allocations and scheduling, if necessary
             self.send_ue_to_bs(t_index=time_index+1, cap_defict=self.metrics.up_cap_deficit, bs_2b_updt=bs_2b_updt,
                                updated_beams=updated_beams, uplink=True)
 
         # generate the output dicionaries if the uplink simulation has ended (last time uplink will receive a call)
-        if time_index == base_station.tdd_mux.up_scheduler.time_scheduler.simulation_time - 1:
+        if time_index == self.base_station_list[0].tdd_mux.up_scheduler.time_scheduler.simulation_time - 1:
             return(self.metrics.create_uplink_metrics_dataframe(output_typ=output_typ, active_ue=self.ue.active_ue,
                                                                 cluster_centroids=[np.round(self.cluster.centroids).astype(int)],
                                                                 ue_pos=self.cluster.features,
@@ -489,6 +570,142 @@ class Macel:
                                                                 dist_map=self.dist_map * self.cell_size,
                                                                 scheduler_typ=self.scheduler_typ))
 
+    def scheduling_state(self, v_time_index, downlink=False, uplink=False):
+        # scheduling state of a time slot: the active beams (bs x sectors) and the allocated bw of all the BSs
+        # used by the event-driven mode to find the time slots where the SNIR/capacity of the last evaluated one is valid
+        if downlink:
+            schedulers = [base_station.tdd_mux.dwn_scheduler for base_station in self.base_station_list]
+        elif uplink:
+            schedulers = [base_station.tdd_mux.up_scheduler for base_station in self.base_station_list]
+        active_beams = np.array([scheduler.time_scheduler.active_beams_at(t_index=v_time_index)
+                                 for scheduler in schedulers], dtype=int)
+        bw = [np.copy(scheduler.freq_scheduler.user_bw) if scheduler.freq_scheduler.user_bw is not None
+              else np.copy(scheduler.freq_scheduler.beam_bw) for scheduler in schedulers]  # copies (updated in place)
+        return active_beams, bw
+
+    def slot_sinr(self, v_time_index, downlink=False, uplink=False, **sinr_args):
+        # SNIR/capacity of a time slot: in the event-driven mode, the result of the last evaluated time slot is reused
+        # while the scheduling state (active beams and allocated bw) is the same (the UE removals reset the state)
+        if downlink:
+            sinr_fn, slot_state = self.downlink_sinr, self.dwn_slot_state
+        elif uplink:
+            sinr_fn, slot_state = self.uplink_sinr, self.up_slot_state
+        if not self.event_driven:
+            return sinr_fn(v_time_index=v_time_index, **sinr_args)
+
+        active_beams, bw = self.scheduling_state(v_time_index=v_time_index, downlink=downlink, uplink=uplink)
+        if slot_state is not None and np.array_equal(active_beams, slot_state[0]) and \
+                all(np.array_equal(x, y) for x, y in zip(bw, slot_state[1])):
+            snr, cap = slot_state[2], slot_state[3]
+        else:
+            snr, cap, _ = sinr_fn(v_time_index=v_time_index, **sinr_args)
+            if downlink:
+                self.dwn_slot_state = (active_beams, bw, snr, cap)
+            elif uplink:
+                self.up_slot_state = (active_beams, bw, snr, cap)
+        return snr, cap, list(active_beams)
+
+    def downlink_slot_bw(self, active_beams):
+        # allocated bandwidth of each UE by each BS scheduler (bs x ue) for the active beams (bs x sectors) of a time slot
+        # and the BSs that use a uniform beam bw instead of a per user bw
+        n_bs = len(self.base_station_list)
+        user_bw = np.zeros(shape=(n_bs, self.ue.dw_ue_bs.n_ues))
+        uniform_bw = np.zeros(shape=n_bs, dtype=bool)
+        for bs_index, base_station in enumerate(self.base_station_list):
+            freq_scheduler = base_station.tdd_mux.dwn_scheduler.freq_scheduler
+            if freq_scheduler.user_bw is None:  # uniform beam bw
+                uniform_bw[bs_index] = True
+                user_bw[bs_index] = freq_scheduler.beam_bw[active_beams[bs_index, self.sector_map[bs_index]],
+                                                           self.sector_map[bs_index]]
+            else:  # different bw for each user
+                user_bw[bs_index] = freq_scheduler.user_bw
+        return user_bw, uniform_bw
+
+    def downlink_sinr(self, v_time_index):
+        # downlink SNIR/capacity for one time index (a block of one time slot of downlink_sinr_block)
+        # active beams in this time index for all BSs (bs x sectors) - also used to inform the scheduler controller
+        updated_beams = [base_station.tdd_mux.dwn_scheduler.time_scheduler.active_beams_at(t_index=v_time_index)
+                         for base_station in self.base_station_list]
+        active_beams = np.array(updated_beams, dtype=int)
+        user_bw, uniform_bw = self.downlink_slot_bw(active_beams=active_beams)
+        snr, cap = self.downlink_sinr_block(active_beams=active_beams[np.newaxis], user_bw=user_bw[np.newaxis],
+                                            uniform_bw=uniform_bw)
+        return snr[0], cap[0], updated_beams
+
+    def downlink_sinr_block(self, active_beams, user_bw, uniform_bw):
+        # matrix form of the downlink SNIR for a block of time slots: the active beams (slots x bs x sectors) are used to
+        # pick a slots x bs x ue received power tensor from the channel gain map in one gather
+        # the interference of a UE is the sum over all BSs minus the serving BS term
+        # user_bw is the allocated bw of each UE by each BS (slots x bs x ue) and uniform_bw the BSs with uniform beam bw
+        k = 1.380649E-23  # Boltzmann's constant (J/K)
+        t = 290  # absolute temperature
+        n_bs = active_beams.shape[1]
+        ue_bs = self.ue.dw_ue_bs
+        n_ues = ue_bs.n_ues
+        bs_range = np.arange(n_bs)[:, np.newaxis]
+        ue_range = np.arange(n_ues)
+
+        # mapping the active UEs for the active beams of the serving BSs (with a non-zero bw) in each time slot
+        serving_bs = np.where(ue_bs.bs >= 0, ue_bs.bs, 0)  # the unlinked UEs (-1) are discarded by ue_bs.active
+        serving_sector = np.where(ue_bs.sector >= 0, ue_bs.sector, 0).astype(int)
+        bw = user_bw[:, serving_bs, ue_range]  # slots x ue
+        active_ue = ue_bs.active & (ue_bs.beam == active_beams[:, serving_bs, serving_sector]) & \
+                    ((bw != 0) | uniform_bw[serving_bs])
+
+        if self.dwn_interferer_bs is None:
+            # slots x bs x ue tensor with the beam that each BS is pointing to the sector where the UE is
+            ue_active_beam = active_beams[:, bs_range, self.sector_map]
+
+            # pw = BS power * channel gain (from the UE to the active beam of each BS) - read from the linear gain map (W)
+            pw = self.dwn_ch_gain_lin[bs_range, ue_range, ue_active_beam].astype(float)
+
+            # interf = summation interf of all active beams outside the serving BS + noise power
+            pw_in_ue = pw[:, serving_bs, ue_range]
+            interf_in_ue = pw.sum(axis=1) - pw_in_ue
+        else:
+            # same as above, but only the (ue, bs) pairs of the interferer lists are gathered (slots x pairs)
+            pair_bs = self.dwn_interferer_bs
+            pair_ue = self.dwn_interferer_ue
+            pair_pw = self.dwn_ch_gain_lin[pair_bs, pair_ue,
+                                           active_beams[:, pair_bs, self.sector_map[pair_bs, pair_ue]]].astype(float)
+            slot_ue = (np.arange(active_beams.shape[0])[:, np.newaxis] * n_ues + pair_ue).ravel()
+            pw_in_ue = self.dwn_ch_gain_lin[serving_bs, ue_range,
+                                            active_beams[:, serving_bs, self.sector_map[serving_bs, ue_range]]].astype(float)
+            interf_in_ue = np.bincount(slot_ue, weights=pair_pw.ravel(),
+                                       minlength=active_ue.size).reshape(active_ue.shape) - pw_in_ue
+        noise_power = k * t * bw * 10E6
+        interf_in_ue += noise_power  # summing the noise power
+
+        # snir = tx_pw/interf
+        # cap = BW log2 (1 + SNIR) - SHANON CAPACITY
+        snr = np.zeros(shape=active_ue.shape)
+        snr.fill(np.nan)  # filling with NaN to avoid value confusion
+        cap = copy.copy(snr)
+        snr[active_ue] = pw_in_ue[active_ue] / interf_in_ue[active_ue]
+        cap[active_ue] = bw[active_ue] * 10E6 * np.log2(1 + snr[active_ue]) / (10E6)
+
+        return snr, cap
+
+    def downlink_block(self, rel_schdl_range, tdd_scheduler_range, t_slot_ratio):
+        # block of downlink time slots without capacity criteria (no UE is removed): the schedulers are updated slot by
+        # slot, storing the active beams and allocated bws, and the SNIR/capacity of the block is calculated at once
+        n_bs = len(self.base_station_list)
+        active_beams = np.zeros(shape=(len(rel_schdl_range), n_bs, self.base_station_list[0].n_sectors), dtype=int)
+        user_bw = np.zeros(shape=(len(rel_schdl_range), n_bs, self.ue.dw_ue_bs.n_ues))
+        for slot_index, time_index in enumerate(rel_schdl_range):
+            v_time_index = time_index - self.dwn_elapsed_time
+            updated_beams = [base_station.tdd_mux.dwn_scheduler.time_scheduler.active_beams_at(t_index=v_time_index)
+                             for base_station in self.base_station_list]
+            active_beams[slot_index] = updated_beams
+            user_bw[slot_index], uniform_bw = self.downlink_slot_bw(active_beams=active_beams[slot_index])
+            self.send_ue_to_bs(t_index=time_index + 1, cap_defict=self.metrics.dwn_cap_deficit, bs_2b_updt=[],
+                               updated_beams=updated_beams, downlink=True)
+
+        snr, cap = self.downlink_sinr_block(active_beams=active_beams, user_bw=user_bw, uniform_bw=uniform_bw)
+        self.metrics.store_downlink_metrics_block(cap=cap.T / t_slot_ratio, snr=snr.T,
+                                                  t_index=np.array(tdd_scheduler_range),
+                                                  base_station_list=self.base_station_list, user_bw=user_bw)
+
     def downlink_interference(self, ch_gain_map, tdd_scheduler_range, rel_schdl_range, output_typ='raw'):
         # For the time, the downlink interference is fundamentally different of the uplink because, for simplicity and
         # algorithm evolution, because downlink is made in a way that it always (+-) uses all bandwidth.
@@ -499,63 +716,24 @@ class Macel:
         self.sector_map = self.sector_map.astype(int)
         t_slot_ratio = self.simulation_time/self.time_slot
         if self.ue_bs_table is None:  # this is a backup tab;e that stores the initial UE/BS association
-            self.ue_bs_table = pd.DataFrame(copy.copy(self.ue.dw_ue_bs), columns=['bs_index', 'beam_index', 'sector_index', 'csi'])
-
-        # to calculate noise power
-        k = 1.380649E-23  # Boltzmann's constant (J/K)
-        t = 290  # absolute temperature
+            self.ue_bs_table = self.ue.dw_ue_bs.table()
 
         if self.dwn_elapsed_time is None:
             self.dwn_elapsed_time = 0  # the elapsed time variable is to track the real time outside of
             # the function and use it on the metrics allocation
         count_satisfied_ue_old = 0
+        if self.block_slots > 1 and self.downlink_specs['criteria'] is None:
+            # without the capacity criteria the time slots are simulated in blocks of block_slots
+            for block_start in range(0, len(rel_schdl_range), self.block_slots):
+                self.downlink_block(rel_schdl_range=rel_schdl_range[block_start:block_start + self.block_slots],
+                                    tdd_scheduler_range=tdd_scheduler_range[block_start:block_start + self.block_slots],
+                                    t_slot_ratio=t_slot_ratio)
+            time_index = rel_schdl_range[-1]
+            rel_schdl_range = []  # all time slots have been simulated
         for tdd_t_index, time_index in enumerate(rel_schdl_range):
             v_time_index = time_index - self.dwn_elapsed_time  # virtual time index used after generating new beam timing sequence when needed
-            snr = np.zeros(shape=self.ue.dw_ue_bs.shape[0])
-            snr.fill(np.nan)  # filling with NaN to avoid value confusion
-            cap = copy.copy(snr)
-            # check the active Bs's in time_index
-            updated_beams = []  # this vector stores the schedulled beams in the time scheduler to inform the scheduller controler
-            for bs_index, base_station in enumerate(self.base_station_list):
-                # mapping the active UE for the active beams for each BS sector
-                ue_in_active_beam = (self.ue.dw_ue_bs[:, 0] == bs_index) & \
-                                    (self.ue.dw_ue_bs[:, 1] == base_station.tdd_mux.dwn_scheduler.time_scheduler.beam_timing_sequence[self.ue.dw_ue_bs[:, 2], v_time_index])
-                active_ue_in_active_beam = np.where((base_station.tdd_mux.dwn_scheduler.freq_scheduler.user_bw !=0) & ue_in_active_beam)
-
-                # to map the used beams in this particular time index and inform the scheduler controller
-                updated_beams.append(base_station.tdd_mux.dwn_scheduler.time_scheduler.beam_timing_sequence[:, v_time_index])
-
-                if base_station.tdd_mux.dwn_scheduler.freq_scheduler.user_bw is None:  # uniform beam bw
-                    bw = base_station.tdd_mux.dwn_scheduler.freq_scheduler.beam_bw[
-                        base_station.tdd_mux.dwn_scheduler.time_scheduler.beam_timing_sequence[
-                            self.sector_map[bs_index, active_ue_in_active_beam], v_time_index],  # todo - REDO THIS TO BE AS THE ELSE STATEMENT EVERYTIME
-                        self.sector_map[bs_index, active_ue_in_active_beam]]  # user BW
-                else:  # different bw for each user
-                    bw = base_station.tdd_mux.dwn_scheduler.freq_scheduler.user_bw[active_ue_in_active_beam]
-
-                # pw = BS power (dBW) + channel gain (from active UE to serving BS)
-                pw_in_active_ue = base_station.tx_power + \
-                                  ch_gain_map[bs_index][active_ue_in_active_beam,
-                                                        self.ue.dw_ue_bs[active_ue_in_active_beam, 1]]
-                interf_in_active_ue = 0
-                # interference calculation
-                # interf = summation interf of all active beams outside main BS + noise power
-                for bs_index2, base_station2 in enumerate(self.base_station_list):
-                    if bs_index2 != bs_index:
-                        interf = base_station2.tx_power + \
-                                 ch_gain_map[bs_index2][active_ue_in_active_beam,
-                                                        base_station2.tdd_mux.dwn_scheduler.time_scheduler.beam_timing_sequence[
-                                                            self.sector_map[bs_index2, active_ue_in_active_beam],
-                                                            v_time_index]]
-                        interf_in_active_ue += 10**(interf/10)
-
-                noise_power = k * t * bw * 10E6
-                interf_in_active_ue += noise_power  # summing the noise power
-
-                # snir = tx_pw/interf
-                # cap = BW log2 (1 + SNIR) - SHANON CAPACITY
-                snr[active_ue_in_active_beam] = (10 ** (pw_in_active_ue / 10)) / interf_in_active_ue
-                cap[active_ue_in_active_beam] = bw * 10E6 * np.log2(1 + 10 ** (pw_in_active_ue / 10) / interf_in_active_ue) / (10E6)
+            # check the active Bs's in time_index and calculate the SNIR of all UEs at once
+            snr, cap, updated_beams = self.slot_sinr(v_time_index=v_time_index, downlink=True)
 
             # storing metrics
             self.metrics.store_downlink_metrics(cap=cap / t_slot_ratio, snr=snr,
@@ -565,16 +743,17 @@ class Macel:
 
             bs_2b_updt = []
             if count_satisfied_ue_old != self.metrics.dwn_cnt_satisfied_ue[time_index]:
-                bs_2b_updt = np.unique(self.ue.dw_ue_bs[self.metrics.dwn_satisfied_ue, 0])  # is the BSs of the UEs that meet c_target
+                bs_2b_updt = np.unique(self.ue.dw_ue_bs.bs[self.metrics.dwn_satisfied_ue])  # is the BSs of the UEs that meet c_target
                 bs_2b_updt = bs_2b_updt[bs_2b_updt >= 0]  # removing the all the UEs that already have been removed before
                 count_satisfied_ue_old = copy.copy(self.metrics.dwn_cnt_satisfied_ue[time_index])
                 self.ue.remove_ue(ue_index=self.metrics.dwn_satisfied_ue, downlink=True)  # removing selected UEs from the rest of simulation time
+                self.dwn_slot_state = None  # the UE/BS association has changed
                 self.dwn_elapsed_time = time_index + 1  # VERIFICAR QUE AQUI TÁ ERRADO !!!!!!
             # this command will redo the beam allocations and scheduling, if necessary
             self.send_ue_to_bs(t_index=time_index + 1, cap_defict=self.metrics.dwn_cap_deficit, bs_2b_updt=bs_2b_updt,
                                updated_beams=updated_beams, downlink=True)
 
-        if time_index == base_station.tdd_mux.dwn_scheduler.time_scheduler.simulation_time-1:
+        if time_index == self.base_station_list[0].tdd_mux.dwn_scheduler.time_scheduler.simulation_time-1:
             # generate the output dicionaries if the uplink simulation has ended (last time uplink will receive a call)
             return(self.metrics.create_downlink_metrics_dataframe(output_typ='complete', active_ue=self.ue.active_ue,
                                                                   cluster_centroids=[np.round(self.cluster.centroids).astype(int)],
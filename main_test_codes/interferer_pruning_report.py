@@ -0,0 +1,72 @@
+import copy
+import time
+
+import numpy as np
+
+from main_test_codes.uplink_rbw_benchmark import seeded_run
+from util.param_data_management import load_param
+
+# Error report of the downlink interferer pruning (macel_param:interferer_margin): the same seeded downlink scenario
+# (without capacity criteria, so the schedules do not depend on the SNIR) is simulated with the exact interference and
+# with the interferer lists of several margins, reporting the fraction of (ue, bs) pairs that are kept, the wall time
+# (the minimum of repeated runs, after a warm-up run) and the SNR/capacity errors against the exact run. Run it from
+# the project root (python -m main_test_codes.interferer_pruning_report).
+
+
+def pruning_report(parameters, margins, seed=1, n_bs=9, n_samples=300, n_centers=4, repeats=3):
+    results = {}
+    seeded_run(parameters=copy.deepcopy(parameters), seed=seed, n_bs=n_bs, n_samples=n_samples,
+               n_centers=n_centers)  # warm-up run (numba compilation, caches)
+    for margin in [None] + margins:
+        run_param = copy.deepcopy(parameters)
+        run_param['macel_param']['interferer_margin'] = margin
+        wall_time = np.inf
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            macel, output = seeded_run(parameters=copy.deepcopy(run_param), seed=seed, n_bs=n_bs, n_samples=n_samples,
+                                       n_centers=n_centers)
+            wall_time = min(wall_time, time.perf_counter() - t0)
+
+        n_ues = macel.ue.dw_ue_bs.n_ues
+        if margin is None:
+            kept_pairs = 1.0
+        else:
+            kept_pairs = macel.dwn_interferer_bs.size / (n_ues * len(macel.base_station_list))
+        raw_data = output['downlink_results']['raw_data_dict']
+        results[margin] = {'time': wall_time, 'kept_pairs': kept_pairs,
+                           'snr': np.asarray(raw_data['snr'], dtype=float),
+                           'cap': np.asarray(raw_data['cap'], dtype=float)}
+
+    # errors against the exact interference (the pruning can only overestimate the SNR/capacity)
+    exact = results[None]
+    for margin, result in results.items():
+        valid = ~np.isnan(exact['snr']) & ~np.isnan(result['snr']) & (exact['snr'] > 0) & (exact['cap'] != 0)
+        snr_error = 10 * np.log10(result['snr'][valid] / exact['snr'][valid])  # dB
+        cap_error = np.abs(result['cap'][valid] - exact['cap'][valid]) / exact['cap'][valid]
+        result['mean_snr_error'] = np.mean(np.abs(snr_error)) if snr_error.size != 0 else np.nan
+        result['max_snr_error'] = np.max(np.abs(snr_error)) if snr_error.size != 0 else np.nan
+        result['mean_cap_error'] = np.mean(cap_error) if cap_error.size != 0 else np.nan
+        result['max_cap_error'] = np.max(cap_error) if cap_error.size != 0 else np.nan
+
+    return results
+
+
+if __name__ == '__main__':
+    # PARAMETERS
+    margins = [-10, -20, -30, -40, -60]  # dB
+
+    parameters = load_param(filename='param.yml')
+    parameters['roi_param']['grid_lines'] = 200
+    parameters['roi_param']['grid_columns'] = 200
+    parameters['macel_param']['time_slots'] = 200
+    parameters['macel_param']['mux_tdd_up_time'] = 0  # downlink only
+    parameters['macel_param']['bs_allocation_typ'] = 'random'
+    parameters['downlink_scheduler']['criteria'] = None
+
+    results = pruning_report(parameters=parameters, margins=margins)
+
+    print('margin (dB)  kept pairs  time (s)  mean snr err (dB)  max snr err (dB)  mean cap err  max cap err')
+    for margin, result in results.items():
+        print('{:>11}  {:>10.3f}  {:>8.2f}  {:>17.2e}  {:>16.2e}  {:>12.2e}  {:>11.2e}'.format(
+            'exact' if margin is None else margin, result['kept_pairs'], result['time'], result['mean_snr_error'],
+            result['max_snr_error'], result['mean_cap_error'], result['max_cap_error']))
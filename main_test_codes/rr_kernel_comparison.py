@@ -0,0 +1,74 @@
+import copy
+
+import numpy as np
+
+from models.scheduler.freq_scheduler import Freq_Scheduler
+from user_eq import UE_Store, UE_BS_Index
+
+# Comparison between the compiled Round-Robin kernel (rr_bw_kernel) and the Python path of
+# Freq_Scheduler.generate_RR_bw. Random UE/BS associations are scheduled for a sequence of time slots (with UEs being
+# removed along the way) and the allocated bandwidths and queues of both paths must be identical in every slot (and
+# the allocations must be multiples of bw_slot, also for non-integer bw_slot values).
+# Run it from the project root (python -m main_test_codes.rr_kernel_comparison).
+
+
+def random_ue_links(rng, n_ues, n_bs, n_sectors, n_beams):
+    ue_store = UE_Store(n_ues=n_ues)
+    ue_bs = ue_store.dw
+    ue_bs.link(ue_index=np.arange(n_ues), bs=rng.integers(0, n_bs, n_ues), beam=rng.integers(0, n_beams, n_ues),
+               sector=rng.integers(0, n_sectors, n_ues), csi=rng.normal(-100, 10, n_ues))
+    return ue_bs
+
+
+def active_beams_matrix(ue_index, bs_index, n_beams):
+    # users per beam (beam x sector), as built by Macel.send_ue_to_bs
+    return ue_index.group_sizes(bs_index=bs_index)[:, :n_beams].T.astype(float)
+
+
+def compare(seed, n_ues=600, n_bs=3, n_sectors=3, n_beams=8, n_slots=60, bw=100, bw_slot=1, use_index=True):
+    rng = np.random.default_rng(seed)
+    ue_bs = random_ue_links(rng=rng, n_ues=n_ues, n_bs=n_bs, n_sectors=n_sectors, n_beams=n_beams)
+    ue_index = UE_BS_Index(ue_bs=ue_bs, n_bs=n_bs, n_sectors=n_sectors, n_beams=n_beams + 1)
+
+    for bs_index in range(n_bs):
+        py_scheduler = Freq_Scheduler(bw=bw, bs_index=bs_index, scheduler_typ='RR', bw_slot=bw_slot)
+        kernel_scheduler = copy.deepcopy(py_scheduler)
+        updated_beams = None
+        for t_index in range(n_slots):
+            if t_index % 20 == 19:  # removing some UEs and restarting the scheduler, as in a satisfied UE update
+                removed = rng.choice(n_ues, size=n_ues // 10, replace=False)
+                ue_index.remove(ue_index=removed)
+                ue_bs.unlink(ue_index=removed)
+                updated_beams = None
+            active_beams = active_beams_matrix(ue_index=ue_index, bs_index=bs_index, n_beams=n_beams)
+
+            for scheduler, kernel in ((py_scheduler, False), (kernel_scheduler, True)):
+                scheduler.generate_RR_bw(ue_bs=ue_bs, active_beams=active_beams, updated_beams=updated_beams,
+                                         ue_index=ue_index if use_index else None, kernel=kernel)
+
+            if not (np.array_equal(py_scheduler.user_bw, kernel_scheduler.user_bw) and
+                    np.array_equal(py_scheduler.in_queue_ue, kernel_scheduler.in_queue_ue)):
+                return False
+            n_slots_ue = kernel_scheduler.user_bw / bw_slot
+            if not np.allclose(n_slots_ue, np.round(n_slots_ue)) or (np.sum(active_beams) != 0 and
+                                                                     np.sum(kernel_scheduler.user_bw) == 0):
+                return False
+
+            # next active beam of each sector (a random active one or the dummy beam for empty sectors)
+            updated_beams = np.zeros(shape=n_sectors, dtype=int) + n_beams
+            for sector_index in range(n_sectors):
+                sector_beams = np.nonzero(active_beams[:, sector_index])[0]
+                if sector_beams.size != 0:
+                    updated_beams[sector_index] = rng.choice(sector_beams)
+    return True
+
+
+if __name__ == '__main__':
+    n_seeds = 20
+    results = []
+    for seed in range(n_seeds):
+        for bw_slot in (1, 2, 5, 0.5, 2.5):
+            for use_index in (True, False):
+                results.append(compare(seed=seed, bw_slot=bw_slot, use_index=use_index,
+                                       n_ues=[30, 300, 1500][seed % 3]))
+    print('identical allocations: {} of {} runs'.format(np.sum(results), len(results)))
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+
+from util.param_data_management import load_param
+from util.simulation_setup import create_enviroment, prep_multiproc, init_worker, simulate_variants
+
+# Example of a scheduler/TDD sweep over the same UE drop and BS layout: the channel tensors are calculated once in this
+# process and the pool workers attach to them in shared memory (util.shared_channel) to simulate each variant.
+# Run it from the project root (python -m main_test_codes.shared_channel_sweep).
+
+
+if __name__ == '__main__':
+    # PARAMETERS
+    n_bs = 9
+    n_samples = 300
+    n_centers = 4
+    seed = np.random.SeedSequence(1)  # SeedSequence of the drop (util.seeds)
+    variants = [{'downlink_specs': {'scheduler_typ': 'RR'}},
+                {'downlink_specs': {'scheduler_typ': 'BCQI'}},
+                {'downlink_specs': {'scheduler_typ': 'PF'}},
+                {'downlink_specs': {'scheduler_typ': 'PF'}, 'tdd_up_time': 0.5}]
+
+    parameters = load_param(filename='param.yml')
+    macel, parameters = create_enviroment(parameters=parameters, param_path=None)
+    ue_dist_typ = parameters['macel_param']['ue_dist_typ']
+    random_centers = parameters['macel_param']['center_distribution'] == 'uniform'
+
+    process_pool = prep_multiproc(threads=parameters['exec_param']['threads'], initializer=init_worker,
+                                  initargs=(macel, n_centers, ue_dist_typ, random_centers))
+    t0 = time.perf_counter()
+    outputs = simulate_variants(macel=macel, process_pool=process_pool, n_bs=n_bs, n_samples=n_samples,
+                                n_centers=n_centers, ue_dist_type=ue_dist_typ, random_centers=random_centers,
+                                variants=variants, seed=seed)
+    print('{} variants simulated in {:.2f} s'.format(len(variants), time.perf_counter() - t0))
+    process_pool.close()
+    process_pool.join()
+
+    for variant, output in zip(variants, outputs):
+        raw_data = output['downlink_results']['raw_data_dict']
+        print(variant, 'mean downlink capacity: {:.2f}'.format(np.nanmean(np.asarray(raw_data['cap'], dtype=float))))
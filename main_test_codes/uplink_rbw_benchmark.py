@@ -0,0 +1,83 @@
+import copy
+import time
+import tracemalloc
+
+import numpy as np
+
+from util.param_data_management import load_param
+from util.simulation_setup import create_enviroment, simulate_macel
+
+# Benchmark of the uplink resolution bandwidth (rbw): the same seeded scenario is simulated for several rbw values and
+# both uplink spectrum models, reporting the wall time, the peak memory (tracemalloc) and the uplink capacity error
+# against the finest resolution of each model. It is used to choose the cheapest rbw that keeps the results within
+# tolerance. Run it from the project root (python -m main_test_codes.uplink_rbw_benchmark).
+
+
+def seeded_run(parameters, seed, n_bs, n_samples, n_centers):
+    # simulation of a seeded scenario (also used by the other benchmark scripts), it returns the Macel and its output
+    macel, parameters = create_enviroment(parameters=parameters, param_path=None)
+    macel.set_seed(np.random.SeedSequence(seed))  # the same random streams (util.seeds) in all runs
+    output = simulate_macel((n_bs, macel, n_samples, n_centers, parameters['macel_param']['ue_dist_typ'], True))
+    return macel, output
+
+
+def benchmark(parameters, rbw_list, spectrum_models, seed=1, n_bs=4, n_samples=300, n_centers=4):
+    results = {}
+    seeded_run(parameters=copy.deepcopy(parameters), seed=seed, n_bs=n_bs, n_samples=n_samples,
+               n_centers=n_centers)  # warm-up run (numba compilation, caches)
+    for spectrum_model in spectrum_models:
+        for rbw in rbw_list:
+            run_param = copy.deepcopy(parameters)
+            run_param['uplink_scheduler']['spectrum_model'] = spectrum_model
+            run_param['uplink_scheduler']['rbw'] = rbw
+
+            # the wall time is measured without tracemalloc (it slows down the allocations)
+            t0 = time.perf_counter()
+            _, output = seeded_run(parameters=run_param, seed=seed, n_bs=n_bs, n_samples=n_samples,
+                                   n_centers=n_centers)
+            wall_time = time.perf_counter() - t0
+            tracemalloc.start()
+            seeded_run(parameters=run_param, seed=seed, n_bs=n_bs, n_samples=n_samples, n_centers=n_centers)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            cap = np.asarray(output['uplink_results']['raw_data_dict']['cap'], dtype=float)
+            results[(spectrum_model, rbw)] = {'time': wall_time, 'peak_memory': peak_memory, 'cap': cap}
+
+    # capacity error against the finest rbw of each spectrum model
+    finest_rbw = np.min(rbw_list)
+    for (spectrum_model, rbw), result in results.items():
+        ref_cap = results[(spectrum_model, finest_rbw)]['cap']
+        valid = ~np.isnan(ref_cap) & ~np.isnan(result['cap']) & (ref_cap != 0)
+        rel_error = np.abs(result['cap'][valid] - ref_cap[valid]) / ref_cap[valid]
+        result['mean_error'] = np.mean(rel_error) if rel_error.size != 0 else np.nan
+        result['max_error'] = np.max(rel_error) if rel_error.size != 0 else np.nan
+
+    return results
+
+
+if __name__ == '__main__':
+    # PARAMETERS
+    rbw_list = [1, 0.5, 0.2, 0.1, 0.05, 0.01]  # MHz
+    spectrum_models = ['spectrum', 'interval']
+    tolerance = 0.01  # maximum mean relative capacity error
+
+    parameters = load_param(filename='param.yml')
+    parameters['roi_param']['grid_lines'] = 200
+    parameters['roi_param']['grid_columns'] = 200
+    parameters['macel_param']['time_slots'] = 200
+    parameters['macel_param']['mux_tdd_up_time'] = 0.5
+    parameters['macel_param']['bs_allocation_typ'] = 'random'
+
+    results = benchmark(parameters=parameters, rbw_list=rbw_list, spectrum_models=spectrum_models)
+
+    print('model     rbw (MHz)  time (s)  peak mem (MB)  mean cap err  max cap err')
+    for (spectrum_model, rbw), result in results.items():
+        print('{:<9} {:>9}  {:>8.2f}  {:>13.1f}  {:>12.2e}  {:>11.2e}'.format(
+            spectrum_model, rbw, result['time'], result['peak_memory'] / 2**20, result['mean_error'],
+            result['max_error']))
+
+    for spectrum_model in spectrum_models:
+        within_tol = [rbw for rbw in rbw_list if results[(spectrum_model, rbw)]['mean_error'] <= tolerance]
+        cheapest = min(within_tol, key=lambda rbw: results[(spectrum_model, rbw)]['time'])
+        print('cheapest rbw within tolerance ({}): {} MHz'.format(spectrum_model, cheapest))
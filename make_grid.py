@@ -1,6 +1,5 @@
 import numpy as np
 import math
-from random import randint, gauss, gammavariate
 import sys
 import matplotlib.pyplot as plt
 from util.util_funcs import highestPowerOf2
@@ -25,13 +24,15 @@ class Grid:
         # self.grid = np.zeros(shape=(self.lines, self.columns))
         self.grid[:] = 0
 
-    def make_points(self, dist_type, samples, n_centers, random_centers=True, plot=False):  # generating centers for the distributions
+    def make_points(self, dist_type, samples, n_centers, random_centers=True, plot=False, rng=None):  # generating centers for the distributions
+        if rng is None:  # numpy Generator of the draws (see util.seeds)
+            rng = np.random.default_rng()
         centers_set = set()  # workaround to generate unique values
         if random_centers:
             while len(centers_set) < n_centers:
                 x, y = 7, 0
                 while (x, y) == (7, 0):
-                    x, y = randint(0, self.lines - 1), randint(0, self.columns - 1)
+                    x, y = int(rng.integers(0, self.lines)), int(rng.integers(0, self.columns))
                 # that will make sure we don't add (7, 0) to cords_set
                 centers_set.add((x, y))
             self.centers_set = list(centers_set)
@@ -67,24 +68,23 @@ class Grid:
             mu = 0
             sigma = min(self.lines, self.columns) / 10
             for i in range(n_centers):
-                for _ in range(samples):
-                    [x, y] = [self.centers_set[i][0] + round(gauss(mu, sigma)), self.centers_set[i][1] + round(gauss(mu, sigma))]
-                    if (x < self.lines and y < self.columns) and (x >= 0 and y >= 0):
-                        self.grid[x, y] += 1
+                [x, y] = (np.array(self.centers_set[i])[:, np.newaxis] +
+                          np.round(rng.normal(mu, sigma, size=(2, samples))).astype(int))
+                inside = (x < self.lines) & (y < self.columns) & (x >= 0) & (y >= 0)
+                np.add.at(self.grid, (x[inside], y[inside]), 1)
 
         elif dist_type == 'gamma':
             alpha = min(self.columns, self.lines) / 10
             beta = 1
             for i in range(n_centers):
-                for _ in range(samples):
-                    [x, y] = [self.centers_set[i][0] + round(gammavariate(alpha, beta)),
-                              self.centers_set[i][1] + round(gammavariate(alpha, beta))]
-                    self.grid[x, y] += 1
+                [x, y] = (np.array(self.centers_set[i])[:, np.newaxis] +
+                          np.round(rng.gamma(shape=alpha, scale=beta, size=(2, samples))).astype(int))
+                np.add.at(self.grid, (x, y), 1)
 
         elif dist_type == 'uniform':  # for this distribution, the n_centers is not used
             xy_min = [0, 0]
             xy_max = [self.lines, self.columns]
-            coord = np.random.default_rng().integers(low=xy_min, high=xy_max, size=(samples, 2))
+            coord = rng.integers(low=xy_min, high=xy_max, size=(samples, 2))
             for c in coord:
                 self.grid[c[0], c[1]] += 1
 
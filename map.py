@@ -347,7 +347,7 @@ class Map:
         else:
             return points_map, point_list
 
-    def generate_samples(self, n_samples, id_mtx=None, weight_mtx=None, mask=None, plot=False):
+    def generate_samples(self, n_samples, id_mtx=None, weight_mtx=None, mask=None, plot=False, rng=None):
         flag = False  # verifying if the function will use class or external variables
         if id_mtx is None or weight_mtx is None:
             flag = True  # when flag is true, it will save the results in class variables
@@ -375,7 +375,9 @@ class Map:
         # dnst_map = self.apply_mask(shape=self.wgt_mtx, mask=mask)
 
         # generating the samples from the weights from dsnt_map
-        linear_idx = np.random.choice(weight_mtx.size, p=weight_mtx.ravel() / float(weight_mtx.sum()), size=n_samples)  # linear index from random values from dnst_map
+        if rng is None:  # numpy Generator of the draws (see util.seeds)
+            rng = np.random.default_rng()
+        linear_idx = rng.choice(weight_mtx.size, p=weight_mtx.ravel() / float(weight_mtx.sum()), size=n_samples)  # linear index from random values from dnst_map
         unique, counts = np.unique(linear_idx, return_counts=True)  # counting unique values
         x, y = np.unravel_index(unique, weight_mtx.shape)  # converting the linear index to x y
         point_list = np.column_stack((x, y))  # saving the coordinates in a np array
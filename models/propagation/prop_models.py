@@ -12,21 +12,35 @@ from numba import jit  # some functions uses numba to improve performance (some
 # or just arrange the functions in a format that the vectorized functions will work
 
 
-def generate_azimuth_map(lines, columns, centroids, samples=None, plot=False):
+def _sample_chunks(lines, columns, samples, chunk_size):
+    # yields (slice, samples x 2 coordinates) chunks of the samples or, if samples is None, of all the grid pixels
+    # (in the same order of a lines x columns matrix)
+    n_samples = lines * columns if samples is None else samples.shape[0]
+    if chunk_size is None:
+        chunk_size = n_samples
+    for start in range(0, n_samples, max(chunk_size, 1)):
+        chunk = slice(start, min(start + chunk_size, n_samples))
+        if samples is None:
+            pixel = np.arange(chunk.start, chunk.stop)
+            yield chunk, np.stack((pixel // columns, pixel % columns), axis=1)
+        else:
+            yield chunk, samples[chunk]
+
+
+def generate_azimuth_map(lines, columns, centroids, samples=None, plot=False, dtype=np.float64, chunk_size=None):
     # returns a centroids x lines x columns matrix with per pixel azimuth information from a centroid
+    # (or a centroids x samples matrix if the samples are used)
+    # all the centroid x sample pairs are calculated in one broadcast operation - chunk_size limits the number of
+    # samples per operation to bound the memory and dtype can be used to return a float32 map
+    n_samples = lines * columns if samples is None else samples.shape[0]
+    az_map = np.empty(shape=(centroids.shape[0], n_samples), dtype=dtype)
+    centroids_ = np.asarray(centroids, dtype=dtype).T[:, :, np.newaxis]  # 2 x centroids x 1
 
-    if samples is None:
-        coord_map = np.indices((lines, columns))
+    for chunk, coord in _sample_chunks(lines, columns, samples, chunk_size):
+        az_map[:, chunk] = azimuth_angle_clockwise(centroids_, coord.T.astype(dtype)[:, np.newaxis, :])
 
-        az_map = np.ndarray(shape=(centroids.shape[0], lines, columns))
-        for i, centroid in enumerate(centroids):
-            az_map[i] = azimuth_angle_clockwise(np.asarray([centroid[0], centroid[1]]),
-                                                np.asarray([coord_map[0], coord_map[1]]))
-    else:
-        az_map = np.ndarray(shape=(centroids.shape[0], samples.shape[0]))
-        for i, centroid in enumerate(centroids):
-            az_map[i] = azimuth_angle_clockwise(np.asarray([centroid[0], centroid[1]]),
-                                                       np.asarray([samples[:, 0], samples[:, 1]]))
+    if samples is None:
+        az_map = az_map.reshape((centroids.shape[0], lines, columns))
 
     if plot:
         title = 'Azimuth map'
@@ -35,32 +49,24 @@ def generate_azimuth_map(lines, columns, centroids, samples=None, plot=False):
     return az_map
 
 
-def generate_euclidian_distance(lines, columns, centers, samples=None, plot=False):
-    if samples is not None:
-        dist_mtx = np.ndarray(shape=(centers.shape[0], samples.shape[0]))
-
-        a_b = np.ndarray(shape=(centers.shape[0], 2))
+def generate_euclidian_distance(lines, columns, centers, samples=None, plot=False, dtype=np.float64, chunk_size=None):
+    # returns a centers x lines x columns matrix with the euclidean distance from each center to each pixel
+    # (or a centers x samples matrix if the samples are used)
+    # all the center x sample pairs are calculated in one broadcast operation - chunk_size limits the number of
+    # samples per operation to bound the memory and dtype can be used to return a float32 map
+    n_samples = lines * columns if samples is None else samples.shape[0]
+    dist_mtx = np.empty(shape=(centers.shape[0], n_samples), dtype=dtype)
+    centers_ = np.asarray(centers, dtype=dtype)
 
-        for i, coord in enumerate(samples):
-            a_b[:, 0] = centers[:, 0] - coord[0]
-            a_b[:, 1] = centers[:, 1] - coord[1]
+    for chunk, coord in _sample_chunks(lines, columns, samples, chunk_size):
+        coord = coord.astype(dtype)
+        a_b_x = centers_[:, 0, np.newaxis] - coord[:, 0]
+        a_b_y = centers_[:, 1, np.newaxis] - coord[:, 1]
+        dist_mtx[:, chunk] = np.sqrt(a_b_x * a_b_x + a_b_y * a_b_y)  # euclidean distance using L2 norm
 
-            dist_mtx[:, i] = np.linalg.norm(a_b, axis=1)  # euclidean distance using L2 norm
-
-        dist_mtx = np.where(dist_mtx == 0, 1, dist_mtx)
-    else:
-        coord_map = np.indices((lines, columns)).transpose((1, 2, 0))  # coordinates map used to calculate the distance
-        dist_mtx = np.ndarray(shape=(centers.shape[0], lines, columns))  # calculated euclidean distance from n_centers to each pixel
-
-        a_b = np.ndarray(shape=(centers.shape[0], 2))
-        for line in coord_map:
-            for coord in line:
-                a_b[:, 0] = centers[:, 0] - coord[0]
-                a_b[:, 1] = centers[:, 1] - coord[1]
-
-                dist_mtx[:, coord[0], coord[1]] = np.linalg.norm(a_b, axis=1)  # euclidean distance using L2 norm
-
-        dist_mtx = np.where(dist_mtx == 0, 1, dist_mtx)
+    dist_mtx[dist_mtx == 0] = 1
+    if samples is None:
+        dist_mtx = dist_mtx.reshape((centers.shape[0], lines, columns))
 
     if plot:
         for i in range(centers.shape[0]):
@@ -116,11 +122,16 @@ def generate_bf_gain(elevation_map, azimuth_map, base_station_list=None, sector_
                 for sector, sector_antenna in enumerate(sectors):
                     if sector_index is not None:  # VER SE ISTO AQUI ESTÁ FUNCIONANDO!!!!
                         sector = [sector_index][sector]
-                    gain_samples_sector = np.ndarray(shape=(sector_antenna.beams, elevation_map.shape[1]))
-                    for beam in range(sector_antenna.beams):
-                        for coordinate, _ in enumerate(elevation_map[i]):
-                            gain_samples_sector[beam][coordinate] = sector_antenna.calculate_gain(beam, np.rint(azimuth_map[i][coordinate]
-                                                            - base_station.sectors_pointing[sector]).astype(int), np.rint(180+elevation_map[i][coordinate]).astype(int))
+                    if getattr(sector_antenna, 'gain_table', None) is not None:  # one gather in the precomputed table
+                        gain_samples_sector = sector_antenna.table_gain(
+                            phi=np.rint(azimuth_map[i] - base_station.sectors_pointing[sector]).astype(int),
+                            theta=np.rint(180 + elevation_map[i]).astype(int))
+                    else:
+                        gain_samples_sector = np.ndarray(shape=(sector_antenna.beams, elevation_map.shape[1]))
+                        for beam in range(sector_antenna.beams):
+                            for coordinate, _ in enumerate(elevation_map[i]):
+                                gain_samples_sector[beam][coordinate] = sector_antenna.calculate_gain(beam, np.rint(azimuth_map[i][coordinate]
+                                                                - base_station.sectors_pointing[sector]).astype(int), np.rint(180+elevation_map[i][coordinate]).astype(int))
 
                     sectors_gain.append(gain_samples_sector)
 
@@ -131,6 +142,59 @@ def generate_bf_gain(elevation_map, azimuth_map, base_station_list=None, sector_
         else:
             print('empty base_station_list !!!')
 
+def generate_bf_gain_tensor(elevation_map, azimuth_map, base_station_list, chunk_size=65536):
+    # batched version of generate_bf_gain for all base stations, sectors and beams at once
+    # it works with azimuth and elevation in sample format (bs x samples) and returns a bs x samples x beams gain
+    # tensor and the bs x samples sector map
+    # all base stations use the sector and antenna configuration of the first one (they are copies of the default BS)
+    base_station = base_station_list[0]
+    sector_antennas = base_station.beam_sector_pattern[:base_station.n_sectors]
+    if not hasattr(sector_antennas[0], 'beamforming_id'):  # checking if the antenna is a beamforming one
+        raise TypeError('generate_bf_gain_tensor only works with beamforming antennas')
+
+    # sector selection mask: a UE is in the sector if lower_bound < azimuth <= higher_bound
+    sector_map = np.searchsorted(base_station.sectors_phi_range, azimuth_map, side='left')
+    sector_map = np.minimum(sector_map, base_station.n_sectors - 1)
+    phi = np.rint(azimuth_map - base_station.sectors_pointing[sector_map]).astype(int)
+    theta = np.rint(180 + elevation_map).astype(int)
+
+    n_beams = sector_antennas[0].beams
+    gain = np.empty(shape=azimuth_map.shape + (n_beams,))
+
+    if all(getattr(antenna, 'gain_table', None) is not None for antenna in sector_antennas):
+        # precomputed tables - one gather per sector mask
+        for sector_index, antenna in enumerate(sector_antennas):
+            in_sector = sector_map == sector_index
+            gain[in_sector] = antenna.table_gain(phi=phi[in_sector], theta=theta[in_sector]).T
+        return gain, sector_map
+
+    # array weights of all sectors and beams: sectors x beams x rows x columns
+    antenna = sector_antennas[0]
+    w_vec = np.stack([sector_antenna.w_vec for sector_antenna in sector_antennas])
+    rows = np.arange(antenna.n_rows)
+    columns = np.arange(antenna.n_columns)
+    element_gain = antenna.ant_element.gain_pattern
+
+    phi_flat = phi.ravel()
+    theta_flat = theta.ravel()
+    sector_flat = sector_map.ravel()
+    gain_flat = gain.reshape(-1, n_beams)
+    for start in range(0, phi_flat.shape[0], chunk_size):
+        chunk = slice(start, start + chunk_size)
+        theta_rad = np.deg2rad(theta_flat[chunk] + 90)
+        phi_rad = np.deg2rad(phi_flat[chunk])
+        # steering vectors, separated in rows and columns (the same terms of _superposition_vector)
+        v_rows = np.exp(1j * 2 * np.pi * rows * antenna.dv * np.cos(theta_rad)[:, np.newaxis])
+        v_columns = np.exp(1j * 2 * np.pi * columns * antenna.dh * (np.sin(theta_rad) * np.sin(phi_rad))[:, np.newaxis])
+        array_factor = np.einsum('sbrc,nr,nc->nsb', w_vec, v_rows, v_columns, optimize=True)
+        # picking the array factor of the UE sector (the sector selection mask)
+        array_factor = np.take_along_axis(array_factor, sector_flat[chunk, np.newaxis, np.newaxis], axis=1)[:, 0]
+        with np.errstate(divide='ignore'):
+            gain_flat[chunk] = element_gain[phi_flat[chunk], theta_flat[chunk], np.newaxis] + \
+                               10 * np.log10(np.abs(array_factor) ** 2)
+
+    return gain, sector_map
+
 def generate_gain_map(antenna, elevation_map, azimuth_map, sectors_hor_pattern=None, sectors_ver_pattern=None, base_station_list=None):
     if base_station_list is not None:
         hor_gain = np.ndarray(shape=np.append(base_station_list[0].sectors_hor_pattern.shape[0], azimuth_map.shape))
@@ -168,7 +232,8 @@ def generate_gain_map(antenna, elevation_map, azimuth_map, sectors_hor_pattern=N
     return gain_map
 
 
-def generate_path_loss_map(eucli_dist_map, cell_size, prop_model, frequency, htx, hrx, samples=None, plot=False, **kwargs):
+def generate_path_loss_map(eucli_dist_map, cell_size, prop_model, frequency, htx, hrx, samples=None, plot=False, rng=None,
+                           **kwargs):
 
     # converting the euclidean distance to actual distance between Tx and Rx and using the actual distance for a cell size
     if samples is not None:
@@ -180,9 +245,9 @@ def generate_path_loss_map(eucli_dist_map, cell_size, prop_model, frequency, htx
     if prop_model == 'free space':
         if 'var' in kwargs:
             var = kwargs['var']
-            path_loss_map = fs_path_loss(dist_map/1000, frequency, var=var)
+            path_loss_map = fs_path_loss(dist_map/1000, frequency, var=var, rng=rng)
         else:
-            path_loss_map = fs_path_loss(dist_map / 1000, frequency)
+            path_loss_map = fs_path_loss(dist_map / 1000, frequency, rng=rng)
 
     else:
         print('wrong path loss model !!! please see the available ones in: .....')
@@ -361,9 +426,11 @@ def plot_func(map = None, sectors = 1, centroids=1, title=''):
 #     return fspl
 
 # TODO - REFAZER COM AS VARIAVEIS ALFA BETA GAMA E VAR COMO ARGUMENTO !!!!!
-def fs_path_loss(d, f, var=6):  # simple free space path loss function with lognormal component
+def fs_path_loss(d, f, var=6, rng=None):  # simple free space path loss function with lognormal component
     if var:
-        log_n = np.random.lognormal(mean=0, sigma=np.sqrt(var), size=d.shape)  # lognormal variance from the mediam path loss
+        if rng is None:  # numpy Generator of the draws (see util.seeds)
+            rng = np.random.default_rng()
+        log_n = rng.lognormal(mean=0, sigma=np.sqrt(var), size=d.shape)  # lognormal variance from the mediam path loss
     else:
         log_n = 0
 
@@ -0,0 +1,57 @@
+import numpy as np
+
+# The Alias_Sampler class draws beam indexes with probabilities proportional to a weight matrix (beams x sectors, the
+# same layout of Time_Scheduler.weighted_act_beams) using the alias method (Walker/Vose). The alias tables are built
+# once for the weights and each draw costs O(1), so a block of time slots for all sectors is one vectorized call.
+
+class Alias_Sampler:
+    def __init__(self, weights):
+        self.weights = np.array(weights, dtype=float)  # beams x sectors
+        n_beams, n_sectors = self.weights.shape
+        if not np.all(np.isfinite(self.weights)):
+            raise ValueError('The beam weights of the alias sampler must be finite (NaN or inf found)')
+        if np.any(self.weights < 0):
+            raise ValueError('The beam weights of the alias sampler must not be negative')
+        self.empty_sectors = ~np.any(self.weights != 0, axis=0)  # sectors without weights (no beam is drawn)
+        if np.any(np.sum(self.weights[:, ~self.empty_sectors], axis=0) <= 0):
+            raise ValueError('The beam weights of a non-empty sector must have a positive sum')
+
+        # alias tables (sectors x beams): beam i is drawn with probability prob[i] and alias[i] otherwise
+        self.prob = np.ones(shape=(n_sectors, n_beams))
+        self.alias = np.zeros(shape=(n_sectors, n_beams), dtype=int) + np.argmax(self.weights, axis=0)[:, np.newaxis]
+        for sector_index in np.where(~self.empty_sectors)[0]:
+            self.build_table(sector_index=sector_index)
+
+    def build_table(self, sector_index):
+        # Vose's construction: the scaled probabilities are paired (small with large) until all columns are filled
+        weights = self.weights[:, sector_index]
+        scaled_prob = weights * weights.size / np.sum(weights)
+        small = list(np.where(scaled_prob < 1)[0])
+        large = list(np.where(scaled_prob >= 1)[0])
+        while small and large:
+            small_index = small.pop()
+            large_index = large.pop()
+            self.prob[sector_index, small_index] = scaled_prob[small_index]
+            self.alias[sector_index, small_index] = large_index
+            scaled_prob[large_index] += scaled_prob[small_index] - 1
+            if scaled_prob[large_index] < 1:
+                small.append(large_index)
+            else:
+                large.append(large_index)
+        for beam_index in small + large:  # leftovers of the rounding errors (a zero weight beam is never drawn)
+            self.prob[sector_index, beam_index] = 1 if weights[beam_index] != 0 else 0
+
+    def same_weights(self, weights):
+        # checks if the tables can be reused for a new weight matrix
+        return self.weights.shape == np.shape(weights) and np.array_equal(self.weights, weights)
+
+    def draw(self, n_slots, empty_beam, rng):
+        # draws the beams of n_slots time slots for all sectors (sectors x n_slots), empty sectors receive empty_beam
+        # rng is the numpy Generator of the draws
+        n_sectors, n_beams = self.prob.shape
+        x = rng.random(size=(n_sectors, n_slots)) * n_beams  # one uniform gives the column and the coin
+        column = np.minimum(x.astype(int), n_beams - 1)
+        sector = np.arange(n_sectors)[:, np.newaxis]
+        beams = np.where(x - column < self.prob[sector, column], column, self.alias[sector, column])
+        beams[self.empty_sectors] = empty_beam
+        return beams
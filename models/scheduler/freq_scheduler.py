@@ -1,11 +1,12 @@
 import numpy as np
-import copy
+from numba import jit  # the Round-Robin allocation kernel is compiled with numba
 
 # The Freq_Scheduler class is responsable for all the different frequency schedullers. It will update the allocated
 # bandwidt for all UEs that are allocated in his BS in the variable self.user_bw.
 
 class Freq_Scheduler:
-    def __init__(self, bw, bs_index, scheduler_typ, bw_slot=None, tx_power=None, time_slot=None, simulation_time=None):
+    def __init__(self, bw, bs_index, scheduler_typ, bw_slot=None, tx_power=None, time_slot=None, simulation_time=None,
+                 pf_time_constant=None):
         self.bw = bw  # the maximum bs in a BS sector
         self.bs_index = bs_index
         self.user_bw = None  # the bw for all the UEs but it will only be updated for the bs_index ones for each obj
@@ -24,33 +25,35 @@ class Freq_Scheduler:
             if self.tx_power is None:
                 raise ValueError('Need to set Tx power(dBW) to use the Best-CQI scheduler')
 
-        if scheduler_typ == 'PF':  # need to create both BCQI and RR variables
-            self.fake_user_bw = None  # to preserve the RR scheduller after execute BCQI function
-            self.last_updated_beams = None  # to preserve the updated beams on the last update for the RR function
-            # RR variables
-            self.in_queue_ue = None  # queue of UEs to be served, if necessary
-            self.bw_slot = bw_slot  # if necessary, the size of a bandwidth slot
+        if scheduler_typ == 'PF':
+            self.bw_slot = bw_slot  # size of the bandwidth slots shared by the UEs of a beam
             if self.bw_slot is None:
                 raise ValueError('Need to set bw_slot(MHz) to use the Proportional Fair scheduler')
-            # BCQI variables
             self.tx_power = tx_power  # tx_power in dBW
-            # if simulation_time == 0:
-            #     print('ui')
-            self.time_ratio = time_slot / simulation_time  # ratio in (ms/ms)
-
+            if self.tx_power is None:
+                raise ValueError('Need to set Tx power(dBW) to use the Proportional Fair scheduler')
+            self.pf_time_constant = pf_time_constant  # time constant (in time slots) of the average throughput
+            if self.pf_time_constant is None:
+                raise ValueError('Need to set pf_time_constant(time slots) to use the Proportional Fair scheduler')
+            # the PF state is only kept for the UEs of this BS (pf_ues), in the same order of pf_ues
+            self.pf_ues = None  # UEs of the BS (in the UE_BS_Index order)
+            self.pf_rate = None  # achievable rate of each UE with all the sector bw
+            self.avg_throughput = None  # exponentially averaged throughput of each UE
+            self.pf_metric = None  # PF metric of each UE (achievable rate/average throughput)
 
         # TODO - ALTERAR AQUI PARA SEMPRE USAR O USER_BW PARA TODOS OS CASOS
-    def clear_RR_var(self):
-        self.user_bw = None
-        self.fake_user_bw = None
-        self.in_queue_ue = None
-        self.last_updated_beams = None
 
     def generate_proportional_beam_bw(self, active_beams):
         self.beam_bw = np.zeros(shape=active_beams.shape)
         self.beam_bw[active_beams != 0] = (self.bw / active_beams[active_beams != 0])
 
-    def generate_weighted_bw(self, ue_bs, active_beams, slice_util, beam_util):
+    def ue_in_beam(self, ue_bs, beam_index, sector_index, ue_index=None):
+        # UEs of this BS in a sector beam, in ascending UE order - sliced from the UE_BS_Index groups if available
+        if ue_index is not None:
+            return ue_index.ues(bs_index=self.bs_index, sector_index=sector_index, beam_index=beam_index)
+        return np.where((ue_bs.bs == self.bs_index) & (ue_bs.beam == beam_index) & (ue_bs.sector == sector_index))[0]
+
+    def generate_weighted_bw(self, ue_bs, active_beams, slice_util, beam_util, ue_index=None):
         # import timeit
         # self.beam_utility(ue_bs=ue_bs, bs_index=bs_index,
         #                   c_target=self.c_target)  # calculating the sector, beam and slice utilities
@@ -61,36 +64,63 @@ class Freq_Scheduler:
         # active_beams = self.active_beams != 0
         # bw_min[active_beams] = (self.bw / self.active_beams[active_beams]) / 10
 
-        self.user_bw = np.zeros(shape=ue_bs.shape[0])
+        self.user_bw = np.zeros(shape=ue_bs.n_ues)
 
         # start = timeit.default_timer()
-        for sector_index in np.unique(ue_bs[ue_bs[:, 0] == self.bs_index][:, 2]).astype(int):
-            for beam_index in np.unique(ue_bs[(ue_bs[:, 0] == self.bs_index) & (ue_bs[:, 2] == sector_index)][:, 1]).astype(int):
-                ue_in_beam_bs = np.where(
-                    (ue_bs[:, 0] == self.bs_index) & (ue_bs[:, 1] == beam_index) & (ue_bs[:, 2] == sector_index))
-                self.user_bw[ue_in_beam_bs] = bw_min[beam_index, sector_index] + \
-                                              (slice_util[ue_in_beam_bs] /
-                                               beam_util[beam_index, sector_index]) * (
-                                                          self.bw - ue_bs[ue_in_beam_bs].shape[0] * bw_min[
-                                                      beam_index, sector_index])
+        if ue_index is not None:  # the non-empty sector beams are read from the UE_BS_Index group sizes
+            [sector_index_list, beam_index_list] = np.nonzero(ue_index.group_sizes(bs_index=self.bs_index))
+        else:
+            sector_index_list = []
+            beam_index_list = []
+            for sector_index in np.unique(ue_bs.sector[ue_bs.bs == self.bs_index]).astype(int):
+                for beam_index in np.unique(ue_bs.beam[(ue_bs.bs == self.bs_index) & (ue_bs.sector == sector_index)]).astype(int):
+                    sector_index_list.append(sector_index)
+                    beam_index_list.append(beam_index)
+        for sector_index, beam_index in zip(sector_index_list, beam_index_list):
+            ue_in_beam_bs = self.ue_in_beam(ue_bs=ue_bs, beam_index=beam_index, sector_index=sector_index,
+                                            ue_index=ue_index)
+            self.user_bw[ue_in_beam_bs] = bw_min[beam_index, sector_index] + \
+                                          (slice_util[ue_in_beam_bs] /
+                                           beam_util[beam_index, sector_index]) * (
+                                                      self.bw - ue_in_beam_bs.shape[0] * bw_min[
+                                                  beam_index, sector_index])
         if np.sum(self.user_bw > 100) != 0:
             print('ui')
 
-    def generate_RR_bw(self, ue_bs, active_beams, updated_beams=None):
+    def beam_ue_groups(self, ue_bs, active_beams, ue_index=None):
+        # UEs of this BS sorted by sector/beam (ascending UE order inside a beam) and the start/size of each beam group
+        # in that array (beam x sector) - the input of rr_bw_kernel
+        n_beams, n_sectors = active_beams.shape
+        if ue_index is not None:
+            ues = ue_index.ues(bs_index=self.bs_index)
+            bs_offsets = ue_index.offsets[ue_index.group_index(bs_index=self.bs_index):
+                                          ue_index.group_index(bs_index=self.bs_index + 1) + 1]
+            group_start = (bs_offsets[:-1] - bs_offsets[0]).reshape(ue_index.n_sectors, ue_index.n_beams)
+            group_size = np.diff(bs_offsets).reshape(ue_index.n_sectors, ue_index.n_beams)
+        else:
+            ue_in_bs = np.where(ue_bs.bs == self.bs_index)[0]
+            group = ue_bs.sector[ue_in_bs].astype(int) * n_beams + ue_bs.beam[ue_in_bs]
+            ues = ue_in_bs[np.argsort(group, kind='stable')]
+            group_size = np.bincount(group, minlength=n_sectors * n_beams).reshape(n_sectors, n_beams)
+            group_start = (np.cumsum(group_size) - group_size.ravel()).reshape(n_sectors, n_beams)
+        return (ues.astype(np.int64), np.ascontiguousarray(group_start[:n_sectors, :n_beams].T, dtype=np.int64),
+                np.ascontiguousarray(group_size[:n_sectors, :n_beams].T, dtype=np.int64))
+
+    def generate_RR_bw(self, ue_bs, active_beams, updated_beams=None, ue_index=None, kernel=True):
         # This function will generate the bandwidth allocation for all users (self.user_bw) for all users for the BS
         # object. It will user the Round-Robin algorithm and will make a queue (self.in_queue_ue) that will iterate
         # within the simulations and store the next UE that will receive a bandwidth slot (bw_slot).
         # First, it resolves the queue (if possible) and next will allocate the bw_slots for the fist UE of a beam,
         # updating the queue in both cases when the available bw is not enough.
         # The user_bw is generated in the first time index and is just updated for the last active users.
-
-        ue_in_bs = ue_bs[:, 0] == self.bs_index
+        # If ue_index (UE_BS_Index) is passed, the UEs of a beam are sliced from it instead of scanning ue_bs.
+        # With kernel=True the allocation runs in the compiled rr_bw_kernel (same allocations of the Python code below)
 
         # checking the beams used in the last time index to be update (move the queue) and will erase the allocated
         # bandwidth for the last active users in the last active beams for the last time index
         if updated_beams is None:
             beams_2b_updtd = np.ones(shape=active_beams.shape, dtype=bool)
-            self.user_bw = np.zeros(shape=ue_bs.shape[0], dtype=int)
+            self.user_bw = np.zeros(shape=ue_bs.n_ues)  # float, bw_slot does not need to be an integer (MHz)
         else:
             beams_2b_updtd = np.zeros(shape=active_beams.shape, dtype=bool)
             non_empty_sectors = updated_beams <= (active_beams.shape[0] - 1)
@@ -99,7 +129,8 @@ class Freq_Scheduler:
 
             for sector_index in range(beams_2b_updtd.shape[1]):
                 beam_index = updated_beams[sector_index]
-                ue_to_erase_bw = ue_in_bs & (ue_bs[:, 1] == beam_index) & (ue_bs[:, 2] == sector_index)
+                ue_to_erase_bw = self.ue_in_beam(ue_bs=ue_bs, beam_index=beam_index, sector_index=sector_index,
+                                                 ue_index=ue_index)
                 self.user_bw[ue_to_erase_bw] = 0
 
         active_beams = active_beams.astype(int)
@@ -112,6 +143,13 @@ class Freq_Scheduler:
             print('ui')
         non_zero_beams = (active_beams != 0) & beams_2b_updtd
 
+        if kernel:
+            ues, group_start, group_size = self.beam_ue_groups(ue_bs=ue_bs, active_beams=active_beams,
+                                                               ue_index=ue_index)
+            rr_bw_kernel(self.user_bw, self.in_queue_ue, active_beams, non_zero_beams, n_bw_slots, self.bw_slot, ues,
+                         group_start, group_size)
+            return
+
         # =================  Dealing with the queue first ================
         if self.in_queue_ue is not None and np.sum(self.in_queue_ue) != 0:
             in_queue_beams = self.in_queue_ue != 0
@@ -123,8 +161,8 @@ class Freq_Scheduler:
             # this case is when the queue has LESS ues to be allocated than the number of slots (less_zero beams)
             [beam_index_list, sector_index_list] = np.where(less_zero)
             for [beam_index, sector_index] in zip(beam_index_list, sector_index_list):
-                ue_in_bs_beam_sec = np.where((ue_bs[:, 1] == beam_index) &
-                                            (ue_bs[:, 2] == sector_index) & ue_in_bs)[0]
+                ue_in_bs_beam_sec = self.ue_in_beam(ue_bs=ue_bs, beam_index=beam_index, sector_index=sector_index,
+                                                    ue_index=ue_index)
                 ue_to_receive_bw_min = ue_in_bs_beam_sec[range(self.in_queue_ue[beam_index, sector_index],
                                                         active_beams[beam_index, sector_index])]
                 self.user_bw[ue_to_receive_bw_min] += self.bw_slot
@@ -133,8 +171,8 @@ class Freq_Scheduler:
             # this case is when the queue has MORE UEs to be allocated than the number of slots (meq_zero berams)
             [beam_index_list, sector_index_list] = np.where(meq_zero)
             for [beam_index, sector_index] in zip(beam_index_list, sector_index_list):
-                ue_in_bs_beam_sec = np.where((ue_bs[:, 1] == beam_index) &
-                                                (ue_bs[:, 2] == sector_index) & ue_in_bs)[0]
+                ue_in_bs_beam_sec = self.ue_in_beam(ue_bs=ue_bs, beam_index=beam_index, sector_index=sector_index,
+                                                    ue_index=ue_index)
 
                 ue_to_receive_bw_min = ue_in_bs_beam_sec[range(self.in_queue_ue[beam_index, sector_index],
                                                                self.in_queue_ue[beam_index, sector_index] +
@@ -157,7 +195,8 @@ class Freq_Scheduler:
         while np.sum(less_zero) != 0:  # doing it until it falls in meq_zero
             [beam_index_list, sector_index_list] = np.where(less_zero)
             for [beam_index, sector_index] in zip(beam_index_list, sector_index_list):
-                ue_to_receive_bw_min = (ue_bs[:, 1] == beam_index) & (ue_bs[:, 2] == sector_index) & ue_in_bs
+                ue_to_receive_bw_min = self.ue_in_beam(ue_bs=ue_bs, beam_index=beam_index, sector_index=sector_index,
+                                                       ue_index=ue_index)
                 self.user_bw[ue_to_receive_bw_min] += self.bw_slot
 
             n_bw_slots[less_zero] -= active_beams[less_zero]
@@ -170,7 +209,8 @@ class Freq_Scheduler:
         [beam_index_list, sector_index_list] = np.where(meq_zero)
         while np.sum(meq_zero) != 0:
             for [beam_index, sector_index] in zip(beam_index_list, sector_index_list):
-                ue_to_receive_bw_min = np.where((ue_bs[:, 1] == beam_index) & (ue_bs[:, 2] == sector_index) & ue_in_bs)[0]
+                ue_to_receive_bw_min = self.ue_in_beam(ue_bs=ue_bs, beam_index=beam_index, sector_index=sector_index,
+                                                       ue_index=ue_index)
                 self.user_bw[ue_to_receive_bw_min[range(n_bw_slots[beam_index, sector_index].astype(int))]] += self.bw_slot
                 if active_beams[beam_index, sector_index] - n_bw_slots[beam_index, sector_index] > 0:
                     self.in_queue_ue[beam_index, sector_index] = n_bw_slots[beam_index, sector_index]
@@ -181,59 +221,173 @@ class Freq_Scheduler:
 
     def generate_best_CQI_bw(self, ue_bs, best_cqi_beams, active_beams=None, c_target=None):
         # this function execute the best channel (Best CQI) channel allocation for all sectors of a BS (self.bs_index)
+        # the UEs of the best CQI beam of each sector are served from the highest to the lowest CQI, each one receiving
+        # the bw it needs (or all the bw when c_target is not defined) until the sector bw ends
         from util.util_funcs import shannon_bw
 
-        self.user_bw = np.zeros(shape=ue_bs.shape[0])
+        self.user_bw = np.zeros(shape=ue_bs.n_ues)
         self.sector_bw = np.zeros(shape=best_cqi_beams.shape) + self.bw
 
-        ue_in_bs = ue_bs[:, 0] == self.bs_index  # UEs in self.bs_index filter
-        sector_ues_by_cqi = []  # UEs for each sector of self.bs_index (appended because of the different sizes)
-        index_controller = np.zeros(shape=best_cqi_beams.shape, dtype='int')   # index to control the BCQI queue allocation order
-        non_empty_sectors = np.ones(shape=best_cqi_beams.shape, dtype='bool')  # to filter the sectors without UE
-        # best_cqi_ue = np.zeros(shape=best_cqi_beams.shape)
-
-        all_ues_by_cqi = np.argsort(ue_bs[:, 3])[::-1]  # bcqi ues ordered from the highest to lowest
-        for sector_index in range(best_cqi_beams.shape[0]):
-            ues_in_best_cqi_beam = ue_in_bs & (ue_bs[:, 1] == best_cqi_beams[sector_index]) & (ue_bs[:, 2] == sector_index)
-            # best_cqi_ue[sector_index] = np.where(ues_in_best_cqi_beam & (ue_bs[:, 3] == ue_bs[ues_in_best_cqi_beam, 3].max()))  # REVER
-            sector_ues_by_cqi.append(all_ues_by_cqi[ues_in_best_cqi_beam[all_ues_by_cqi]])
-            if np.sum(ues_in_best_cqi_beam) == 0:
-                non_empty_sectors[sector_index] = False  # to discard empty sectors in the following operations
-
-        beam_queue_size = [len(x) - 1 for x in sector_ues_by_cqi]  # to avoid the index_controller to index over the bcqi queue
-        non_ended_list = np.ones(shape=best_cqi_beams.shape, dtype='bool')  # indicates the lists that still have UEs to allocate
-
-        while self.sector_bw.sum() != 0:
-            best_cqi_ue = np.array([x[index_controller[i]] if x.size != 0 else 0 for i, x in enumerate(sector_ues_by_cqi)])  # select the one UE for each sector using the index_controller
-            channels = ue_bs[best_cqi_ue, 3]
-            if c_target is not None:  # this if is for the case when de target capacity is not defined
-                bw_need = np.ceil(shannon_bw(bw=self.bw, tx_power=self.tx_power, channel_state=channels,
-                                     c_target=c_target[best_cqi_ue]) / self.time_ratio)
+        # UEs in the best CQI beam of their sector, sorted by sector and then from the highest to the lowest CQI
+        ue_in_bs = np.where(ue_bs.bs == self.bs_index)[0]
+        ue_sector = ue_bs.sector[ue_in_bs].astype(int)
+        ue_in_bs = ue_in_bs[ue_bs.beam[ue_in_bs] == best_cqi_beams[ue_sector]]
+        ue_sector = ue_bs.sector[ue_in_bs].astype(int)
+        cqi_order = np.lexsort((-ue_bs.csi[ue_in_bs], ue_sector))
+        sector_ues_by_cqi = ue_in_bs[cqi_order]
+        ue_sector = ue_sector[cqi_order]
+
+        if c_target is not None:  # this if is for the case when de target capacity is not defined
+            with np.errstate(divide='ignore'):  # UEs without capacity (csi = -inf) need an infinite bw
+                bw_need = np.ceil(shannon_bw(bw=self.bw, tx_power=self.tx_power, channel_state=ue_bs.csi[sector_ues_by_cqi],
+                                             c_target=c_target[sector_ues_by_cqi]) / self.time_ratio)
+            bw_need = np.minimum(bw_need, self.bw)  # no UE can take more than the sector bw (also removes the inf)
+        else:
+            bw_need = np.zeros(shape=sector_ues_by_cqi.shape) + self.bw
+
+        # bw already taken by the UEs with better CQI in the same sector (cumulative sum restarted in each sector)
+        cum_bw = np.cumsum(bw_need)
+        sector_first = np.searchsorted(ue_sector, np.arange(best_cqi_beams.shape[0]))  # 1st UE of each sector
+        sector_cum_bw = np.concatenate(([0], cum_bw))[sector_first]
+        bw_before = cum_bw - bw_need - sector_cum_bw[ue_sector]
+
+        # each UE receives what it needs, clipped to what is left in its sector
+        self.user_bw[sector_ues_by_cqi] = np.clip(self.bw - bw_before, 0, bw_need)
+        self.sector_bw -= np.bincount(ue_sector, weights=self.user_bw[sector_ues_by_cqi],
+                                      minlength=best_cqi_beams.shape[0])
+
+    def pf_metric_update(self, ue_bs, ue_updt=False, ue_index=None):
+        # updates the PF metric of the UEs of the BS: the achievable rate (only recalculated when the UE/BS association
+        # changes) over the exponentially averaged throughput - the state arrays are updated in place between the updates
+        # of the association and a UE that enters the BS starts with a zero average throughput
+        from util.util_funcs import shannon_cap
+
+        if ue_updt or self.pf_ues is None:
+            if ue_index is not None:
+                ue_in_bs = np.copy(ue_index.ues(bs_index=self.bs_index))
             else:
-                bw_need = np.zeros(shape=channels.shape) + self.bw
-
-            non_zero_bw = (self.sector_bw >= 0) & non_ended_list & non_empty_sectors  # controls the beams that still have available bw to allocate
-
-            over_bw = (bw_need < self.sector_bw) & non_zero_bw  # more bw than best cqi UE needs
-            lack_bw = (bw_need >= self.sector_bw) & non_zero_bw  # less bw than best cqi UE needs
-
-            self.user_bw[best_cqi_ue[lack_bw]] = self.sector_bw[lack_bw]
-            self.sector_bw[lack_bw] = 0
-
-            self.user_bw[best_cqi_ue[over_bw]] = bw_need[over_bw]
-            self.sector_bw[over_bw] -= bw_need[over_bw]
-
-            index_controller += 1
-            non_ended_list = np.array([index_controller[i] < beam_queue_size[i] for i, x in enumerate(sector_ues_by_cqi)])
-            index_controller[~non_ended_list] = 0
-            self.sector_bw[~non_ended_list] = 0
-
-    def backup_scheduler(self):
-        self.fake_user_bw = copy.deepcopy(self.user_bw)
-
-    def restore_scheduler(self):
-        self.user_bw = copy.deepcopy(self.fake_user_bw)
-        return self.last_updated_beams
+                ue_in_bs = np.where(ue_bs.bs == self.bs_index)[0]
+            avg_throughput = np.zeros(shape=ue_in_bs.shape[0])
+            if self.pf_ues is not None and self.pf_ues.size != 0:  # keeps the average throughput of the remaining UEs
+                old_order = np.argsort(self.pf_ues)
+                old_position = np.minimum(np.searchsorted(self.pf_ues[old_order], ue_in_bs), self.pf_ues.shape[0] - 1)
+                kept = self.pf_ues[old_order[old_position]] == ue_in_bs
+                avg_throughput[kept] = self.avg_throughput[old_order[old_position[kept]]]
+                if self.user_bw is not None:
+                    self.user_bw[self.pf_ues] = 0  # the UEs that left the BS are not served anymore
+            self.pf_ues = ue_in_bs
+            self.avg_throughput = avg_throughput
+            self.pf_rate = shannon_cap(bw=self.bw, tx_power=self.tx_power,
+                                       channel_state=ue_bs.csi[self.pf_ues].astype(float))
+            self.pf_metric = np.zeros(shape=self.pf_ues.shape[0])
+        np.maximum(self.avg_throughput, 1E-9, out=self.pf_metric)  # 1E-9 to prevent a div0
+        np.divide(self.pf_rate, self.pf_metric, out=self.pf_metric)
+
+    def generate_PF_bw(self, ue_bs, pf_beams):
+        # Proportional Fair allocation for all sectors of a BS (self.bs_index): the sector bw is split in bw_slot slots
+        # that are dealt one by one to the UEs of the PF beam of the sector, from the highest to the lowest PF metric
+        # (the spare bw goes to the first one), then the average throughput is updated in place with the served rates
+        if self.user_bw is None or self.user_bw.shape[0] != ue_bs.n_ues:
+            self.user_bw = np.zeros(shape=ue_bs.n_ues)
+        else:
+            self.user_bw[self.pf_ues] = 0  # only the UEs of this BS are allocated
+
+        # served UEs (positions in pf_ues) in the PF order of their sectors
+        pf_sector = ue_bs.sector[self.pf_ues].astype(int)
+        served = np.nonzero(ue_bs.beam[self.pf_ues] == pf_beams[pf_sector])[0]
+        ue_sector = pf_sector[served]
+        pf_order = np.lexsort((-self.pf_metric[served], ue_sector))
+        served = served[pf_order]
+        ue_sector = ue_sector[pf_order]
+
+        # position of each UE in the PF order of its sector and number of UEs in the sector PF beam
+        sector_size = np.bincount(ue_sector, minlength=pf_beams.shape[0])[ue_sector]
+        position = np.arange(served.shape[0]) - np.searchsorted(ue_sector, ue_sector)
+
+        n_bw_slots = np.floor(np.round(self.bw / self.bw_slot, 6)).astype(int)
+        ue_slots = n_bw_slots // sector_size + (position < n_bw_slots % sector_size)
+        served_bw = (ue_slots * self.bw_slot).astype(float)
+        served_bw[position == 0] += self.bw - n_bw_slots * self.bw_slot
+        self.user_bw[self.pf_ues[served]] = served_bw
+
+        # exponentially averaged throughput: every UE decays and the served ones add the rate of their allocated bw
+        self.avg_throughput *= 1 - 1 / self.pf_time_constant
+        self.avg_throughput[served] += (served_bw / self.bw) * self.pf_rate[served] / self.pf_time_constant
+
+
+@jit(nopython=True)
+def rr_bw_kernel(user_bw, in_queue_ue, active_beams, non_zero_beams, n_bw_slots, bw_slot, ues, group_start, group_size):
+    # Round-Robin allocation of Freq_Scheduler.generate_RR_bw for one BS (user_bw, in_queue_ue and n_bw_slots are
+    # updated in place). The UEs of the beam b of the sector s are ues[group_start[b, s]:group_start[b, s] +
+    # group_size[b, s]] and the beams are visited in the same (beam, sector) order of the np.where calls of the
+    # Python version, so both give the same allocations.
+    n_beams, n_sectors = active_beams.shape
+
+    # =================  Dealing with the queue first ================
+    if np.sum(in_queue_ue) != 0:
+        less_zero = np.zeros(shape=active_beams.shape, dtype=np.bool_)
+        meq_zero = np.zeros(shape=active_beams.shape, dtype=np.bool_)
+        for beam_index in range(n_beams):
+            for sector_index in range(n_sectors):
+                if in_queue_ue[beam_index, sector_index] != 0 and non_zero_beams[beam_index, sector_index]:
+                    if active_beams[beam_index, sector_index] - in_queue_ue[beam_index, sector_index] - \
+                            n_bw_slots[beam_index, sector_index] >= 0:
+                        meq_zero[beam_index, sector_index] = True
+                    else:
+                        less_zero[beam_index, sector_index] = True
+
+        # the queue has LESS ues to be allocated than the number of slots
+        for beam_index in range(n_beams):
+            for sector_index in range(n_sectors):
+                if less_zero[beam_index, sector_index]:
+                    start = group_start[beam_index, sector_index]
+                    first = in_queue_ue[beam_index, sector_index]
+                    last = min(active_beams[beam_index, sector_index], group_size[beam_index, sector_index])
+                    for i in range(first, last):
+                        user_bw[ues[start + i]] += bw_slot
+                    n_bw_slots[beam_index, sector_index] -= max(last - first, 0)
+
+        # the queue has MORE UEs to be allocated than the number of slots
+        for beam_index in range(n_beams):
+            for sector_index in range(n_sectors):
+                if meq_zero[beam_index, sector_index]:
+                    start = group_start[beam_index, sector_index]
+                    first = in_queue_ue[beam_index, sector_index]
+                    last = min(first + n_bw_slots[beam_index, sector_index], group_size[beam_index, sector_index])
+                    for i in range(first, last):
+                        user_bw[ues[start + i]] += bw_slot
+                    in_queue_ue[beam_index, sector_index] += n_bw_slots[beam_index, sector_index]
+                    n_bw_slots[beam_index, sector_index] = 0
+
+    # ====================== Dealing with the rest of bw_slots without queue ==============
+    beams_w_bw_slots = (n_bw_slots != 0) & non_zero_beams
+    dummy_queue = np.zeros(shape=active_beams.shape, dtype=np.int64)
+    for beam_index in range(n_beams):
+        for sector_index in range(n_sectors):
+            if beams_w_bw_slots[beam_index, sector_index]:
+                dummy_queue[beam_index, sector_index] = active_beams[beam_index, sector_index] - \
+                                                        n_bw_slots[beam_index, sector_index]
+
+    # first, allocate bw_slots for all UEs of a beam while there are more slots than UEs
+    less_zero = (dummy_queue < 0) & beams_w_bw_slots
+    while np.sum(less_zero) != 0:
+        for beam_index in range(n_beams):
+            for sector_index in range(n_sectors):
+                if less_zero[beam_index, sector_index]:
+                    start = group_start[beam_index, sector_index]
+                    for i in range(group_size[beam_index, sector_index]):
+                        user_bw[ues[start + i]] += bw_slot
+                    n_bw_slots[beam_index, sector_index] -= active_beams[beam_index, sector_index]
+        dummy_queue = active_beams - n_bw_slots
+        less_zero = (dummy_queue < 0) & beams_w_bw_slots
 
-    def backup_updated_beams(self, updated_beams):
-        self.last_updated_beams = updated_beams
+    # second, allocate the remaining bw_slots to the first UEs of a beam and queue the next UE
+    for beam_index in range(n_beams):
+        for sector_index in range(n_sectors):
+            if dummy_queue[beam_index, sector_index] >= 0 and beams_w_bw_slots[beam_index, sector_index]:
+                start = group_start[beam_index, sector_index]
+                for i in range(min(n_bw_slots[beam_index, sector_index], group_size[beam_index, sector_index])):
+                    user_bw[ues[start + i]] += bw_slot
+                if active_beams[beam_index, sector_index] - n_bw_slots[beam_index, sector_index] > 0:
+                    in_queue_ue[beam_index, sector_index] = n_bw_slots[beam_index, sector_index]
+                n_bw_slots[beam_index, sector_index] = 0
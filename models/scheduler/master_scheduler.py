@@ -13,7 +13,7 @@ class Master_scheduler:
 
 
     def create_uplink(self, scheduler_typ, bs_index, bw, simulation_time, time_slot, t_min=None, bw_slot=None,
-                 c_target=None, tx_power=None):
+                 c_target=None, tx_power=None, pf_time_constant=None, rng=None):
         if self.tdd_scheduler is not None:
             simulation_time = np.sum(self.tdd_scheduler == 1)
         # else:
@@ -21,10 +21,11 @@ class Master_scheduler:
 
         self.up_scheduler = Scheduler(scheduler_typ=scheduler_typ, bs_index=bs_index, bw=bw,
                                       simulation_time=simulation_time, time_slot=time_slot, t_min=t_min,
-                                      bw_slot=bw_slot, c_target=c_target, tx_power=tx_power)
+                                      bw_slot=bw_slot, c_target=c_target, tx_power=tx_power,
+                                      pf_time_constant=pf_time_constant, rng=rng)
 
     def create_downlink(self, scheduler_typ, bs_index, bw, time_slot, simulation_time, t_min=None, bw_slot=None,
-                 c_target=None, tx_power=None):
+                 c_target=None, tx_power=None, pf_time_constant=None, rng=None):
         if self.tdd_scheduler is not None:
             # self.dwn_time = np.sum(self.tdd_scheduler == 0)
             simulation_time = np.sum(self.tdd_scheduler == 0)
@@ -32,7 +33,8 @@ class Master_scheduler:
         #     print('No tdd/fdd selected using only the downlink scheduler')
         self.dwn_scheduler = Scheduler(scheduler_typ=scheduler_typ, bs_index=bs_index, bw=bw,
                                        simulation_time=simulation_time, time_slot=time_slot, t_min=t_min,
-                                       bw_slot=bw_slot, c_target=c_target, tx_power=tx_power)
+                                       bw_slot=bw_slot, c_target=c_target, tx_power=tx_power,
+                                       pf_time_constant=pf_time_constant, rng=rng)
 
     def create_tdd_scheduler(self, simulation_time, t_index=0, up_tdd_time=0.3):
         self.up_tdd_time = up_tdd_time
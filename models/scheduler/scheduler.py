@@ -11,7 +11,7 @@ from numpy import ceil
 
 class Scheduler:
     def __init__(self, scheduler_typ, bs_index, bw, simulation_time, time_slot, t_min=None, bw_slot=None,
-                 c_target=None, tx_power=None):
+                 c_target=None, tx_power=None, pf_time_constant=None, rng=None):
         self.scheduler_typ = scheduler_typ  # its a string representing the choosen scheduller
         self.bw = bw  # the bandwidth available for each BS sector (MHz)
         self.t_index = None  # indicates the last t_index when the scheduler is called
@@ -21,46 +21,50 @@ class Scheduler:
             self.util_fn = Util_fn(bs_index=bs_index, c_target=c_target, tx_power=tx_power, bw=bw)
             self.freq_scheduler = Freq_Scheduler(bw=bw, bs_index=bs_index, scheduler_typ=scheduler_typ)
             self.time_scheduler = Time_Scheduler(simulation_time=simulation_time, scheduler_typ=scheduler_typ,
-                                                 bs_index=bs_index, time_slot=time_slot, t_min=t_min)
+                                                 bs_index=bs_index, time_slot=time_slot, t_min=t_min,
+                                                 rng=rng)
         elif self.scheduler_typ == 'RR':
             self.freq_scheduler = Freq_Scheduler(bw=bw, bs_index=bs_index, scheduler_typ=scheduler_typ, bw_slot=bw_slot)
             self.time_scheduler = Time_Scheduler(simulation_time=simulation_time, scheduler_typ=scheduler_typ,
-                                                 bs_index=bs_index, time_slot=time_slot)
+                                                 bs_index=bs_index, time_slot=time_slot, rng=rng)
         elif self.scheduler_typ == 'BCQI':
             self.freq_scheduler = Freq_Scheduler(bw=bw, bs_index=bs_index, scheduler_typ=scheduler_typ,
                                                  tx_power=tx_power, simulation_time=simulation_time,
                                                  time_slot=time_slot)
             self.time_scheduler = Time_Scheduler(simulation_time=simulation_time, scheduler_typ=scheduler_typ,
-                                                 bs_index=bs_index, time_slot=time_slot)
+                                                 bs_index=bs_index, time_slot=time_slot, rng=rng)
         elif self.scheduler_typ == 'PF':
             self.freq_scheduler = Freq_Scheduler(bw=bw, bs_index=bs_index, scheduler_typ=scheduler_typ, bw_slot=bw_slot,
-                                                 tx_power=tx_power, simulation_time=simulation_time, time_slot=time_slot)
+                                                 tx_power=tx_power, pf_time_constant=pf_time_constant)
             self.time_scheduler = Time_Scheduler(simulation_time=simulation_time,
-                                                 scheduler_typ=scheduler_typ, bs_index=bs_index, time_slot=time_slot)
-            # 0 if is best cqi time or 1 if its next UE (like RR) -> [time, frequency]
-            # it is a list because of the time/frequency scheduler separation -> [time, frequency]
-            self.scheduler_status = [0, 0]  # it starts with the BCQI state
+                                                 scheduler_typ=scheduler_typ, bs_index=bs_index, time_slot=time_slot,
+                                                 rng=rng)
         else:
             raise ValueError('Invalid scheduler type! Please check the param.yml file.')
 
-    def update_scheduler(self, active_beams, ue_bs, t_index=0, c_target=None, ue_updt=False, updated_beams=None):
+    def update_scheduler(self, active_beams, ue_bs, t_index=0, c_target=None, ue_updt=False, updated_beams=None,
+                         ue_index=None):
         # this is the function responsible to call the general time and frequency functions to update the schedulers,
         # if necessary
+        # ue_index is the UE_BS_Index of ue_bs (UEs grouped by bs/sector/beam), if None the ue_bs table is scanned
         # print(self.scheduler_status)
         self.generate_beam_bw(active_beams=active_beams, t_index=t_index, ue_bs=ue_bs,
-                              c_target=c_target, ue_updt=ue_updt, updated_beams=updated_beams)
+                              c_target=c_target, ue_updt=ue_updt, updated_beams=updated_beams, ue_index=ue_index)
         self.generate_beam_timing(ue_bs=ue_bs, active_beams=active_beams, t_index=t_index,
-                                  c_target=c_target, ue_updt=ue_updt)
+                                  c_target=c_target, ue_updt=ue_updt, ue_index=ue_index)
 
-    def generate_beam_bw(self, active_beams, t_index, ue_bs=None, c_target=None, ue_updt=False, updated_beams=None):
+    def generate_beam_bw(self, active_beams, t_index, ue_bs=None, c_target=None, ue_updt=False, updated_beams=None,
+                         ue_index=None):
         # this function is responsable to call the frequency schedulers for the chosen scheduler_typ
         if self.scheduler_typ == 'RR':
             if self.t_index != t_index:
                 self.t_index = t_index
-                self.freq_scheduler.generate_RR_bw(ue_bs=ue_bs, active_beams=active_beams, updated_beams=updated_beams)
+                self.freq_scheduler.generate_RR_bw(ue_bs=ue_bs, active_beams=active_beams, updated_beams=updated_beams,
+                                                   ue_index=ue_index)
         elif self.scheduler_typ == 'prop-smp' or self.scheduler_typ == 'prop-cmp':
             if ue_bs is not None or c_target is not None:
-                self.util_bsd_bw(active_beams=active_beams, t_index=t_index, ue_bs=ue_bs, c_target=c_target)
+                self.util_bsd_bw(active_beams=active_beams, t_index=t_index, ue_bs=ue_bs, c_target=c_target,
+                                 ue_index=ue_index)
                 # self.generate_weighted_bw(ue_bs=ue_bs, bs_index=self.bs_index, active_beams=active_beams, t_index=t_index)
             else:
                 raise ValueError('The scheduler type is typed wrong or its not supported! Please check the param.yml file.')
@@ -70,24 +74,13 @@ class Scheduler:
             self.freq_scheduler.generate_best_CQI_bw(ue_bs=ue_bs, best_cqi_beams=self.time_scheduler.best_cqi_beams,
                                                      c_target=c_target)
         elif self.scheduler_typ == 'PF':
-            if ue_updt:
-                # print('ue_updt ' + str(t_index))
-                self.freq_scheduler.clear_RR_var()
-            if self.scheduler_status[1] == 0:  # if its BCQI step
-                if self.time_scheduler.best_cqi_beams is None or self.t_index != t_index:
-                    self.generate_beam_timing(ue_bs=ue_bs, active_beams=active_beams, t_index=t_index)
-                self.freq_scheduler.generate_best_CQI_bw(ue_bs=ue_bs, best_cqi_beams=self.time_scheduler.best_cqi_beams,
-                                                         c_target=c_target)
-                self.scheduler_status[1] = 1  # changing the status for the next step
-                self.freq_scheduler.backup_updated_beams(updated_beams)
-            else:  # it is next UE step (RR algorithm)
-                self.scheduler_status[1] = 0  # changing the status for the next step
-                updated_beams = self.freq_scheduler.restore_scheduler()  # because the bcqi scheduller will write over the RR one
-                self.freq_scheduler.generate_RR_bw(ue_bs=ue_bs, active_beams=active_beams,
-                                                   updated_beams=updated_beams)
-                self.freq_scheduler.backup_scheduler()  # making the backup for the next time RR is used
+            # the PF metric picks the beams (time scheduler) and then the UEs served in them (frequency scheduler)
+            if self.t_index != t_index:
+                self.freq_scheduler.pf_metric_update(ue_bs=ue_bs, ue_updt=ue_updt, ue_index=ue_index)
+                self.generate_beam_timing(ue_bs=ue_bs, active_beams=active_beams, t_index=t_index)
+                self.freq_scheduler.generate_PF_bw(ue_bs=ue_bs, pf_beams=self.time_scheduler.best_pf_beams)
 
-    def generate_beam_timing(self, ue_bs, active_beams, t_index=0, c_target=None, ue_updt=False):
+    def generate_beam_timing(self, ue_bs, active_beams, t_index=0, c_target=None, ue_updt=False, ue_index=None):
         # reminder: t_min is the minimum reserved per beam time
         # this function is responsible to call the time schedulers and auxiliary functions for the chosen scheduler_typ
         if t_index == 0:
@@ -98,9 +91,9 @@ class Scheduler:
             if ue_updt:
                 if t_index != self.t_index:
                     self.t_index = t_index
-                    self.util_fn.update_c_target(c_target=c_target, shape=ue_bs.shape[0])
+                    self.util_fn.update_c_target(c_target=c_target, shape=ue_bs.n_ues)
                     self.util_fn.slice_utility(ue_bs=ue_bs, active_beams=active_beams)
-                    self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams)
+                    self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams, ue_index=ue_index)
                 self.util_fn.sector_utility()
                 self.time_scheduler.generate_utility_based_beam_timing(t_index=t_index, ue_bs=ue_bs,
                                                                        active_beams=active_beams,
@@ -111,7 +104,7 @@ class Scheduler:
             if ue_updt:
                 if t_index != self.t_index:
                     self.t_index = t_index
-                    self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams)
+                    self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams, ue_index=ue_index)
                 self.util_fn.sector_utility()
                 self.time_scheduler.generate_utility_based_beam_timing(t_index=t_index, ue_bs=ue_bs,
                                                                        active_beams=active_beams,
@@ -131,42 +124,28 @@ class Scheduler:
         elif self.scheduler_typ == 'PF':
             if t_index != self.t_index:
                 self.t_index = t_index
-                if self.scheduler_status[0] == -1:
-                    status = 0
-                else:
-                    status = self.scheduler_status[0]
-
-                self.time_scheduler.generate_proportional_fair_timing(ue_bs=ue_bs, active_beams=active_beams,
-                                                                      t_index=t_index, ue_updt=ue_updt,
-                                                                      status=status)
-                if self.scheduler_status[0] == 0:  # if its BCQI step
-                    self.scheduler_status[0] = 1  # changing the status for the next step
-                        # self.time_scheduler.generate_best_cqi_beam_timing(ue_bs=ue_bs)
-                    # todo - colocar aqui para marcar o UE como atendido nesse step para o próximo
-                else:  # it is next UE step
-                    self.scheduler_status[0] = 0  # changing the status for the next step
-                    # if ue_updt:  # todo - pensar se precisa desse check nesse caso especial
-                    #     self.time_scheduler.generate_ue_qtd_proportional_beam_timing(active_beams=active_beams,
-                    #                                                                  t_index=t_index)
-                    # todo - ver o que fazer aqui (chamar a função de update de time scheduler para PF)
+                self.time_scheduler.generate_pf_beam_timing(ue_bs=ue_bs, pf_ues=self.freq_scheduler.pf_ues,
+                                                            pf_metric=self.freq_scheduler.pf_metric)
 
-    def util_bsd_bw(self, active_beams, t_index, ue_bs, c_target=None, ue_updt=False):
+    def util_bsd_bw(self, active_beams, t_index, ue_bs, c_target=None, ue_updt=False, ue_index=None):
         # this function is exclusive for the proposed utility-based scheduler call and auxiliary functions (util_fn object)
         if self.scheduler_typ == 'prop-smp':
             if t_index == 0:
-                self.util_fn.update_c_target(shape=ue_bs.shape[0])
+                self.util_fn.update_c_target(shape=ue_bs.n_ues)
                 self.util_fn.slice_utility(ue_bs=ue_bs, active_beams=active_beams)
                 if t_index != self.t_index:
                     self.t_index = t_index
-                    self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams)
+                    self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams, ue_index=ue_index)
                 self.freq_scheduler.generate_weighted_bw(ue_bs=ue_bs, active_beams=active_beams,
-                                                         slice_util=self.util_fn.slice_util, beam_util=self.util_fn.beam_util)
+                                                         slice_util=self.util_fn.slice_util, beam_util=self.util_fn.beam_util,
+                                                         ue_index=ue_index)
         elif self.scheduler_typ == 'prop-cmp':
             if t_index != self.t_index:
                 self.t_index = t_index
-                self.util_fn.update_c_target(c_target=c_target, shape=ue_bs.shape[0])
+                self.util_fn.update_c_target(c_target=c_target, shape=ue_bs.n_ues)
                 self.util_fn.slice_utility(ue_bs=ue_bs, active_beams=active_beams)
-                self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams)
+                self.util_fn.beam_utility(ue_bs=ue_bs, active_beams=active_beams, ue_index=ue_index)
             self.freq_scheduler.generate_weighted_bw(ue_bs=ue_bs, active_beams=active_beams,
-                                                     slice_util=self.util_fn.slice_util, beam_util=self.util_fn.beam_util)
+                                                     slice_util=self.util_fn.slice_util, beam_util=self.util_fn.beam_util,
+                                                     ue_index=ue_index)
 
@@ -1,53 +1,92 @@
 import copy
 import numpy as np
+from models.scheduler.alias_sampler import Alias_Sampler
 
 # The Time_Scheduler class is responsable for all the different time schedullers. It will generate time-indexed
 # allocation for all remaining simulation time
 
 class Time_Scheduler:
-    def __init__(self, simulation_time, time_slot, scheduler_typ, bs_index, t_min=None):
+    def __init__(self, simulation_time, time_slot, scheduler_typ, bs_index, t_min=None, rng=None):
         self.simulation_time = simulation_time  # the number of time slots that will comprise the simulation time
         self.time_slot = time_slot  # the lenght of a time slot (in ms)
         self.bs_index = bs_index  # the index of the base station associated with the scheduler
+        self.rng = rng if rng is not None else np.random.default_rng()  # numpy Generator of the draws (see util.seeds)
 
         # calculated variables
         self.beam_timing = None
-        self.beam_timing_sequence = None
+        self.beam_timing_sequence = None  # beams of the time slots already generated (sectors x time slots)
+        self.beam_timing_beams = None  # if not None, the beams (one per sector) active in all time slots
+        self.beam_timing_next_slots = None  # function that generates the beams of the next n time slots
         self.active_beams_index = None
         self.n_sectors = None  # this variable is used to shape the dimensions of some matrices
         self.n_beams = None  # this variable is used to shape the dimensions of some matrices
         if scheduler_typ == 'prop-cmp' or scheduler_typ == 'prop-smp':
             self.weighted_act_beams = None
+            self.beam_sampler = None  # alias sampler of weighted_act_beams (rebuilt only when the weights change)
             if t_min is not None:
                 self.t_min = t_min
             else:
                 raise ValueError('Need to set t_min when using schedulers prop-cmp or prop-smp.')
-        if scheduler_typ == 'BCQI' or scheduler_typ == 'PF':
-            self.fake_beam_timing_sequence = None
+        if scheduler_typ == 'BCQI':
             self.best_cqi_beams = None
-            self.even_or_odd = None
+        if scheduler_typ == 'PF':
+            self.best_pf_beams = None  # beams of the next time slot chosen by the PF metric
 
     def set_base_dimensions(self, n_sectors, n_beams):
         self.n_sectors = n_sectors  # this variable is used to shape the dimensions of some matrices
         self.n_beams = n_beams  # this variable is used to shape the dimensions of some matrices
 
+    def set_beam_timing(self, beams=None, next_slots=None):
+        # starts a new beam timing, generated on demand (only for the time slots that are asked by active_beams_block)
+        # beams: the same beams (one per sector) are active in every time slot
+        # next_slots: function returning the beams (sectors x n) of the next n time slots (stored in beam_timing_sequence)
+        self.beam_timing_beams = beams
+        self.beam_timing_next_slots = next_slots
+        self.beam_timing_sequence = np.zeros(shape=(self.n_sectors, 0), dtype=int)
+
+    def active_beams_block(self, t_index, n_slots=1):
+        # returns the active beams (sectors x n_slots) of the time slots t_index to t_index + n_slots - 1 of the
+        # current beam timing, generating the time slots that are still missing
+        if self.beam_timing_beams is not None:
+            return np.broadcast_to(self.beam_timing_beams[:, np.newaxis], shape=(self.n_sectors, n_slots))
+        missing = t_index + n_slots - self.beam_timing_sequence.shape[1]
+        if missing > 0:  # at least doubling the generated sequence to amortize the concatenation copies
+            new_slots = self.beam_timing_next_slots(max(missing, self.beam_timing_sequence.shape[1]))
+            self.beam_timing_sequence = np.concatenate((self.beam_timing_sequence, new_slots), axis=1)
+        return self.beam_timing_sequence[:, t_index:t_index + n_slots]
+
+    def active_beams_at(self, t_index):
+        # returns the active beam of each sector in the time slot t_index of the current beam timing
+        return self.active_beams_block(t_index=t_index)[:, 0].copy()
+
     def generate_proportional_beam_timing(self, time_slot, active_beams):
         # this function will generate an equal time distribution for all active beams
         self.beam_timing = [None] * active_beams.shape[1]  # CHECAR SE ESSE CHAPE DÁ A DIMESÃO DE 3 BEAMS !!!!
         for sector_index, _ in enumerate(self.beam_timing):
             sector = np.where(active_beams[:, sector_index] != 0)[0]
-            np.random.shuffle(sector)  # randomizing the beam timing sequence
+            self.rng.shuffle(sector)  # randomizing the beam timing sequence
             self.beam_timing[sector_index] = sector  # I really dont know why this line is needed to this code to work!!!
-
-        self.beam_timing_sequence = \
-            np.zeros(shape=(active_beams.shape[1], np.round(self.simulation_time / time_slot).astype(int))) \
-            + self.n_beams # filling the initial beam_timing_sequence with beam_index that non exist
-        for time in np.arange(0, self.simulation_time, time_slot):
-            self.next_active_beam()
-            for sector_index, sector in enumerate(self.beam_timing):
-                if self.beam_timing[sector_index].size != 0:
-                    self.beam_timing_sequence[sector_index, time] = self.beam_timing[sector_index][
-                        self.active_beams_index[sector_index].astype(int)]
+        self.set_beam_timing(next_slots=self.next_proportional_time_slots)
+
+    def next_proportional_time_slots(self, n_slots):
+        # beams of the next n_slots time slots of generate_proportional_beam_timing: the beams of a sector are active in
+        # turns, like a queue that restarts from its first position after the last beam (or if the last position is out
+        # of the current beam list)
+        beam_timing_sequence = np.zeros(shape=(self.n_sectors, n_slots), dtype=int) + self.n_beams  # filling the
+        # initial beam_timing_sequence with beam_index that non exist
+        if self.active_beams_index is None:
+            first = np.zeros(shape=self.n_sectors, dtype=int)
+        else:
+            first = self.active_beams_index.astype(int) + 1
+        self.active_beams_index = np.zeros(shape=self.n_sectors, dtype=int)
+        for sector_index, sector in enumerate(self.beam_timing):
+            if sector.size != 0:
+                if first[sector_index] > sector.size - 1:
+                    first[sector_index] = 0
+                positions = (first[sector_index] + np.arange(n_slots)) % sector.size
+                beam_timing_sequence[sector_index] = sector[positions]
+                self.active_beams_index[sector_index] = positions[-1]
+        return beam_timing_sequence
 
     def generate_ue_qtd_proportional_beam_timing(self, active_beams, t_index):
         #  this function will allocate the beams times based on the quantities of active UEs in each beam
@@ -69,16 +108,13 @@ class Time_Scheduler:
         self.generate_weighted_time_matrix2(simulation_time=self.simulation_time - t_index)  # testing
 
     def generate_best_cqi_beam_timing(self, ue_bs):
-        self.beam_timing_sequence = np.zeros(shape=(self.n_sectors,
-                                    np.round(self.simulation_time / self.time_slot).astype(int)), dtype='int') + self.n_beams
         self.best_cqi_beams = np.zeros(shape=self.n_sectors, dtype='int') + self.n_beams
         for sector_index in range(self.n_sectors):
-            active_ue_in_bs_sec = (ue_bs[:, 0] == self.bs_index) & (ue_bs[:, 2] == sector_index)
+            active_ue_in_bs_sec = (ue_bs.bs == self.bs_index) & (ue_bs.sector == sector_index)
             if np.sum(active_ue_in_bs_sec) != 0:
-                best_cqi_beam = ue_bs[active_ue_in_bs_sec][np.argmax(ue_bs[active_ue_in_bs_sec][:, 3]), 1]
+                best_cqi_beam = ue_bs.beam[active_ue_in_bs_sec][np.argmax(ue_bs.csi[active_ue_in_bs_sec])]
                 self.best_cqi_beams[sector_index] = best_cqi_beam
-                self.beam_timing_sequence[sector_index, :] = best_cqi_beam
-        # self.beam_timing_sequence[range(self.n_sectors), :] = self.best_cqi_beams[range(self.n_sectors)]
+        self.set_beam_timing(beams=self.best_cqi_beams)  # the best CQI beams are active in all time slots
 
     def generate_weighted_time_matrix(self, simulation_time):
         # this function generates a complete time allocation for all the beams for each sector of the BS
@@ -88,7 +124,7 @@ class Time_Scheduler:
 
         for sector_index, _ in enumerate(self.beam_timing):
             sector = np.where(self.weighted_act_beams[:, sector_index] != 0)[0]
-            sector = sector[np.random.permutation(sector.shape[0])]  # randomizing the beam timing sequence
+            sector = sector[self.rng.permutation(sector.shape[0])]  # randomizing the beam timing sequence
 
             ordened_weighted_beams = copy.copy(self.weighted_act_beams[:, sector_index])
             self.weighted_act_beams[:, sector_index] = 0
@@ -97,39 +133,70 @@ class Time_Scheduler:
             self.beam_timing[
                 sector_index] = sector  # I really dont know why this line is needed to this code to work!!!
 
-        self.beam_timing_sequence = np.zeros(
-            shape=(self.n_sectors,
-                   np.round(simulation_time / self.time_slot).astype(
-                       int))) + self.n_beams  # filling the initial beam_timing_sequence with beam_index that non exist
-        wighted_act_beams_bkp = copy.copy(self.weighted_act_beams)
-        for time in np.arange(0, simulation_time, self.time_slot):
-            wighted_act_beams = self.next_weighted_active_beam(
-                self.weighted_act_beams)  # passing the beam list with how many times each beam need to be active
-            for sector_index, _ in enumerate(self.beam_timing):
-                if self.active_beams_index[sector_index].astype(int) == -1:
-                    self.active_beams_index[sector_index] = 0
-                    wighted_act_beams[:, sector_index] = wighted_act_beams_bkp[:, sector_index]
-                if self.beam_timing[sector_index].size != 0:
-                    self.beam_timing_sequence[sector_index, time] = self.beam_timing[sector_index][
-                        self.active_beams_index[sector_index].astype(int)]
-
-        self.beam_timing_sequence = self.beam_timing_sequence.astype(int)
+        # the queue of each sector is periodic: from its first position, each beam is active as many times as its weight
+        # and then the weights are restarted (in a time slot of the first beam), so it is stepped only once for each
+        # sector and the time slots are read from the (prefix, cycle) positions of the queue
+        if self.active_beams_index is None:
+            self.active_beams_index = np.zeros(shape=self.n_sectors).astype(int)
+        self.weighted_queue = []
+        for sector_index in range(self.n_sectors):
+            cycle = self.weighted_queue_positions(weights=self.weighted_act_beams[:, sector_index], beam_index=0)
+            if self.active_beams_index[sector_index] != 0:
+                prefix = self.weighted_queue_positions(weights=self.weighted_act_beams[:, sector_index],
+                                                       beam_index=self.active_beams_index[sector_index])
+            else:
+                prefix = cycle
+            self.weighted_queue.append((prefix, cycle))
+        self.weighted_queue_slots = 0  # number of time slots already generated from the queues
+        self.set_beam_timing(next_slots=self.next_weighted_time_slots)
+
+    def weighted_queue_positions(self, weights, beam_index):
+        # positions of a sector queue from beam_index until the weights are restarted: the next position is the first
+        # beam with a remaining weight after the current one (looping into the first position)
+        weights = copy.copy(weights)
+        positions = []
+        while np.sum(weights) != 0:
+            beam_index += 1
+            if beam_index > len(weights) - 1:
+                beam_index = 0
+            while weights[beam_index] == 0:  # pick the 1st nonzero occurence after beam_index
+                beam_index += 1
+                if beam_index > len(weights) - 1:  # loops into the first position otherwise
+                    beam_index = 0
+            weights[beam_index] -= 1
+            positions.append(beam_index)
+        positions.append(0)  # the time slot where the weights are restarted
+        return np.array(positions, dtype=int)
+
+    def next_weighted_time_slots(self, n_slots):
+        # beams of the next n_slots time slots of generate_weighted_time_matrix
+        beam_timing_sequence = np.zeros(shape=(self.n_sectors, n_slots), dtype=int) + self.n_beams  # filling the
+        # initial beam_timing_sequence with beam_index that non exist
+        time = self.weighted_queue_slots + np.arange(n_slots)
+        for sector_index, (prefix, cycle) in enumerate(self.weighted_queue):
+            positions = np.where(time < prefix.size, prefix[np.minimum(time, prefix.size - 1)],
+                                 cycle[(time - prefix.size) % cycle.size])
+            self.active_beams_index[sector_index] = positions[-1]
+            if self.beam_timing[sector_index].size != 0:
+                beam_timing_sequence[sector_index] = self.beam_timing[sector_index][positions]
+        self.weighted_queue_slots += n_slots
+        return beam_timing_sequence
 
     def generate_weighted_time_matrix2(self, simulation_time):
-        # self.beam_timing = [None] * self.n_sectors
-        self.beam_timing_sequence = np.zeros(shape=(self.n_sectors, np.round(
-            simulation_time / self.time_slot).astype(int)), dtype=int) + self.n_beams  # filling the initial beam_timing_sequence with beam_index that non exist
-        for sector_index in range(self.n_sectors):
-            if np.sum(self.weighted_act_beams[:, sector_index]) != 0:
-                p = self.weighted_act_beams[:, sector_index]/np.sum(self.weighted_act_beams[:, sector_index])
-                self.beam_timing_sequence[sector_index] = np.random.choice(a=range(self.weighted_act_beams[:, sector_index].size), p=p, size=simulation_time)
+        # the beam of each time slot is drawn with a probability proportional to its weight (weighted_act_beams)
+        if self.beam_sampler is None or not self.beam_sampler.same_weights(self.weighted_act_beams):
+            self.beam_sampler = Alias_Sampler(weights=self.weighted_act_beams)
+        self.set_beam_timing(next_slots=self.next_random_time_slots)
 
+    def next_random_time_slots(self, n_slots):
+        # beams of the next n_slots time slots of generate_weighted_time_matrix2 (one batched draw for all sectors)
+        return self.beam_sampler.draw(n_slots=n_slots, empty_beam=self.n_beams, rng=self.rng)
 
     def generate_utility_weighted_beam_time(self, t_total, ue_bs, t_min, active_beams, beam_util, beam_util_log, sector_util):
         # this function calculates the allocation time for each beam based on the bema and sector utilities
         t_beam = np.zeros(shape=beam_util.shape)
 
-        sector_index = np.unique(ue_bs[ue_bs[:, 0] == self.bs_index][:, 2]).astype(int)
+        sector_index = np.unique(ue_bs.sector[ue_bs.bs == self.bs_index]).astype(int)
         non_zero = (beam_util[:, sector_index] != 0)  # to prevent a divide by zero occurence
 
         t_beam[beam_util != 0] = (t_min + (beam_util_log[:, sector_index] / sector_util[sector_index])
@@ -137,69 +204,13 @@ class Time_Scheduler:
 
         self.weighted_act_beams = np.round(t_beam).astype(int)
 
-    def generate_proportional_fair_timing(self, ue_bs, active_beams, t_index, ue_updt, status):
-        if status == 0:  # if it is BCQI allocation
-            self.generate_best_cqi_beam_timing(ue_bs=ue_bs)
-            self.fake_ue_updt = ue_updt
-        else:  # if it is RR allocation
-
-            if self.even_or_odd is None:  # this is to adjust the sequence (RR or BCQI) when the beam_timing matrix changes size
-                self.even_or_odd = 1
-            if ue_updt or self.fake_ue_updt or self.fake_beam_timing_sequence is None:
-                self.generate_ue_qtd_proportional_beam_timing(t_index=0, active_beams=active_beams)
-                self.fake_beam_timing_sequence = copy.deepcopy(self.beam_timing_sequence)
-                if ue_updt:
-                    self.even_or_odd = 0  # RR comes first in the new time matrix (even) - create at the same it.
-                else:
-                    self.even_or_odd = 1  # RR comes second in the new time matrix (odd) - created on the last it.
-            self.beam_timing_sequence = np.zeros(shape=self.fake_beam_timing_sequence.shape).astype(int)
-            self.beam_timing_sequence[:, self.even_or_odd::2] = \
-                self.fake_beam_timing_sequence[:, range(self.beam_timing_sequence[:, self.even_or_odd::2].shape[1])]
-
-    def next_active_beam(self):
-        # like a queue, it returns the next beams that need to be allocated
-        if self.active_beams_index is None:
-            self.active_beams_index = np.zeros(shape=self.n_sectors)
-        else:
-            self.active_beams_index += 1
-            for sector_index, beam in enumerate(self.active_beams_index):
-                if beam > len(self.beam_timing[sector_index]) - 1:
-                    self.active_beams_index[sector_index] = 0
-
-    def next_weighted_active_beam(self, beam_list=None):
-        # like a queue, it return the next beams that need to be allocated based in the number of time slots for each one
-        if beam_list is not None:
-            if self.active_beams_index is None:
-                self.active_beams_index = np.zeros(shape=self.n_sectors).astype(int)
-
-            for sector_index, beam_index in enumerate(self.active_beams_index):
-                if np.sum(beam_list[:, sector_index]) != 0:
-                    beam_index += 1
-                    if beam_index > len(beam_list[:, sector_index]) - 1:
-                        beam_index = 0
-                    # this block code is slower than the following one
-                    # while beam_list[beam_index, sector_index] == 0:
-                    #     try:
-                    #         non_zero = np.nonzero(beam_list[:, sector_index])[0]
-                    #         beam_index = (non_zero[non_zero > beam_index]).min()
-                    #     except:
-                    #         beam_index = 0
-                    while beam_list[beam_index, sector_index] == 0:  # pick the 1st nonzero occurence after beam_index
-                        beam_index += 1
-                        if beam_index > len(beam_list[:, sector_index]) - 1:  # loops into the first position otherwise
-                            beam_index = 0
-                    beam_list[beam_index, sector_index] -= 1
-                    self.active_beams_index[sector_index] = beam_index
-                else:
-                    self.active_beams_index[sector_index] = -1  # informing that the beam list need to be restarted
-
-            return beam_list
-
-        else:
-            if self.active_beams_index is None:
-                self.active_beams_index = np.zeros(shape=self.n_sectors).astype(int)
-            else:
-                self.active_beams_index += 1
-                for sector_index, beam in enumerate(self.active_beams_index):
-                    if beam > len(self.beam_timing[sector_index]) - 1:
-                        self.active_beams_index[sector_index] = 0
+    def generate_pf_beam_timing(self, ue_bs, pf_ues, pf_metric):
+        # in each sector, the beam of the UE with the highest PF metric is activated in the next time slot
+        # the beams are chosen again in every time slot, so they are active in all time slots of the beam timing
+        # pf_ues are the UEs of the BS and pf_metric their PF metrics (Freq_Scheduler.pf_metric_update)
+        self.best_pf_beams = np.zeros(shape=self.n_sectors, dtype='int') + self.n_beams
+        if pf_ues.size != 0:
+            ue_in_bs = pf_ues[np.lexsort((-pf_metric, ue_bs.sector[pf_ues]))]
+            sectors, best_pf_ue = np.unique(ue_bs.sector[ue_in_bs].astype(int), return_index=True)
+            self.best_pf_beams[sectors] = ue_bs.beam[ue_in_bs[best_pf_ue]]
+        self.set_beam_timing(beams=self.best_pf_beams)
@@ -26,9 +26,9 @@ class Util_fn:
 
 
     def slice_utility(self, ue_bs, active_beams):  # utility per user bw/snr
-        self.slice_util = np.zeros(shape=ue_bs.shape[0])
-        bw_need = np.zeros(shape=ue_bs.shape[0])
-        snr = np.zeros(shape=ue_bs.shape[0]) - 10000
+        self.slice_util = np.zeros(shape=ue_bs.n_ues)
+        bw_need = np.zeros(shape=ue_bs.n_ues)
+        snr = np.zeros(shape=ue_bs.n_ues) - 10000
 
         c_target = self.c_target * 10E6
 
@@ -37,11 +37,10 @@ class Util_fn:
         # segundo teste
         active_beam_index = active_beams != 0
         beam_bw[active_beam_index] = (self.bw / active_beams[active_beam_index]) / 10  # minimum per beam bw
-        active_ue = ue_bs[:, 1] != -1
+        active_ue = ue_bs.beam != -1
 
-        bw_min = np.zeros(shape=ue_bs.shape[0])
-        for ue_index, ue in enumerate(ue_bs):
-            bw_min[ue_index] = beam_bw[ue[1], ue[2]] * 10E6  # minimum per user bw
+        bw_min = np.zeros(shape=ue_bs.n_ues)
+        bw_min[active_ue] = beam_bw[ue_bs.beam[active_ue], ue_bs.sector[active_ue]] * 10E6  # minimum per user bw
 
         bw = self.bw * 10E6  # making SNR for a bandwidth of 5MHz
         k = 1.380649E-23  # Boltzmann's constant (J/K)
@@ -49,24 +48,29 @@ class Util_fn:
         pw_noise_bw = k * t * bw  # noise power
         # it is important here that tx_pw been in dBW (not dBm!!!)
         tx_pw = 10 ** (self.tx_power / 10)  # converting from dBW to watt
-        snr[active_ue] = (tx_pw * 10 ** (ue_bs[active_ue, 3] / 10)) / pw_noise_bw  # signal to noise ratio (linear)
+        snr[active_ue] = (tx_pw * 10 ** (ue_bs.csi[active_ue] / 10)) / pw_noise_bw  # signal to noise ratio (linear)
         bw_need[active_ue] = c_target[active_ue]/(np.log2(1 + snr[active_ue]))
         # bw_need[active_ue] = 2 ** (c_target[active_ue] / snr[active_ue]) - 1  # needed bw to achieve the capacity target
         # snr[active_ue][snr[active_ue] < 0] = 1.01  # to prevent a negative utility value in log2
         self.slice_util[active_ue] = (bw_min[active_ue] / bw_need[active_ue]) * np.log2(1 + snr[active_ue])
         # self.slice_util[active_ue & (bw_need < bw_min)] = 10E-12  # TESTANDO ISSO AQUI
 
-    def beam_utility(self, ue_bs, active_beams):
-        # ue_bs -> bs|beam|sector|ch_gain
+    def beam_utility(self, ue_bs, active_beams, ue_index=None):
+        # ue_bs -> UE_Links table (bs|beam|sector|csi|active columns)
+        # ue_index -> UE_BS_Index of ue_bs (if available, the UEs of each beam are sliced from it)
 
         # self.slice_utility(ue_bs=ue_bs, active_beams=active_beams)
-        self.beam_util = np.zeros(shape=active_beams.shape)
+        n_beams, n_sectors = active_beams.shape
 
-        for sector_index in np.unique(ue_bs[ue_bs[:, 0] == self.bs_index][:, 2]).astype(int):
-            for beam_index in np.unique(ue_bs[(ue_bs[:, 0] == self.bs_index) & (ue_bs[:, 2] == sector_index)][:, 1]).astype(int):
-                ue_in_beam_bs = np.where(
-                    (ue_bs[:, 0] == self.bs_index) & (ue_bs[:, 1] == beam_index) & (ue_bs[:, 2] == sector_index))
-                self.beam_util[beam_index, sector_index] = np.sum(self.slice_util[ue_in_beam_bs])
+        if ue_index is not None:
+            ue_in_bs = ue_index.ues(bs_index=self.bs_index)
+        else:
+            ue_in_bs = np.where(ue_bs.bs == self.bs_index)[0]
+
+        # the beam utility is the sum of the slice utilities of its UEs, summed over the flattened (beam, sector) key
+        beam_sector = ue_bs.beam[ue_in_bs].astype(int) * n_sectors + ue_bs.sector[ue_in_bs]
+        self.beam_util = np.bincount(beam_sector, weights=self.slice_util[ue_in_bs],
+                                     minlength=n_beams * n_sectors).reshape(n_beams, n_sectors)
 
         # ================= CHECAR ALTERAÇÃO !!! ====================
         self.beam_util[self.beam_util < 0] = 10E-12  # to prevent a negative utility value in log2
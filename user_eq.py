@@ -7,10 +7,12 @@ import numpy as np
 # UEs can be turned off when its necessary if the flag -1 is used
 
 class User_eq:
-    def __init__(self, height=None, tx_power=None, positions=None):
+    def __init__(self, height=None, tx_power=None, positions=None, n_candidates=None):
         self.positions = positions  # x, y of each UE located on the ROI
         self.height = height  # UE height (m)
-        self.bs_candidates = None
+        self.n_candidates = n_candidates  # number of strongest (bs, beam) pairs kept as association candidates
+        self.bs_candidates = None  # bs|beam|sector - the n_candidates strongest pairs of each UE (ue x candidate x 3)
+        self.candidates_gain = None  # channel gain (dB) of the candidates, from the strongest to the weakest
         self.gain_matrix = None
         self.tx_power = tx_power  # UE tx power in dBW
 
@@ -19,29 +21,38 @@ class User_eq:
         # calculated variables
         self._ue_bs = None  # bs|beam|sector|ch_gain - linked UE and BS indexes - TO BE DELETED
 
-        self.dw_ue_bs = None  # bs|beam|sector|ch_gain - linked UE and BS indexes for the downlink
-        self.up_ue_bs = None  # bs|beam|sector|ch_gain - linked UE and BS indexes for the uplink
+        self.ue_store = None  # UE_Store - typed bs|beam|sector|csi|active columns of both links in one buffer
+        self.dw_ue_bs = None  # UE_Links view of ue_store - linked UE and BS indexes for the downlink
+        self.up_ue_bs = None  # UE_Links view of ue_store - linked UE and BS indexes for the uplink
 
         self.active_ue = None  # list of UEs that are sensed in the network
         self.ue_bs_total = None  # bs|beam|sector|ch_gain - all UE and BS indexes + non linked
 
-    def acquire_bs_and_beam(self, ch_gain_map, sector_map, pw_5mhz):
+        self.dw_index = None  # UE_BS_Index of dw_ue_bs - UEs grouped by bs/sector/beam for the downlink schedulers
+        self.up_index = None  # UE_BS_Index of up_ue_bs - UEs grouped by bs/sector/beam for the uplink schedulers
+
+    def acquire_bs_and_beam(self, ch_gain_map, sector_map, pw_5mhz, n_sectors=None):
         self.sector_map = sector_map.astype(int)
-        self.dw_ue_bs = np.ndarray(shape=(ch_gain_map.shape[1], 4))  # bs|beam|sector|ch_gain
+        self.ue_store = UE_Store(n_ues=ch_gain_map.shape[1])
+        self.dw_ue_bs = self.ue_store.dw
+        self.up_ue_bs = self.ue_store.up
 
-        for ue_index in range(ch_gain_map.shape[1]):
-            self.dw_ue_bs[ue_index] = np.concatenate((np.array(
-                np.unravel_index(np.argmax(ch_gain_map[:, ue_index]), ch_gain_map[:, ue_index].shape)),
-                   np.array(self.sector_map[np.unravel_index(np.argmax(ch_gain_map[:, ue_index]),
-                     ch_gain_map[:, ue_index].shape)[0], ue_index]),
-                       np.array(np.max(ch_gain_map[:, ue_index]))), axis=None)
+        # best (bs, beam) of all UEs at once: the best beam of each bs/ue pair, then the best bs of each UE
+        # (ties go to the first bs and beam, the same order of an argmax over the flattened bs x beam gains)
+        ue_range = np.arange(ch_gain_map.shape[1])
+        best_beam = np.argmax(ch_gain_map, axis=2)  # bs x ue
+        best_beam_gain = np.take_along_axis(ch_gain_map, best_beam[:, :, np.newaxis], axis=2)[:, :, 0]
+        best_bs = np.argmax(best_beam_gain, axis=0)
+        best_gain = best_beam_gain[best_bs, ue_range]
+        self.dw_ue_bs.link(ue_index=ue_range, bs=best_bs, beam=best_beam[best_bs, ue_range],
+                           sector=self.sector_map[best_bs, ue_range], csi=best_gain)
 
         # the '+30' here is because of the conversion from dBW to dBm
-        inactive_ue = np.where(self.dw_ue_bs[:, 3] + pw_5mhz + 30 < -100)  # ref: ETSI TS 138 101-1 (in 5 MHz) (simplifying for all bands here)
-        self.dw_ue_bs[inactive_ue, 0:3] = -1
+        inactive_ue = np.where(best_gain + pw_5mhz + 30 < -100)  # ref: ETSI TS 138 101-1 (in 5 MHz) (simplifying for all bands here)
+        self.dw_ue_bs.unlink(ue_index=inactive_ue)
 
         # the '+30' here is because of the convertion from dBW to dBm
-        self.active_ue = np.where(self.dw_ue_bs[:, 3] + pw_5mhz + 30 > -100) # ref: ETSI TS 138 101-1 (in 5 MHz) (simplifying for all bands here)
+        self.active_ue = np.where(best_gain + pw_5mhz + 30 > -100) # ref: ETSI TS 138 101-1 (in 5 MHz) (simplifying for all bands here)
 
         # self.sector_map = self.sector_map[:, self.active_ue][0]  # adjusting the sector map to be the same size as the
         # as the update ue_bs with the active UEs
@@ -49,8 +60,18 @@ class User_eq:
         # self.ue_bs_total = self.ue_bs
         # self.ue_bs = self.ue_bs[self.active_ue]
 
-        self.dw_ue_bs = self.dw_ue_bs.astype(int)
-        self.up_ue_bs = copy.copy(self.dw_ue_bs)  # replicating the relationship table to the uplink
+        self.up_ue_bs.copy_from(self.dw_ue_bs)  # replicating the relationship table to the uplink
+
+        if self.n_candidates is not None:
+            self.acquire_bs_candidates(ch_gain_map=ch_gain_map, n_candidates=self.n_candidates)
+
+        # indexing the UEs by bs/sector/beam (the index is updated with the ue_bs tables in remove_ue)
+        if n_sectors is None:
+            n_sectors = self.sector_map.max() + 1
+        self.dw_index = UE_BS_Index(ue_bs=self.dw_ue_bs, n_bs=ch_gain_map.shape[0], n_sectors=n_sectors,
+                                    n_beams=ch_gain_map.shape[2])
+        self.up_index = UE_BS_Index(ue_bs=self.up_ue_bs, n_bs=ch_gain_map.shape[0], n_sectors=n_sectors,
+                                    n_beams=ch_gain_map.shape[2])
 
 
         # self.ue_bs = self.ue_bs[~np.isnan(self.ue_bs[:,3])].astype(int)
@@ -58,8 +79,230 @@ class User_eq:
 
         # self.ue_bs[~np.isnan(self.ue_bs)] = self.ue_bs[~np.isnan(self.ue_bs)].astype(int)
 
+    def acquire_bs_candidates(self, ch_gain_map, n_candidates):
+        # keeps the n_candidates strongest (bs, beam) pairs of each UE, so the re-association, handover and load-aware
+        # association only need to look at ue x n_candidates entries instead of the whole ch_gain_map
+        n_bs, n_ues, n_beams = ch_gain_map.shape
+        n_candidates = min(n_candidates, n_bs * n_beams)
+        bs_n_candidates = min(n_candidates, n_beams)
+
+        # first the strongest beams of each bs/ue pair (the global candidates are a subset of them)
+        if bs_n_candidates < n_beams:
+            beams = np.argpartition(-ch_gain_map, bs_n_candidates - 1, axis=2)[:, :, :bs_n_candidates]
+        else:
+            beams = np.broadcast_to(np.arange(n_beams), (n_bs, n_ues, n_beams))
+        gains = np.take_along_axis(ch_gain_map, beams, axis=2)  # bs x ue x bs_n_candidates
+
+        # then the strongest pairs of each UE among all BSs (ue x (bs * bs_n_candidates))
+        gains = gains.transpose(1, 0, 2).reshape(n_ues, -1)
+        pair_index = (np.arange(n_bs)[:, np.newaxis, np.newaxis] * n_beams + beams).transpose(1, 0, 2).reshape(n_ues, -1)
+        if n_candidates < gains.shape[1]:
+            best = np.argpartition(-gains, n_candidates - 1, axis=1)[:, :n_candidates]
+            gains = np.take_along_axis(gains, best, axis=1)
+            pair_index = np.take_along_axis(pair_index, best, axis=1)
+
+        # sorting the candidates from the strongest to the weakest (ties go to the first bs and beam, as in the
+        # association of acquire_bs_and_beam)
+        order = np.lexsort((pair_index, -gains), axis=1)
+        self.candidates_gain = np.take_along_axis(gains, order, axis=1)
+        pair_index = np.take_along_axis(pair_index, order, axis=1)
+        bs_index = pair_index // n_beams
+        self.bs_candidates = np.zeros(shape=(n_ues, n_candidates, 3), dtype=int)
+        self.bs_candidates[:, :, 0] = bs_index
+        self.bs_candidates[:, :, 1] = pair_index % n_beams
+        self.bs_candidates[:, :, 2] = self.sector_map[bs_index, np.arange(n_ues)[:, np.newaxis]]
+
+    def soft_handover_table(self, margin):
+        # candidates with a channel gain within margin (dB) of the strongest one (ue x candidate)
+        return self.candidates_gain >= self.candidates_gain[:, [0]] - margin
+
+    def best_candidate(self, ue_index=None, bs_penalty=None, excluded_bs=None):
+        # index of the best candidate of each UE - the strongest one after subtracting a per-BS penalty in dB (to
+        # make a load-aware association, for example) and discarding the candidates of the excluded BSs
+        # it returns -1 for the UEs without an allowed candidate
+        if ue_index is None:
+            ue_index = np.arange(self.bs_candidates.shape[0])
+        candidates_bs = self.bs_candidates[ue_index, :, 0]
+        score = copy.copy(self.candidates_gain[ue_index])
+        if bs_penalty is not None:
+            score -= np.asarray(bs_penalty)[candidates_bs]
+        if excluded_bs is not None:
+            score[np.isin(candidates_bs, excluded_bs)] = -np.inf
+        candidate = np.argmax(score, axis=1)
+        candidate[np.all(score == -np.inf, axis=1)] = -1
+        return candidate
+
+    def reassociate(self, ue_index, candidate, downlink=False, uplink=False):
+        # moves UEs to one of their candidates (the removed UEs of a link stay removed) and updates the indexes
+        # in a simulation use Macel.reassociate_ue, it also rebuilds the downlink interferer lists
+        ue_index = np.asarray(ue_index)
+        candidate = np.asarray(candidate)
+        valid = candidate >= 0
+        ue_index = ue_index[valid]
+        candidate = candidate[valid]
+        new_ue_bs = self.bs_candidates[ue_index, candidate]  # bs|beam|sector
+        new_csi = self.candidates_gain[ue_index, candidate]
+        for link, ue_bs, index in ((downlink, self.dw_ue_bs, self.dw_index), (uplink, self.up_ue_bs, self.up_index)):
+            if link:
+                linked = ue_bs.active[ue_index]
+                if index is not None:
+                    index.remove(ue_index=ue_index[linked])
+                ue_bs.link(ue_index=ue_index[linked], bs=new_ue_bs[linked, 0], beam=new_ue_bs[linked, 1],
+                           sector=new_ue_bs[linked, 2], csi=new_csi[linked])
+                if index is not None:
+                    index.add(ue_index=ue_index[linked], ue_bs=ue_bs)
+
     def remove_ue(self, ue_index, downlink=False, uplink=False):  # put a -1 flag to stop communicating with UE that achieve the target capacity
         if downlink:
-            self.dw_ue_bs[ue_index, 0:3] = -1
+            if self.dw_index is not None:
+                self.dw_index.remove(ue_index=ue_index)
+            self.dw_ue_bs.unlink(ue_index=ue_index)
         if uplink:
-            self.up_ue_bs[ue_index, 0:3] = -1
+            if self.up_index is not None:
+                self.up_index.remove(ue_index=ue_index)
+            self.up_ue_bs.unlink(ue_index=ue_index)
+
+
+# The UE_Store class keeps the UE/BS association of the downlink and uplink as a struct of arrays: typed bs (int32),
+# beam (int16), sector (int16), csi (float32, channel gain in dB) and active (bool) columns, all of them views of one
+# contiguous buffer (cheap to copy or share between processes). The dw and up attributes are the UE_Links views of
+# each link. Unlinked/removed UEs have -1 in bs, beam and sector and active False.
+
+class UE_Store:
+    columns = [('bs', np.int32), ('beam', np.int16), ('sector', np.int16), ('csi', np.float32), ('active', np.bool_)]
+
+    def __init__(self, n_ues, buffer=None):
+        self.n_ues = n_ues
+
+        # column offsets inside the buffer (aligned to 8 bytes)
+        self.offsets = []
+        nbytes = 0
+        for _ in ('dw', 'up'):
+            for _, dtype in self.columns:
+                self.offsets.append(nbytes)
+                nbytes += -(-n_ues * np.dtype(dtype).itemsize // 8) * 8
+        self.nbytes = nbytes
+
+        if buffer is None:
+            buffer = np.zeros(shape=nbytes, dtype=np.uint8)
+        self.buffer = buffer
+        self.dw = UE_Links(store=self, first_column=0)
+        self.up = UE_Links(store=self, first_column=len(self.columns))
+
+    def column(self, index):
+        dtype = self.columns[index % len(self.columns)][1]
+        return np.ndarray(shape=self.n_ues, dtype=dtype, buffer=self.buffer, offset=self.offsets[index])
+
+
+class UE_Links:
+    def __init__(self, store, first_column):
+        self.n_ues = store.n_ues
+        for index, [name, _] in enumerate(UE_Store.columns):
+            setattr(self, name, store.column(first_column + index))
+
+    def link(self, ue_index, bs, beam, sector, csi):
+        self.bs[ue_index] = bs
+        self.beam[ue_index] = beam
+        self.sector[ue_index] = sector
+        self.csi[ue_index] = csi
+        self.active[ue_index] = True
+
+    def unlink(self, ue_index):  # the csi is kept
+        self.bs[ue_index] = -1
+        self.beam[ue_index] = -1
+        self.sector[ue_index] = -1
+        self.active[ue_index] = False
+
+    def copy_from(self, links):
+        for name, _ in UE_Store.columns:
+            getattr(self, name)[:] = getattr(links, name)
+
+    def table(self):
+        # bs|beam|sector|csi table (pandas DataFrame) to store in the simulation outputs
+        import pandas as pd
+        return pd.DataFrame({'bs_index': self.bs.astype(int), 'beam_index': self.beam.astype(int),
+                             'sector_index': self.sector.astype(int), 'csi': self.csi.astype(float)})
+
+
+# The UE_BS_Index class is a CSR-style index of a UE_Links table (dw_ue_bs or up_ue_bs). The active UEs
+# are sorted by their (bs, sector, beam) group in ue_order and the UEs of a group are the slice
+# ue_order[offsets[group]:offsets[group + 1]], in ascending UE order (the same order of a np.where scan of the table).
+# The beam is the innermost key, so the UEs of a BS sector or of a whole BS are also contiguous slices.
+# Removed UEs (flag -1) are taken out of the index incrementally, without sorting the table again.
+
+class UE_BS_Index:
+    def __init__(self, ue_bs, n_bs, n_sectors, n_beams):
+        self.n_bs = n_bs
+        self.n_sectors = n_sectors
+        self.n_beams = n_beams
+
+        self.ue_group = None  # group of each UE (-1 for removed UEs)
+        self.ue_order = None  # UE indexes sorted by group
+        self.offsets = None  # start of each group in ue_order (n_groups + 1)
+
+        self.build(ue_bs=ue_bs)
+
+    def group_index(self, bs_index, sector_index=0, beam_index=0):
+        return (bs_index * self.n_sectors + sector_index) * self.n_beams + beam_index
+
+    def build(self, ue_bs):
+        n_groups = self.n_bs * self.n_sectors * self.n_beams
+        linked_ue = np.where(ue_bs.active)[0]
+        self.ue_group = np.zeros(shape=ue_bs.n_ues, dtype=int) - 1
+        self.ue_group[linked_ue] = self.group_index(bs_index=ue_bs.bs[linked_ue].astype(int),
+                                                    sector_index=ue_bs.sector[linked_ue].astype(int),
+                                                    beam_index=ue_bs.beam[linked_ue].astype(int))
+        self.ue_order = linked_ue[np.argsort(self.ue_group[linked_ue], kind='stable')]
+        self.offsets = np.zeros(shape=n_groups + 1, dtype=int)
+        self.offsets[1:] = np.cumsum(np.bincount(self.ue_group[linked_ue], minlength=n_groups))
+
+    def remove(self, ue_index):
+        ue_index = np.unique(ue_index)
+        ue_index = ue_index[self.ue_group[ue_index] >= 0]  # UEs already removed are not in the index
+        if ue_index.size == 0:
+            return
+        groups = self.ue_group[ue_index]
+
+        # the position of a UE is the start of its group plus the number of smaller UE indexes in the same group
+        position = np.array([self.offsets[group] +
+                             np.searchsorted(self.ue_order[self.offsets[group]:self.offsets[group + 1]], ue)
+                             for ue, group in zip(ue_index, groups)], dtype=int)
+        self.ue_order = np.delete(self.ue_order, position)
+        self.offsets[1:] -= np.cumsum(np.bincount(groups, minlength=self.offsets.size - 1))
+        self.ue_group[ue_index] = -1
+
+    def add(self, ue_index, ue_bs):
+        # inserts UEs (with their rows already written in ue_bs) in the index, keeping the ascending UE order
+        ue_index = np.unique(ue_index)
+        ue_index = ue_index[(self.ue_group[ue_index] < 0) & ue_bs.active[ue_index]]
+        if ue_index.size == 0:
+            return
+        groups = self.group_index(bs_index=ue_bs.bs[ue_index].astype(int), sector_index=ue_bs.sector[ue_index].astype(int),
+                                  beam_index=ue_bs.beam[ue_index].astype(int))
+        position = np.array([self.offsets[group] +
+                             np.searchsorted(self.ue_order[self.offsets[group]:self.offsets[group + 1]], ue)
+                             for ue, group in zip(ue_index, groups)], dtype=int)
+        # UEs inserted in the same position keep the (group, UE) order
+        insert_order = np.lexsort((ue_index, groups, position))
+        self.ue_order = np.insert(self.ue_order, position[insert_order], ue_index[insert_order])
+        self.offsets[1:] += np.cumsum(np.bincount(groups, minlength=self.offsets.size - 1))
+        self.ue_group[ue_index] = groups
+
+    def ues(self, bs_index, sector_index=None, beam_index=None):
+        # UEs of a BS, of a BS sector or of a BS sector beam (a view of ue_order, do not modify it)
+        if sector_index is None:
+            start = self.group_index(bs_index=bs_index)
+            end = self.group_index(bs_index=bs_index + 1)
+        elif beam_index is None:
+            start = self.group_index(bs_index=bs_index, sector_index=sector_index)
+            end = self.group_index(bs_index=bs_index, sector_index=sector_index + 1)
+        else:
+            start = self.group_index(bs_index=bs_index, sector_index=sector_index, beam_index=beam_index)
+            end = start + 1
+        return self.ue_order[self.offsets[start]:self.offsets[end]]
+
+    def group_sizes(self, bs_index):
+        # number of UEs of a BS in each sector/beam (sector x beam)
+        start = self.group_index(bs_index=bs_index)
+        end = self.group_index(bs_index=bs_index + 1)
+        return np.diff(self.offsets[start:end + 1]).reshape(self.n_sectors, self.n_beams)
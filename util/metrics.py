@@ -105,6 +105,25 @@ class Metrics:
                 self.dwn_cap_deficit = self.dwn_criteria - acc_ue_cap
                 self.dwn_cap_deficit = np.where(self.dwn_cap_deficit < 0, 1E-6, self.dwn_cap_deficit)
 
+    def store_downlink_metrics_block(self, cap, snr, t_index, base_station_list, user_bw):
+        # block version of store_downlink_metrics for the time slots in t_index (used without the capacity criteria)
+        # cap and snr are ue x time slots and user_bw is the allocated bw of each BS (time slots x bs x ue)
+        self.dwn_cap[:, t_index] = cap
+        self.dwn_snr[:, t_index] = snr
+        self.dwn_user_time[:, t_index] = ~np.isnan(cap)
+        bw = np.zeros(shape=cap.shape)
+        # storing the BS-related metrics
+        for bs_index, base_station in enumerate(base_station_list):
+            self.dwn_act_beams_nmb[bs_index, t_index] = np.mean(np.count_nonzero(base_station.dwn_active_beams, axis=0))
+            self.dwn_user_per_bs[bs_index, t_index] = np.sum(base_station.dwn_active_beams)
+            bs_user_bw = user_bw[:, bs_index].T
+            bw[bs_user_bw != 0] = bs_user_bw[bs_user_bw != 0]
+
+        served_ue = ~np.isnan(cap)
+        dwn_user_bw = self.dwn_user_bw[:, t_index]
+        dwn_user_bw[served_ue] = bw[served_ue]
+        self.dwn_user_bw[:, t_index] = dwn_user_bw
+
     def create_uplink_matrices(self, simulation_time, time_slot, n_ues, n_bs, criteria):
         # this function will create the empty numpy arrays that will store the metrics along the simulation time
         # there are two separated functions for downlink/uplink
@@ -0,0 +1,29 @@
+import numpy as np
+
+# Random streams of the simulations: every random draw comes from a numpy Generator of a SeedSequence hierarchy
+# run (exec_param:seed) -> sweep point -> iteration -> subsystem (-> base station and link for the schedulers).
+# A stream only depends on its keys, so a run is reproducible for any number of workers and any iteration can be
+# simulated again alone from (seed, point index, iteration index).
+
+subsystems = ('ue_drop', 'bs_placement', 'shadowing', 'scheduler')
+
+
+def run_entropy(seed=None):
+    # entropy of a run (fresh OS entropy if the seed is not set) - it must be saved to reproduce the run
+    return np.random.SeedSequence(seed).entropy
+
+
+def iteration_seed(entropy, point_index, iteration_index):
+    return np.random.SeedSequence(entropy=entropy, spawn_key=(point_index, iteration_index))
+
+
+def subsystem_rng(seed_seq, subsystem, *key):
+    # generator of a subsystem of an iteration (key: e.g. base station index and link) - an unseeded generator if the
+    # iteration seed is not set
+    if subsystem not in subsystems:
+        raise ValueError('Invalid random subsystem {}, it must be one of {}'.format(subsystem, subsystems))
+    if seed_seq is None:
+        return np.random.default_rng()
+    child = np.random.SeedSequence(entropy=seed_seq.entropy,
+                                   spawn_key=tuple(seed_seq.spawn_key) + (subsystems.index(subsystem),) + tuple(key))
+    return np.random.default_rng(child)
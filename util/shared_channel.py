@@ -0,0 +1,51 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Helpers to publish the channel tensors of a UE drop (Macel.channel_attributes) in shared memory blocks, so the
+# processes that simulate different scheduler/TDD variants of the same drop attach to them without copies instead of
+# recalculating the azimuth, distance, elevation and channel gain maps.
+# The descriptor is a small dictionary (attribute: (block name, shape, dtype)) that can be sent to the other processes.
+
+
+def publish_channel(macel):
+    # copies the channel tensors of macel to new shared memory blocks - the returned blocks must be released with
+    # release_channel(blocks, unlink=True) by the publisher when the other processes are done
+    descriptor = {}
+    blocks = []
+    try:
+        for attribute in macel.channel_attributes:
+            array = getattr(macel, attribute)
+            if array is None:
+                continue
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(shape=array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            descriptor[attribute] = (block.name, array.shape, array.dtype.str)
+    except Exception:
+        release_channel(blocks=blocks, unlink=True)
+        raise
+
+    return descriptor, blocks
+
+
+def attach_channel(descriptor):
+    # read-only numpy views of the published channel tensors - the blocks must be kept (and closed with
+    # release_channel) while the views are used
+    channel = {}
+    blocks = []
+    for attribute, (name, shape, dtype) in descriptor.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        array = np.ndarray(shape=shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        channel[attribute] = array
+
+    return channel, blocks
+
+
+def release_channel(blocks, unlink=False):
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
@@ -8,9 +8,13 @@ import socket
 from util.plot_data_new import plot_histograms, plot_curves, plot_surfaces
 from util.mann_whitney_u import compare_dist
 from clustering import Cluster
+from util.seeds import run_entropy, iteration_seed, subsystem_rng
 
 # Just a set of auxiliary functions to setup a simulation environment
 
+# static simulation environment of a pool worker (set once per worker by init_worker)
+_worker_env = {}
+
 def simulate_macel(args):  # todo - fix the and check all the options here
     n_bs = args[0]
     macel = args[1]
@@ -19,20 +23,103 @@ def simulate_macel(args):  # todo - fix the and check all the options here
     ue_dist_type = args[4]
     random_centers = args[5]
 
+    make_drop(macel=macel, n_samples=n_samples, n_centers=n_centers, ue_dist_type=ue_dist_type,
+              random_centers=random_centers)
+    # snr_cap_stats, raw_data = macel.place_and_configure_bs(n_centers=n_bs, output_typ='complete', clustering=True)
+    output = macel.place_and_configure_bs(n_centers=n_bs)
+    # snr_cap_stats = macel.place_and_configure_bs(n_centers=n_bs, output_typ='simple', clustering=False)
+    return output
+
+
+def make_drop(macel, n_samples, n_centers, ue_dist_type, random_centers):
+    # distributes the UEs of a simulation (with the ue_drop stream of the macel seed)
+    rng = subsystem_rng(macel.seed_seq, 'ue_drop')
     if macel.map is not None:  # checking if map data is to be used
-        macel.map.generate_samples(n_samples=n_samples)
+        macel.map.generate_samples(n_samples=n_samples, rng=rng)
         macel.grid = macel.map.make_grid()
         macel.del_map()  # deleting the map instance to save some memory
     else:
         macel.grid.make_points(dist_type=ue_dist_type, samples=n_samples, n_centers=n_centers, random_centers=random_centers,
-                               plot=False)  # distributing points around centers in the grid
+                               plot=False, rng=rng)  # distributing points around centers in the grid
     macel.set_ue()
-    # snr_cap_stats, raw_data = macel.place_and_configure_bs(n_centers=n_bs, output_typ='complete', clustering=True)
-    output = macel.place_and_configure_bs(n_centers=n_bs)
-    # snr_cap_stats = macel.place_and_configure_bs(n_centers=n_bs, output_typ='simple', clustering=False)
+
+
+def init_worker(macel, n_centers, ue_dist_type, random_centers):
+    # pool initializer: the static environment is received once per worker (or inherited by fork) instead of being
+    # pickled in every task
+    _worker_env['macel'] = macel
+    _worker_env['n_centers'] = n_centers
+    _worker_env['ue_dist_type'] = ue_dist_type
+    _worker_env['random_centers'] = random_centers
+
+
+def simulate_macel_task(args):
+    # pool task: only the iteration values (n_bs, n_samples and the iteration SeedSequence) are sent, each task runs on
+    # its own copy of the worker environment because simulate_macel changes the macel object
+    import copy
+    n_bs, n_samples, seed = args
+    macel = copy.deepcopy(_worker_env['macel'])
+    macel.set_seed(seed)
+    return simulate_macel((n_bs, macel, n_samples, _worker_env['n_centers'], _worker_env['ue_dist_type'],
+                           _worker_env['random_centers']))
+
+
+def apply_variant(macel, variant):
+    # changes the macel attributes of a simulation variant (e.g. {'tdd_up_time': 0.2,
+    # 'downlink_specs': {'scheduler_typ': 'PF'}}) - the scheduler specs dictionaries are updated, not replaced
+    for attribute, value in variant.items():
+        if not hasattr(macel, attribute):
+            raise ValueError('{} is not a Macel attribute - please check the simulation variants'.format(attribute))
+        if isinstance(value, dict) and isinstance(getattr(macel, attribute), dict):
+            value = {**getattr(macel, attribute), **value}
+        setattr(macel, attribute, value)
+
+
+def simulate_variant_task(args):
+    # pool task of simulate_variants: the variant runs on a copy of the worker environment with the channel tensors of
+    # the drop attached from shared memory (read only, without copies)
+    import copy
+    from util.shared_channel import attach_channel, release_channel
+    n_bs, descriptor, centroids, features, variant, seed = args
+    macel = copy.deepcopy(_worker_env['macel'])
+    macel.set_seed(seed)
+    apply_variant(macel=macel, variant=variant)
+    macel.cluster.centroids = centroids
+    macel.cluster.features = features
+
+    channel, blocks = attach_channel(descriptor=descriptor)
+    try:
+        macel.set_channel(n_centers=n_bs, channel=channel)
+        output = macel.simulate_channel()
+    finally:
+        del macel, channel  # the views must be released before closing the blocks
+        release_channel(blocks=blocks)
     return output
 
 
+def simulate_variants(macel, process_pool, n_bs, n_samples, n_centers, ue_dist_type, random_centers, variants, seed):
+    # simulates all variants (see apply_variant) over the same UE drop and BS layout: the channel tensors are calculated
+    # once here and published in shared memory for the pool workers (created with init_worker), instead of being
+    # recalculated for each variant - all variants use the same seed (SeedSequence of the iteration), so they also
+    # share the random scheduling draws
+    import copy
+    from util.shared_channel import publish_channel, release_channel
+    drop = copy.deepcopy(macel)
+    drop.set_seed(seed)
+    make_drop(macel=drop, n_samples=n_samples, n_centers=n_centers, ue_dist_type=ue_dist_type,
+              random_centers=random_centers)
+    drop.generate_channel(n_centers=n_bs)
+
+    descriptor, blocks = publish_channel(macel=drop)
+    try:
+        outputs = process_pool.map(simulate_variant_task,
+                                   [(n_bs, descriptor, drop.cluster.centroids, drop.cluster.features, variant, seed)
+                                    for variant in variants])
+    finally:
+        release_channel(blocks=blocks, unlink=True)
+    return outputs
+
+
 def create_enviroment(parameters, param_path):
     # this function creates the objects and the relationships necessary to run a simulation in simulate_macel_downlink
     from make_grid import Grid
@@ -84,7 +171,8 @@ def create_enviroment(parameters, param_path):
                                    n_rows=parameters['antenna_param']['n_rows'],
                                    n_columns=parameters['antenna_param']['n_columns'],
                                    horizontal_spacing=parameters['antenna_param']['horizontal_spacing'],
-                                   vertical_spacing=parameters['antenna_param']['vertical_spacing'])
+                                   vertical_spacing=parameters['antenna_param']['vertical_spacing'],
+                                   gain_table=parameters['antenna_param']['gain_table'])
 
     # instantiating a basestation
     base_station = BaseStation(frequency=parameters['bs_param']['freq'],
@@ -122,10 +210,14 @@ def create_enviroment(parameters, param_path):
                   output_type=parameters['exec_param']['output_type'],
                   bw_slot=parameters['downlink_scheduler']['bw_slot'],
                   tdd_up_time=parameters['macel_param']['mux_tdd_up_time'],
+                  event_driven=parameters['macel_param']['event_driven'],
+                  block_slots=parameters['macel_param']['block_slots'],
+                  interferer_margin=parameters['macel_param']['interferer_margin'],
                   bs_allocation_typ=parameters['macel_param']['bs_allocation_typ'],
                   downlink_specs=downlink_specs,
                   uplink_specs=uplink_specs)
-    macel.set_ue(hrx=parameters['ue_param']['hrx'], tx_power=parameters['ue_param']['tx_power'])
+    macel.set_ue(hrx=parameters['ue_param']['hrx'], tx_power=parameters['ue_param']['tx_power'],
+                 n_candidates=parameters['ue_param']['n_candidates'])
     macel.set_map(map_)
     macel.cluster = Cluster()
 
@@ -139,9 +231,8 @@ def create_enviroment(parameters, param_path):
     return macel, parameters
 
 
-def prep_multiproc(threads):
-    # this function is just to create a pool and avoid problems with the configuration of it
-    import multiprocessing
+def pool_threads(threads):
+    # number of pool processes for the threads parameter
     import os
 
     max_threads = os.cpu_count()
@@ -153,13 +244,29 @@ def prep_multiproc(threads):
         print('The selected number of threads is higher than the maximum of the CPU.')
     if threads > 61:  # to run in processors with 30+ cores
         threads = 61
+    threads = max(threads, 1)  # single core machines
+
+    return threads
+
+
+def prep_multiproc(threads, initializer=None, initargs=()):
+    # this function is just to create a pool and avoid problems with the configuration of it
+    import multiprocessing
+    import os
+
+    threads = pool_threads(threads=threads)
     print('Running with ' + str(threads) + ' threads')
-    p = multiprocessing.Pool(processes=threads)
+    if os.name == 'posix':
+        # the workers must share the resource tracker of this process, otherwise each one tracks (and unlinks at exit)
+        # the shared memory blocks that it attaches in util.shared_channel
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+    p = multiprocessing.Pool(processes=threads, initializer=initializer, initargs=initargs)
 
     return p
 
 
-def get_additional_sim_param(global_parameters, param_path, process_pool):
+def get_additional_sim_param(global_parameters, param_path, threads):
     # this function gets addition information about the simulation and the environment to complement
     # output execution parameters
     path, folder, name_file = save_data()  # storing the path used to save in all iterations
@@ -169,7 +276,7 @@ def get_additional_sim_param(global_parameters, param_path, process_pool):
     global_parameters['exec_param']['simulation_time'] = []
     global_parameters['exec_param']['executed_n_bs'] = []
     global_parameters['exec_param']['executed_n_ue'] = []
-    global_parameters['exec_param']['threads'] = process_pool._processes
+    global_parameters['exec_param']['threads'] = threads
     global_parameters['exec_param']['PC_ID'] = socket.gethostname()
 
     return global_parameters, path, folder, name_file, data_dict
@@ -226,9 +333,12 @@ def check_iter_type(iter_params):
 def start_simmulation(conf_file):
     global_parameters, param_path = load_param(filename=conf_file, backup=True)
 
-    process_pool = prep_multiproc(threads=global_parameters['exec_param']['threads'])
+    threads = pool_threads(threads=global_parameters['exec_param']['threads'])
+    # root of the random streams (util.seeds), saved in the exec parameters to reproduce the run
+    entropy = run_entropy(seed=global_parameters['exec_param']['seed'])
+    global_parameters['exec_param']['seed'] = entropy
     global_parameters, path, folder, name_file, data_dict = get_additional_sim_param(global_parameters=global_parameters,
-                                                               param_path=param_path, process_pool=process_pool)
+                                                               param_path=param_path, threads=threads)
 
     temp_data_save(zero_state=True)  # creating or cleaning the temp folder
 
@@ -262,93 +372,101 @@ def start_simmulation(conf_file):
 
     iter_range, iter_type, n_cells, n_samples = check_iter_type(global_parameters['macel_param'])
 
-    for iter_var in iter_range:
-        if iter_type == 'BS':
-            n_cells = iter_var
-        elif iter_type == 'UE':
-            n_samples = iter_var
-
+    # the pool is created once and reused in all batches and iteration steps, the environment is sent to the workers
+    # by the initializer and the tasks only carry (n_bs, n_samples, SeedSequence of the iteration) - the workers stay
+    # idle (keeping their Macel) while the data of a step is processed and plotted
+    process_pool = prep_multiproc(threads=threads, initializer=init_worker,
+                                  initargs=(macel, n_centers, ue_dist_typ, random_centers))
+    try:
+        for point_index, iter_var in enumerate(iter_range):
+            if iter_type == 'BS':
+                n_cells = iter_var
+            elif iter_type == 'UE':
+                n_samples = iter_var
+
+
+        # for n_cells in range(global_parameters['macel_param']['min_bs'], global_parameters['macel_param']['max_bs'] + 1):
+            print('\nrunning with ', n_cells, ' BSs, ', n_samples, 'UEs and a batch size of', batch_size, 'iterations')
+
+            initial_time = time.time()  # this is used to write the simulation time on the exec_stats .txt file
+
+            bs_vec.append(n_cells)
+
+            i = 0
+            # data = []
+            # for sub_iter in steps:
+            end_sim = False
+            iter = 0
+            while end_sim is not True:
+                i += 1
+                iter += batch_size
+
+                print(' ')
+                print('Running step ', i, ':')
+
+                data_ = list(
+                    tqdm.tqdm(
+                        process_pool.imap(  # ordered, so the data order does not depend on the number of workers
+                            simulate_macel_task, [(n_cells, n_samples,
+                                                   iteration_seed(entropy=entropy, point_index=point_index,
+                                                                  iteration_index=iteration_index))
+                                                  for iteration_index in range(iter - batch_size, iter)]),
+                        total=round(batch_size)
+                    ))
+
+                data = temp_data_load()
+                if data and hypothesis_test:
+                    end_sim = compare_dist(data, data + data_, hypothesis_test_var)
+
+                data = data + data_
+                temp_data_save(batch_file={'data': data, 'index': i})  # this will store temporary files on disk and avoid memory consumption
+
+                del data
+                del data_
+                if iter >= max_iter:
+                    print('Achieved the max number of iterations')
+                    break
 
-    # for n_cells in range(global_parameters['macel_param']['min_bs'], global_parameters['macel_param']['max_bs'] + 1):
-        print('\nrunning with ', n_cells, ' BSs, ', n_samples, 'UEs and a batch size of', batch_size, 'iterations')
-
-        initial_time = time.time()  # this is used to write the simulation time on the exec_stats .txt file
-
-        bs_vec.append(n_cells)
-
-        i = 0
-        # data = []
-        # for sub_iter in steps:
-        end_sim = False
-        iter = 0
-        while end_sim is not True:
-            # starting and finishing the process pool in each iteration to save memory for the other functions
-            process_pool = prep_multiproc(threads=global_parameters['exec_param']['threads'])
-            i += 1
-            iter += batch_size
+            data = temp_data_load()
+            data_dummy = load_data(name_file=name_file)
+            if data_dummy:
+                data_dict = data_dummy
+                del data_dummy
 
-            print(' ')
-            print('Running step ', i, ':')
+            data_dict = macel_data_dict(data_dict_=data_dict, data_=data, n_cells=n_cells,
+                                        n_samples=n_samples, n_centers=n_centers,
+                                        dist_typ=global_parameters['macel_param']['ue_dist_typ'])
 
-            data_ = list(
-                tqdm.tqdm(
-                    process_pool.imap_unordered(
-                        simulate_macel, [(n_cells, macel, n_samples, n_centers, ue_dist_typ, random_centers)
-                                                  for i in range(batch_size)]), total=round(batch_size)
-                ))
+            temp_data_delete(type='batch')  # deleting the temporary files because the output dictionary was already created
 
-            process_pool.terminate()  # to avoid memory overflow when processing the plots
+            save_data(path=path, data_dict=data_dict)  # saving/updating data
+            del data_dict
+            del data
 
-            data = temp_data_load()
-            if data and hypothesis_test:
-                end_sim = compare_dist(data, data + data_, hypothesis_test_var)
+            # updating the parameters to be write on the exec_stats file
+            global_parameters = update_sim_param(parameter=global_parameters, n_cells=n_cells, n_samples=n_samples, initial_time=initial_time)
 
-            data = data + data_
-            temp_data_save(batch_file={'data': data, 'index': i})  # this will store temporary files on disk and avoid memory consumption
+            write_conf(folder=folder, parameters=global_parameters)
 
-            del data
-            del data_
-            if iter >= max_iter:
-                print('Achieved the max number of iterations')
-                break
-
-        data = temp_data_load()
-        data_dummy = load_data(name_file=name_file)
-        if data_dummy:
-            data_dict = data_dummy
-            del data_dummy
-
-        data_dict = macel_data_dict(data_dict_=data_dict, data_=data, n_cells=n_cells,
-                                    n_samples=n_samples, n_centers=n_centers,
-                                    dist_typ=global_parameters['macel_param']['ue_dist_typ'])
-
-        temp_data_delete(type='batch')  # deleting the temporary files because the output dictionary was already created
-
-        save_data(path=path, data_dict=data_dict)  # saving/updating data
-        del data_dict
-        del data
-
-        # updating the parameters to be write on the exec_stats file
-        global_parameters = update_sim_param(parameter=global_parameters, n_cells=n_cells, n_samples=n_samples, initial_time=initial_time)
-
-        write_conf(folder=folder, parameters=global_parameters)
-
-        # plots
-        if global_parameters['exec_param']['plot_curves']:
-            print('saving curves ....')
-            plot_curves(name_file=name_file, max_iter=max_iter,
-                        # iter_list=global_parameters['exec_param']['executed_n_bs'],
-                        global_parameters=global_parameters, list_typ=iter_type)
-            print('saving curves .... [done]')
-
-        if global_parameters['exec_param']['plot_hist']:
-            print('saving histograms ....')
-            plot_histograms(name_file=name_file, max_iter=max_iter,
+            # plots
+            if global_parameters['exec_param']['plot_curves']:
+                print('saving curves ....')
+                plot_curves(name_file=name_file, max_iter=max_iter,
                             # iter_list=global_parameters['exec_param']['executed_n_bs'],
                             global_parameters=global_parameters, list_typ=iter_type)
-            print('saving histograms .... [done]')
-
-        if global_parameters['exec_param']['plot_surf']:
-            print('saving surface plots ....')
-            plot_surfaces(name_file=name_file, global_parameters=global_parameters, list_typ=iter_type)
-            print('saving surface plots .... [done]')
+                print('saving curves .... [done]')
+
+            if global_parameters['exec_param']['plot_hist']:
+                print('saving histograms ....')
+                plot_histograms(name_file=name_file, max_iter=max_iter,
+                                # iter_list=global_parameters['exec_param']['executed_n_bs'],
+                                global_parameters=global_parameters, list_typ=iter_type)
+                print('saving histograms .... [done]')
+
+            if global_parameters['exec_param']['plot_surf']:
+                print('saving surface plots ....')
+                plot_surfaces(name_file=name_file, global_parameters=global_parameters, list_typ=iter_type)
+                print('saving surface plots .... [done]')
+    finally:
+        process_pool.close()
+        process_pool.join()
@@ -20,8 +20,17 @@ def elevation_angle(centroid, x, htx, hrx, cell_size, dist_matrix):
 
     return theta
 
-def shannon_cap():
-    return
+def shannon_cap(bw, tx_power, channel_state):
+    # this function will return the capacity (Shannon) achieved with a bw
+    # same units of shannon_bw: bw in hearts, tx_power in dBW, channel_state in dB
+    k = 1.380649E-23  # Boltzmann's constant (J/K)
+    t = 290  # absolute temperature
+    pw_noise_bw = k * t * bw  # noise power
+    tx_pw = 10 ** (tx_power / 10)  # converting from dBW to watt
+    snr = (tx_pw * 10 ** (channel_state/10)) / pw_noise_bw  # signal to noise ratio (linear, not dB)
+    cap = bw * np.log2(1 + snr)
+
+    return cap
 
 def shannon_bw(bw, tx_power, channel_state, c_target):
     # this function will return the needed bw for a target capacity